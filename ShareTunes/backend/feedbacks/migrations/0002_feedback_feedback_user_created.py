@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedbacks', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='feedback_user_created'),
+        ),
+    ]
@@ -22,6 +22,10 @@ class Feedback(models.Model):
         verbose_name_plural = 'フィードバック'
         # 1ユーザーが1トラックに対して1つのフィードバックのみ
         unique_together = ('user', 'track')
+        indexes = [
+            # ユーザーごとの新しい順の一覧（キーセットページネーション）用
+            models.Index(fields=['user', '-created_at', '-id'], name='feedback_user_created'),
+        ]
         
     def __str__(self):
         return f"{self.user.username} - {self.track.name} ({self.get_feedback_type_display()})"
\ No newline at end of file
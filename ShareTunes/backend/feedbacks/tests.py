@@ -0,0 +1,42 @@
+from django.contrib.auth.models import User
+from rest_framework.test import APITestCase
+
+from recommendations.models import Recommendation, RecommendedTrack
+from sharetunes.queries import record_queries
+from sharetunes.testing import assert_max_queries
+from .models import Feedback
+
+
+class FeedbackListQueryBudgetTests(APITestCase):
+    """フィードバック一覧のクエリ数が、件数によらず一定であること（推薦楽曲をフィードバックごとに読まない）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='feedback-owner')
+        recommendation = Recommendation.objects.create(user=cls.user, context_description='夜のドライブ')
+        cls.tracks = RecommendedTrack.objects.bulk_create([
+            RecommendedTrack(recommendation=recommendation, spotify_id=f'spotify{position}',
+                             name=f'推薦曲{position}', artist='アーティスト', explanation='', position=position)
+            for position in range(20)
+        ])
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def create_feedbacks(self, tracks):
+        Feedback.objects.bulk_create([
+            Feedback(user=self.user, track=track, feedback_type='like') for track in tracks
+        ])
+
+    def test_list(self):
+        self.create_feedbacks(self.tracks[:1])
+        with record_queries() as small:
+            self.assertEqual(self.client.get('/api/feedback/').status_code, 200)
+
+        self.create_feedbacks(self.tracks[1:])
+        with assert_max_queries(small.count, max_repeats=1):
+            response = self.client.get('/api/feedback/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(response.data['results'][0]['track_details']['artist'], 'アーティスト')
+        self.assertEqual(small.count, 1)
@@ -3,6 +3,7 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 
+from sharetunes.pagination import CreatedAtKeysetPagination
 from .models import Feedback
 from .serializers import FeedbackSerializer
 
@@ -14,10 +15,12 @@ class FeedbackViewSet(mixins.CreateModelMixin,
     """フィードバック管理用ビューセット"""
     serializer_class = FeedbackSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = CreatedAtKeysetPagination
     
     def get_queryset(self):
         """ユーザー自身のフィードバックのみアクセス可能"""
-        return Feedback.objects.filter(user=self.request.user)
+        # track_details（推薦楽曲）をフィードバックごとに取得しないよう結合して読み込む
+        return Feedback.objects.filter(user=self.request.user).select_related('track')
         
     def perform_create(self, serializer):
         """フィードバック作成時にユーザーを自動設定"""
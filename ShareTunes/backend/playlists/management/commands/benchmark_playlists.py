@@ -0,0 +1,153 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from playlists.models import Playlist, PlaylistTrack
+from playlists.services import RANK_GAP
+from playlists.views import PlaylistViewSet
+from sharetunes.benchmarking import benchmark_database, measure, summarize
+from tracks.models import Track
+
+
+class Command(BaseCommand):
+    help = 'プレイリスト一覧・公開フィード・詳細APIと編集操作のクエリ数と所要時間を計測する（テストDBを使用）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--playlists', type=int, default=1000,
+                            help='プレイリスト数（デフォルト: 1,000）')
+        parser.add_argument('--tracks', type=int, default=200,
+                            help='プレイリストあたりの楽曲数（デフォルト: 200）')
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            small_user = self.populate('small', 10, 5)
+            large_user = self.populate('large', options['playlists'], options['tracks'])
+
+            factory = APIRequestFactory()
+            list_view = PlaylistViewSet.as_view({'get': 'list'})
+            public_view = PlaylistViewSet.as_view({'get': 'public'})
+            detail_view = PlaylistViewSet.as_view({'get': 'retrieve'})
+
+            for label, user in (('小規模', small_user), ('大規模', large_user)):
+                playlist = Playlist.objects.filter(user=user).first()
+                cases = (
+                    ('一覧', list_view, '/api/playlists/', {}, False),
+                    ('公開フィード（キャッシュなし）', public_view, '/api/playlists/public/', {}, True),
+                    ('公開フィード（キャッシュあり）', public_view, '/api/playlists/public/', {}, False),
+                    ('詳細', detail_view, f'/api/playlists/{playlist.pk}/', {'pk': playlist.pk}, False),
+                )
+                for case, view, path, kwargs, cold in cases:
+                    def fetch():
+                        if cold:
+                            cache.clear()
+                        request = factory.get(path, HTTP_HOST='localhost')
+                        force_authenticate(request, user=user)
+                        response = view(request, **kwargs)
+                        response.render()
+                        return response
+
+                    with CaptureQueriesContext(connection) as queries:
+                        response = fetch()
+                    if 'results' in response.data:
+                        items = len(response.data['results'])
+                    else:
+                        items = len(response.data['playlist_tracks'])
+                    timings = measure(fetch, repeat=options['repeat'], warmup=1)
+                    self.stdout.write(
+                        f'{label} {case}（{items}件）: クエリ {len(queries.captured_queries)}回, {summarize(timings)}'
+                    )
+
+            self.benchmark_edits(factory, large_user, options['repeat'])
+
+    def benchmark_edits(self, factory, user, repeat):
+        """先頭・中央への楽曲の追加と削除を計測する"""
+        playlist = Playlist.objects.filter(user=user).first()
+        length = playlist.playlisttrack_set.count()
+        add_view = PlaylistViewSet.as_view({'post': 'add_track'})
+        remove_view = PlaylistViewSet.as_view({'delete': 'remove_track'})
+        tracks = iter(Track.objects.bulk_create(
+            [Track(spotify_id=f'edit{i}', name=f'Edit {i}', artist='Artist') for i in range(repeat * 4 + 2)]
+        ))
+
+        def request(view, method, track, position=None):
+            data = {'track': track.pk}
+            if position is not None:
+                data['position'] = position
+            request = getattr(factory, method)(
+                f'/api/playlists/{playlist.pk}/', data, format='json', HTTP_HOST='localhost'
+            )
+            force_authenticate(request, user=user)
+            response = view(request, pk=playlist.pk)
+            assert response.status_code in (201, 204), response.data
+            return response
+
+        for case, position in (('先頭に追加', 0), ('中央に追加', length // 2)):
+            with CaptureQueriesContext(connection) as queries:
+                request(add_view, 'post', next(tracks), position)
+            timings = measure(lambda: request(add_view, 'post', next(tracks), position), repeat=repeat, warmup=1)
+            self.stdout.write(
+                f'{case}（{length}曲）: クエリ {len(queries.captured_queries)}回, {summarize(timings)}'
+            )
+
+        added = list(Track.objects.filter(spotify_id__startswith='edit', playlisttrack__playlist=playlist))
+        with CaptureQueriesContext(connection) as queries:
+            request(remove_view, 'delete', added.pop())
+        timings = measure(lambda: request(remove_view, 'delete', added.pop()), repeat=repeat)
+        self.stdout.write(f'削除（{length}曲）: クエリ {len(queries.captured_queries)}回, {summarize(timings)}')
+
+        reorder_view = PlaylistViewSet.as_view({'put': 'reorder_tracks'})
+        track_ids = list(playlist.playlisttrack_set.order_by('rank').values_list('track_id', flat=True))
+
+        def reorder(new_order):
+            request = factory.put(
+                f'/api/playlists/{playlist.pk}/', {'tracks': new_order}, format='json', HTTP_HOST='localhost'
+            )
+            force_authenticate(request, user=user)
+            response = reorder_view(request, pk=playlist.pk)
+            assert response.status_code == 200, response.data
+            return response
+
+        def drag_and_drop():
+            # ドラッグ&ドロップで1曲を先頭から末尾付近へ移動する
+            track_ids.insert(len(track_ids) - 1, track_ids.pop(0))
+            return reorder(list(track_ids))
+
+        def shuffle():
+            random.shuffle(track_ids)
+            return reorder(list(track_ids))
+
+        for case, func in (('並べ替え（1曲移動）', drag_and_drop), ('並べ替え（シャッフル）', shuffle)):
+            with CaptureQueriesContext(connection) as queries:
+                func()
+            timings = measure(func, repeat=repeat)
+            self.stdout.write(
+                f'{case}（{len(track_ids)}曲）: クエリ {len(queries.captured_queries)}回, {summarize(timings)}'
+            )
+
+    def populate(self, name, playlist_count, tracks_per_playlist):
+        self.stdout.write(f'{name}: {playlist_count}件 × {tracks_per_playlist}曲のプレイリストを生成しています...')
+        start = time.time()
+        user = User.objects.create(username=f'benchmark-{name}')
+        tracks = Track.objects.bulk_create(
+            [Track(spotify_id=f'{name}{i}', name=f'Track {i}', artist='Artist') for i in range(tracks_per_playlist * 5)]
+        )
+        playlists = Playlist.objects.bulk_create(
+            [Playlist(user=user, name=f'Playlist {i}', is_public=i % 2 == 0) for i in range(playlist_count)]
+        )
+        PlaylistTrack.objects.bulk_create(
+            (
+                PlaylistTrack(playlist=playlist, track=tracks[(i + j) % len(tracks)], rank=(j + 1) * RANK_GAP)
+                for i, playlist in enumerate(playlists)
+                for j in range(tracks_per_playlist)
+            ),
+            batch_size=5000,
+        )
+        self.stdout.write(f'生成完了（所要時間: {time.time() - start:.1f}秒）')
+        return user
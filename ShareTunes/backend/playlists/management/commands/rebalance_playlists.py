@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from playlists.models import Playlist
+from playlists.services import RANK_GAP, find_crowded_playlist_ids, rebalance_playlist
+
+
+class Command(BaseCommand):
+    help = '楽曲のrankの間隔が詰まったプレイリストのrankを等間隔に振り直す'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-gap', type=int, default=RANK_GAP >> 10,
+                            help=f'隣り合うrankの間隔がこの値未満のプレイリストを対象とする（デフォルト: {RANK_GAP >> 10}）')
+        parser.add_argument('--all', action='store_true',
+                            help='間隔によらず全プレイリストを振り直す')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            playlist_ids = list(Playlist.objects.order_by('id').values_list('id', flat=True))
+        else:
+            playlist_ids = find_crowded_playlist_ids(min_gap=options['min_gap'])
+        if not playlist_ids:
+            self.stdout.write('振り直しが必要なプレイリストはありません')
+            return
+
+        self.stdout.write(f'{len(playlist_ids)}件のプレイリストのrankを振り直します')
+        start_time = time.time()
+        rebalanced = 0
+        for playlist in Playlist.objects.filter(id__in=playlist_ids).iterator():
+            rebalanced += rebalance_playlist(playlist)
+        elapsed = time.time() - start_time
+
+        self.stdout.write(self.style.SUCCESS(
+            f'完了: {len(playlist_ids)}件のプレイリスト, {rebalanced}曲（所要時間: {elapsed:.2f}秒）'
+        ))
@@ -0,0 +1,62 @@
+from django.db import migrations, models
+
+# playlists.services.RANK_GAP と同じ値（マイグレーションではアプリのコードに依存しない）
+RANK_GAP = 1 << 16
+
+
+def populate_rank(apps, schema_editor):
+    """既存の position の順に、間隔を空けたrankを振る"""
+    PlaylistTrack = apps.get_model('playlists', 'PlaylistTrack')
+    playlist_ids = PlaylistTrack.objects.values_list('playlist_id', flat=True).distinct()
+    for playlist_id in playlist_ids:
+        playlist_tracks = list(PlaylistTrack.objects.filter(playlist_id=playlist_id).order_by('position', 'id'))
+        for index, playlist_track in enumerate(playlist_tracks):
+            playlist_track.rank = (index + 1) * RANK_GAP
+        PlaylistTrack.objects.bulk_update(playlist_tracks, ['rank'], batch_size=1000)
+
+
+def populate_position(apps, schema_editor):
+    PlaylistTrack = apps.get_model('playlists', 'PlaylistTrack')
+    playlist_ids = PlaylistTrack.objects.values_list('playlist_id', flat=True).distinct()
+    for playlist_id in playlist_ids:
+        playlist_tracks = list(PlaylistTrack.objects.filter(playlist_id=playlist_id).order_by('rank'))
+        for index, playlist_track in enumerate(playlist_tracks):
+            playlist_track.position = index
+        PlaylistTrack.objects.bulk_update(playlist_tracks, ['position'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('playlists', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='playlisttrack',
+            options={'ordering': ['rank'], 'verbose_name': 'プレイリスト楽曲', 'verbose_name_plural': 'プレイリスト楽曲'},
+        ),
+        migrations.AlterUniqueTogether(
+            name='playlisttrack',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='playlisttrack',
+            name='rank',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.RunPython(populate_rank, populate_position),
+        migrations.RemoveField(
+            model_name='playlisttrack',
+            name='position',
+        ),
+        migrations.AlterField(
+            model_name='playlisttrack',
+            name='rank',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AlterUniqueTogether(
+            name='playlisttrack',
+            unique_together={('playlist', 'rank')},
+        ),
+    ]
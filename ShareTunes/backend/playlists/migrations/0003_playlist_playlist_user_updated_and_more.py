@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('playlists', '0002_alter_playlisttrack_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='playlist',
+            index=models.Index(fields=['user', '-updated_at', '-id'], name='playlist_user_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='playlist',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['-updated_at', '-id'], name='playlist_public_updated'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('playlists', '0003_playlist_playlist_user_updated_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='playlisttrack',
+            index=models.Index(fields=['playlist', 'track'], name='playlisttrack_playlist_track'),
+        ),
+    ]
@@ -16,23 +16,42 @@ class Playlist(models.Model):
         verbose_name = 'プレイリスト'
         verbose_name_plural = 'プレイリスト'
         ordering = ['-updated_at']
+        indexes = [
+            # ユーザー自身のプレイリスト一覧（キーセットページネーション）用
+            models.Index(fields=['user', '-updated_at', '-id'], name='playlist_user_updated'),
+            # 公開プレイリストのフィード用（公開中の行だけを含む部分インデックス）
+            models.Index(
+                fields=['-updated_at', '-id'],
+                condition=models.Q(is_public=True),
+                name='playlist_public_updated',
+            ),
+        ]
         
     def __str__(self):
         return f"{self.name} - {self.user.username}"
 
 class PlaylistTrack(models.Model):
-    """プレイリストと楽曲の中間テーブル（順序管理用）"""
+    """
+    プレイリストと楽曲の中間テーブル（順序管理用）
+
+    順序は間隔を空けた整数のrankで管理し、挿入時は前後のrankの中間値を使うことで
+    他の行を書き換えずに済むようにする。APIで返す0始まりの位置（position）は読み出し時に計算する。
+    """
     playlist = models.ForeignKey(Playlist, on_delete=models.CASCADE)
     track = models.ForeignKey(Track, on_delete=models.CASCADE)
-    position = models.PositiveIntegerField(default=0)
+    rank = models.BigIntegerField()
     added_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         verbose_name = 'プレイリスト楽曲'
         verbose_name_plural = 'プレイリスト楽曲'
-        ordering = ['position']
-        # 同じプレイリスト内で同じポジションは許可しない
-        unique_together = ('playlist', 'position')
+        ordering = ['rank']
+        # 同じプレイリスト内で同じrankは許可しない
+        unique_together = ('playlist', 'rank')
+        indexes = [
+            # 楽曲の追加時に、プレイリストに含まれている楽曲かを確認するため
+            models.Index(fields=['playlist', 'track'], name='playlisttrack_playlist_track'),
+        ]
         
     def __str__(self):
-        return f"{self.playlist.name} - {self.track.name} (位置: {self.position})"
\ No newline at end of file
+        return f"{self.playlist.name} - {self.track.name} (rank: {self.rank})"
\ No newline at end of file
@@ -1,14 +1,23 @@
 from rest_framework import serializers
 from .models import Playlist, PlaylistTrack
+from .services import get_position
 from tracks.serializers import TrackSerializer
 
 class PlaylistTrackSerializer(serializers.ModelSerializer):
     track_details = TrackSerializer(source='track', read_only=True)
+    position = serializers.SerializerMethodField()
     
     class Meta:
         model = PlaylistTrack
         fields = ('id', 'track', 'track_details', 'position', 'added_at')
         read_only_fields = ('added_at',)
+    
+    def get_position(self, obj):
+        # 一覧で並び順から計算済みの場合はそれを使う
+        position = getattr(obj, 'position', None)
+        if position is not None:
+            return position
+        return get_position(obj)
 
 class PlaylistSerializer(serializers.ModelSerializer):
     track_count = serializers.SerializerMethodField()
@@ -20,7 +29,24 @@ class PlaylistSerializer(serializers.ModelSerializer):
         read_only_fields = ('created_at', 'updated_at')
     
     def get_track_count(self, obj):
-        return obj.tracks.count()
+        # 一覧ではクエリセットのannotate結果を使い、プレイリストごとのCOUNTを発行しない
+        track_count = getattr(obj, 'track_count', None)
+        if track_count is not None:
+            return track_count
+        return obj.playlisttrack_set.count()
+
+class PublicPlaylistSerializer(PlaylistSerializer):
+    """公開プレイリストのフィード用（作成者を含む）"""
+    owner = serializers.SerializerMethodField()
+    
+    class Meta(PlaylistSerializer.Meta):
+        fields = PlaylistSerializer.Meta.fields + ('owner',)
+    
+    def get_owner(self, obj):
+        return {
+            'id': obj.user.id,
+            'username': obj.user.username,
+        }
 
 class PlaylistDetailSerializer(serializers.ModelSerializer):
     playlist_tracks = serializers.SerializerMethodField()
@@ -33,7 +59,16 @@ class PlaylistDetailSerializer(serializers.ModelSerializer):
         read_only_fields = ('created_at', 'updated_at')
         
     def get_playlist_tracks(self, obj):
-        playlist_tracks = PlaylistTrack.objects.filter(playlist=obj).order_by('position')
+        # prefetch済みの場合はそれを使い、楽曲ごとのクエリを発行しない
+        playlist_tracks = getattr(obj, 'ordered_playlist_tracks', None)
+        if playlist_tracks is None:
+            playlist_tracks = (PlaylistTrack.objects
+                               .filter(playlist=obj)
+                               .select_related('track')
+                               .order_by('rank'))
+        # rankは間隔が空いているため、APIでは並び順から0始まりの位置を計算して返す
+        for position, playlist_track in enumerate(playlist_tracks):
+            playlist_track.position = position
         return PlaylistTrackSerializer(playlist_tracks, many=True).data
         
     def get_owner(self, obj):
@@ -0,0 +1,331 @@
+import bisect
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, Window
+from django.db.models.functions import Lag
+from django.utils import timezone
+
+from .models import Playlist, PlaylistTrack
+
+# 隣り合う楽曲のrankの間隔。中間への挿入を繰り返しても、16回程度は振り直しなしで挿入できる
+RANK_GAP = 1 << 16
+
+# rankを振り直すときに1回のexecutemanyで更新する行数
+REBALANCE_BATCH_SIZE = 1000
+
+# 公開プレイリストのフィードのキャッシュキー。バージョンを上げると過去のページはすべて参照されなくなる
+PUBLIC_FEED_VERSION_KEY = 'playlists:public_feed:version'
+PUBLIC_FEED_PAGE_KEY = 'playlists:public_feed:{version}:{digest}'
+
+
+def get_public_feed_version():
+    """公開プレイリストのフィードのキャッシュのバージョン"""
+    return cache.get_or_set(PUBLIC_FEED_VERSION_KEY, 1, timeout=None)
+
+
+def public_feed_cache_key(full_path):
+    """フィードのページ（クエリ文字列を含むパス）ごとのキャッシュキー"""
+    digest = hashlib.md5(full_path.encode('utf-8')).hexdigest()
+    return PUBLIC_FEED_PAGE_KEY.format(version=get_public_feed_version(), digest=digest)
+
+
+def invalidate_public_feed():
+    """公開プレイリストのフィードのキャッシュを破棄する"""
+    try:
+        cache.incr(PUBLIC_FEED_VERSION_KEY)
+    except ValueError:
+        # キーが失効している場合は作り直す（古いバージョンのページと重ならない値にする）
+        cache.set(PUBLIC_FEED_VERSION_KEY, int(time.time()), timeout=None)
+
+
+def touch_playlist(playlist):
+    """
+    楽曲の追加・削除・並べ替えをプレイリストの更新日時に反映する
+
+    公開プレイリストの場合はフィードのキャッシュも破棄する。
+    """
+    playlist.updated_at = timezone.now()
+    Playlist.objects.filter(pk=playlist.pk).update(updated_at=playlist.updated_at)
+    if playlist.is_public:
+        transaction.on_commit(invalidate_public_feed)
+
+
+def _write_ranks(playlist, rank_updates, all_tracks=False):
+    """
+    楽曲のrankをまとめて書き換える
+
+    unique制約に触れないよう、対象の行のrankをいったん負の値へ退避してから新しいrankを書き込む。
+    bulk_update はCASE式が行数に比例して長くなり大きなプレイリストで遅いため、
+    同じUPDATE文を使い回すexecutemanyで書き込む。
+
+    Args:
+        playlist (Playlist): 対象のプレイリスト
+        rank_updates (list): (新しいrank, PlaylistTrack.id) のタプルのリスト
+        all_tracks (bool): プレイリストの全楽曲を書き換える場合はTrue（退避を1文で行う）
+    """
+    if not rank_updates:
+        return
+    quote_name = connection.ops.quote_name
+    sql = (
+        f"UPDATE {quote_name(PlaylistTrack._meta.db_table)} "
+        f"SET {quote_name('rank')} = %s WHERE {quote_name('id')} = %s"
+    )
+    playlist_tracks = PlaylistTrack.objects.filter(playlist=playlist, rank__gt=0)
+    with transaction.atomic():
+        # 既存のrankは常に正の値なので、符号を反転すれば新しいrankと重複しない
+        if all_tracks:
+            playlist_tracks.update(rank=-F('rank'))
+        else:
+            for offset in range(0, len(rank_updates), REBALANCE_BATCH_SIZE):
+                batch = rank_updates[offset:offset + REBALANCE_BATCH_SIZE]
+                playlist_tracks.filter(id__in=[playlist_track_id for _, playlist_track_id in batch]).update(
+                    rank=-F('rank')
+                )
+        with connection.cursor() as cursor:
+            for offset in range(0, len(rank_updates), REBALANCE_BATCH_SIZE):
+                cursor.executemany(sql, rank_updates[offset:offset + REBALANCE_BATCH_SIZE])
+
+
+def rebalance_playlist(playlist, ordered_ids=None):
+    """
+    プレイリスト内の楽曲のrankを等間隔に振り直す
+
+    Args:
+        playlist (Playlist): 対象のプレイリスト
+        ordered_ids (list, optional): 振り直し後の並び順（PlaylistTrack.id）。省略時は現在の順序
+
+    Returns:
+        int: 振り直した件数
+    """
+    with transaction.atomic():
+        # 現在の順序の読み出しと書き込みの間に、楽曲の追加・並べ替えが割り込まないようにする
+        Playlist.objects.select_for_update().get(pk=playlist.pk)
+        if ordered_ids is None:
+            ordered_ids = list(
+                PlaylistTrack.objects.filter(playlist=playlist).order_by('rank').values_list('id', flat=True)
+            )
+        _write_ranks(playlist, [
+            ((index + 1) * RANK_GAP, playlist_track_id)
+            for index, playlist_track_id in enumerate(ordered_ids)
+        ], all_tracks=True)
+    return len(ordered_ids)
+
+
+def longest_increasing_subsequence(values):
+    """
+    最長増加部分列を求める（O(n log n)）
+
+    Args:
+        values (list): 互いに異なる比較可能な値のリスト
+
+    Returns:
+        set: 最長増加部分列に含まれる要素のインデックス
+    """
+    tail_values = []
+    tail_indices = []
+    previous = [None] * len(values)
+    for index, value in enumerate(values):
+        length = bisect.bisect_left(tail_values, value)
+        if length > 0:
+            previous[index] = tail_indices[length - 1]
+        if length == len(tail_values):
+            tail_values.append(value)
+            tail_indices.append(index)
+        else:
+            tail_values[length] = value
+            tail_indices[length] = index
+
+    indices = set()
+    index = tail_indices[-1] if tail_indices else None
+    while index is not None:
+        indices.add(index)
+        index = previous[index]
+    return indices
+
+
+def plan_reorder(ordered_ranks):
+    """
+    新しい並び順にするために動かす楽曲と、その新しいrankを決める
+
+    新しい並び順で現在のrankが増加している最長の部分列はそのまま残し、
+    それ以外の楽曲だけを前後に残る楽曲のrankの間へ等間隔に置き直す。
+
+    Args:
+        ordered_ranks (list): 新しい並び順に並べた各楽曲の現在のrank
+
+    Returns:
+        dict: 新しい並び順でのインデックスをキー、新しいrankを値とする辞書。
+            間隔が足りず置き直せない場合はNone
+    """
+    kept = longest_increasing_subsequence(ordered_ranks)
+    new_ranks = {}
+    run = []
+    # 末尾の番兵として None を流し、残る楽曲に挟まれた「動かす楽曲の連続」ごとにrankを割り当てる
+    for index in list(range(len(ordered_ranks))) + [None]:
+        if index is not None and index not in kept:
+            run.append(index)
+            continue
+        if run:
+            before = ordered_ranks[run[0] - 1] if run[0] > 0 else 0
+            if index is None:
+                after = before + (len(run) + 1) * RANK_GAP
+            else:
+                after = ordered_ranks[index]
+            step = (after - before) // (len(run) + 1)
+            if step < 1:
+                return None
+            for offset, moved_index in enumerate(run, start=1):
+                new_ranks[moved_index] = before + step * offset
+            run = []
+    return new_ranks
+
+
+def reorder_playlist(playlist, ordered_ids, current_ranks):
+    """
+    プレイリストを指定した並び順にする（動かす楽曲の行だけを書き換える）
+
+    Args:
+        playlist (Playlist): 対象のプレイリスト
+        ordered_ids (list): 新しい並び順（PlaylistTrack.id）。プレイリストの全楽曲を含むこと
+        current_ranks (dict): PlaylistTrack.id をキー、現在のrankを値とする辞書
+
+    Returns:
+        int: rankを書き換えた楽曲数
+    """
+    new_ranks = plan_reorder([current_ranks[playlist_track_id] for playlist_track_id in ordered_ids])
+    with transaction.atomic():
+        if new_ranks is None:
+            moved = rebalance_playlist(playlist, ordered_ids)
+        else:
+            _write_ranks(playlist, [
+                (rank, ordered_ids[index]) for index, rank in sorted(new_ranks.items())
+            ])
+            moved = len(new_ranks)
+        touch_playlist(playlist)
+    return moved
+
+
+def _neighbour_ranks(playlist, position):
+    """0始まりの位置 position に挿入するときの前後の楽曲のrank（存在しない場合はNone）"""
+    ranks = PlaylistTrack.objects.filter(playlist=playlist).order_by('rank').values_list('rank', flat=True)
+    if position is None:
+        return ranks.last(), None
+    if position == 0:
+        return None, ranks.first()
+    neighbours = list(ranks[position - 1:position + 1])
+    if not neighbours:
+        # 末尾より後ろが指定された場合は末尾に追加
+        return ranks.last(), None
+    if len(neighbours) == 1:
+        return neighbours[0], None
+    return neighbours[0], neighbours[1]
+
+
+def _ranks_between(before, after, count=1):
+    """前後のrankの間に等間隔で入る count 個のrank（間隔が足りない場合はNone）"""
+    if after is None:
+        before = before or 0
+        return [before + RANK_GAP * index for index in range(1, count + 1)]
+    # rankは正の値に保つ（振り直し時の退避に負の値を使うため）
+    before = before or 0
+    step = (after - before) // (count + 1)
+    if step < 1:
+        return None
+    return [before + step * index for index in range(1, count + 1)]
+
+
+def ranks_for_position(playlist, position=None, count=1):
+    """
+    指定した位置に続けて挿入する count 曲分のrankを決める
+
+    前後のrankの間隔が尽きている場合のみプレイリスト全体のrankを振り直す。
+    呼び出し側でトランザクションを張ること。
+
+    Args:
+        playlist (Playlist): 対象のプレイリスト
+        position (int, optional): 0始まりの挿入位置。省略時は末尾
+        count (int): 挿入する楽曲数
+
+    Returns:
+        list: 新しい楽曲のrank（昇順）
+    """
+    ranks = _ranks_between(*_neighbour_ranks(playlist, position), count=count)
+    if ranks is None:
+        rebalance_playlist(playlist)
+        ranks = _ranks_between(*_neighbour_ranks(playlist, position), count=count)
+    return ranks
+
+
+def rank_for_position(playlist, position=None):
+    """指定した位置に挿入する楽曲のrankを決める（ranks_for_position の1曲版）"""
+    return ranks_for_position(playlist, position)[0]
+
+
+def add_tracks_to_playlist(playlist, tracks, position=None):
+    """
+    複数の楽曲をまとめてプレイリストへ追加
+
+    既に含まれている楽曲と、同じリクエスト内で重複する楽曲は追加しない。
+    重複の確認は1回のクエリで行い、追加する行は bulk_create で1文で書き込む。
+
+    Args:
+        playlist (Playlist): 対象のプレイリスト
+        tracks (list): 追加するTrackのリスト（この順に並べる）
+        position (int, optional): 0始まりの挿入位置。省略時は末尾
+
+    Returns:
+        tuple: (追加したPlaylistTrackのリスト, 重複のため追加しなかったTrackのリスト)
+    """
+    with transaction.atomic():
+        # 同時に追加されたときにrankが衝突しないよう、プレイリストの行をロックする
+        Playlist.objects.select_for_update().get(pk=playlist.pk)
+        existing = set(
+            PlaylistTrack.objects
+            .filter(playlist=playlist, track_id__in=[track.pk for track in tracks])
+            .values_list('track_id', flat=True)
+        )
+        new_tracks = []
+        skipped = []
+        for track in tracks:
+            if track.pk in existing:
+                skipped.append(track)
+                continue
+            existing.add(track.pk)
+            new_tracks.append(track)
+
+        if not new_tracks:
+            return [], skipped
+
+        ranks = ranks_for_position(playlist, position, count=len(new_tracks))
+        playlist_tracks = PlaylistTrack.objects.bulk_create([
+            PlaylistTrack(playlist=playlist, track=track, rank=rank)
+            for track, rank in zip(new_tracks, ranks)
+        ])
+        touch_playlist(playlist)
+    return playlist_tracks, skipped
+
+
+def get_position(playlist_track):
+    """楽曲のプレイリスト内での0始まりの位置"""
+    return PlaylistTrack.objects.filter(
+        playlist_id=playlist_track.playlist_id,
+        rank__lt=playlist_track.rank
+    ).count()
+
+
+def find_crowded_playlist_ids(min_gap=2):
+    """
+    rankの間隔が min_gap 未満まで詰まっている箇所を含むプレイリストのIDを取得
+
+    バックグラウンドでの振り直し対象を選ぶために使う。
+    """
+    previous_rank = Window(Lag('rank'), partition_by=[F('playlist_id')], order_by=F('rank').asc())
+    return sorted(set(
+        PlaylistTrack.objects
+        .annotate(gap=F('rank') - previous_rank)
+        .filter(gap__lt=min_gap)
+        .values_list('playlist_id', flat=True)
+    ))
@@ -0,0 +1,148 @@
+from django.contrib.auth.models import User
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from sharetunes.queries import record_queries
+from sharetunes.testing import assert_max_queries
+from tracks.models import Track
+from .models import Playlist, PlaylistTrack
+from .services import RANK_GAP
+
+
+class PlaylistQueryBudgetTests(APITestCase):
+    """
+    プレイリストAPIのクエリ数の上限
+
+    楽曲数・プレイリスト数の異なるデータで同じ操作を行い、クエリ数が行数によらず一定であること
+    （行ごとのクエリが再び入り込んでいないこと）と、上限以下であることを確認する。
+    """
+
+    SMALL = 3
+    LARGE = 40
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='playlist-owner')
+        cls.tracks = Track.objects.bulk_create([
+            Track(spotify_id=f'track{index:03d}', name=f'楽曲{index}', artist=f'アーティスト{index % 7}')
+            for index in range(cls.LARGE + 10)
+        ])
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def create_playlist(self, track_count, name='プレイリスト'):
+        playlist = Playlist.objects.create(user=self.user, name=name)
+        PlaylistTrack.objects.bulk_create([
+            PlaylistTrack(playlist=playlist, track=track, rank=(index + 1) * RANK_GAP)
+            for index, track in enumerate(self.tracks[:track_count])
+        ])
+        return playlist
+
+    def track_ids(self, playlist):
+        return list(PlaylistTrack.objects.filter(playlist=playlist).order_by('rank').values_list('track_id', flat=True))
+
+    def assertConstantQueries(self, limit, request, small, large, status_code=200):
+        """small と large に同じリクエストを送り、クエリ数が同じで limit 以下であることを確認する"""
+        counts = []
+        for target in (small, large):
+            with assert_max_queries(limit, max_repeats=1) as recorder:
+                response = request(target)
+            self.assertEqual(response.status_code, status_code, getattr(response, 'data', None))
+            counts.append(recorder.count)
+        self.assertEqual(counts[0], counts[1], f'行数によってクエリ数が変わりました: {counts}')
+        return counts[0]
+
+    def test_list(self):
+        self.create_playlist(self.SMALL, name='最初のプレイリスト')
+
+        def request(_):
+            return self.client.get('/api/playlists/')
+
+        with record_queries() as small:
+            self.assertEqual(request(None).status_code, 200)
+        for index in range(20):
+            self.create_playlist(self.SMALL, name=f'プレイリスト{index}')
+        with assert_max_queries(small.count, max_repeats=1):
+            response = request(None)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(response.data['results'][0]['track_count'], self.SMALL)
+        self.assertEqual(small.count, 1)
+
+    @override_settings(RESPONSE_CACHE_ENABLED=False)
+    def test_public_feed(self):
+        owners = [User.objects.create(username=f'public-owner{index}') for index in range(10)]
+
+        def request(_):
+            return self.client.get('/api/playlists/public/')
+
+        Playlist.objects.create(user=owners[0], name='公開プレイリスト', is_public=True)
+        with record_queries() as small:
+            self.assertEqual(request(None).status_code, 200)
+        Playlist.objects.bulk_create([
+            Playlist(user=owner, name=f'公開プレイリスト{index}', is_public=True)
+            for index, owner in enumerate(owners)
+        ])
+        with assert_max_queries(small.count, max_repeats=1):
+            response = request(None)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 11)
+        self.assertEqual(small.count, 1)
+
+    def test_detail(self):
+        self.assertConstantQueries(
+            3, lambda playlist: self.client.get(f'/api/playlists/{playlist.pk}/'),
+            self.create_playlist(self.SMALL), self.create_playlist(self.LARGE),
+        )
+
+    def test_add_track(self):
+        track = self.tracks[-1]
+        self.assertConstantQueries(
+            10, lambda playlist: self.client.post(f'/api/playlists/{playlist.pk}/add_track/',
+                                                  {'track': track.pk, 'position': 1}, format='json'),
+            self.create_playlist(self.SMALL), self.create_playlist(self.LARGE), status_code=201,
+        )
+
+    def test_add_tracks(self):
+        track_ids = [track.pk for track in self.tracks[-5:]]
+        self.assertConstantQueries(
+            10, lambda playlist: self.client.post(f'/api/playlists/{playlist.pk}/add_tracks/',
+                                                  {'tracks': track_ids, 'position': 1}, format='json'),
+            self.create_playlist(self.SMALL), self.create_playlist(self.LARGE), status_code=201,
+        )
+
+    def test_remove_track(self):
+        track = self.tracks[1]
+        self.assertConstantQueries(
+            6, lambda playlist: self.client.delete(f'/api/playlists/{playlist.pk}/remove_track/',
+                                                   {'track': track.pk}, format='json'),
+            self.create_playlist(self.SMALL), self.create_playlist(self.LARGE), status_code=204,
+        )
+
+    def test_reorder_tracks_moves_one_track(self):
+        small, large = self.create_playlist(self.SMALL), self.create_playlist(self.LARGE)
+        # 先頭の曲を末尾へ移動（書き換えるのは1行のみ）
+        expected = {playlist.pk: self.track_ids(playlist)[1:] + self.track_ids(playlist)[:1]
+                    for playlist in (small, large)}
+        self.assertConstantQueries(
+            13, lambda playlist: self.client.put(f'/api/playlists/{playlist.pk}/reorder_tracks/',
+                                                 {'tracks': expected[playlist.pk]}, format='json'),
+            small, large,
+        )
+        self.assertEqual(self.track_ids(small), expected[small.pk])
+        self.assertEqual(self.track_ids(large), expected[large.pk])
+
+    def test_reorder_tracks_rejects_out_of_range_position(self):
+        playlist = self.create_playlist(self.SMALL)
+        before = self.track_ids(playlist)
+        for position in (-1, self.SMALL, 100):
+            response = self.client.put(f'/api/playlists/{playlist.pk}/reorder_tracks/',
+                                       {'track_orders': [{'track': before[0], 'position': position}]}, format='json')
+            self.assertEqual(response.status_code, 400, position)
+        self.assertEqual(self.track_ids(playlist), before)
+
+        response = self.client.put(f'/api/playlists/{playlist.pk}/reorder_tracks/',
+                                   {'track_orders': [{'track': before[0], 'position': self.SMALL - 1}]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.track_ids(playlist), before[1:] + before[:1])
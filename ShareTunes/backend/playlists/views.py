@@ -1,33 +1,122 @@
+from django.conf import settings
+from django.core.cache import cache
 from django.shortcuts import get_object_or_404
 from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Prefetch, Q, Subquery
+from django.db.models.functions import Coalesce
 from rest_framework import viewsets, status, mixins
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 
+from sharetunes.conditional import conditional_response, make_etag
+from sharetunes.pagination import UpdatedAtKeysetPagination
 from .models import Playlist, PlaylistTrack
 from tracks.models import Track
-from .serializers import PlaylistSerializer, PlaylistDetailSerializer, PlaylistTrackSerializer
+from .serializers import PlaylistSerializer, PlaylistDetailSerializer, PlaylistTrackSerializer, PublicPlaylistSerializer
+from .services import (
+    add_tracks_to_playlist, get_position, invalidate_public_feed, public_feed_cache_key,
+    rank_for_position, reorder_playlist, touch_playlist,
+)
+
+def with_track_count(queryset):
+    """
+    楽曲数を付与
+    
+    GROUP BY での集計はページに含まれない行まで数えてしまうため、
+    取得した行ごとに評価される相関サブクエリで数える。
+    """
+    track_count = (PlaylistTrack.objects
+                   .filter(playlist=OuterRef('pk'))
+                   .order_by()
+                   .values('playlist')
+                   .annotate(count=Count('id'))
+                   .values('count'))
+    return queryset.annotate(track_count=Coalesce(Subquery(track_count), 0))
 
 class PlaylistViewSet(viewsets.ModelViewSet):
     """プレイリスト管理用ビューセット"""
     serializer_class = PlaylistSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = UpdatedAtKeysetPagination
     
     def get_queryset(self):
         """ユーザー自身のプレイリストと公開プレイリストを取得"""
         user = self.request.user
-        return Playlist.objects.filter(user=user) | Playlist.objects.filter(is_public=True)
+        
+        # 一覧は自分のプレイリストのみ（公開プレイリストは public フィードで返す）
+        if self.action == 'list':
+            return with_track_count(Playlist.objects.filter(user=user))
+        if self.action == 'public':
+            return with_track_count(Playlist.objects.filter(is_public=True).select_related('user'))
+        
+        queryset = Playlist.objects.filter(Q(user=user) | Q(is_public=True)).select_related('user')
+        # 楽曲数によらずクエリ数が一定になるよう、楽曲はまとめて取得する
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related(Prefetch(
+                'playlisttrack_set',
+                queryset=PlaylistTrack.objects.select_related('track').order_by('rank'),
+                to_attr='ordered_playlist_tracks',
+            ))
+        return queryset
     
     def get_serializer_class(self):
         """detailビューではPlaylistDetailSerializerを使用"""
         if self.action == 'retrieve':
             return PlaylistDetailSerializer
+        if self.action == 'public':
+            return PublicPlaylistSerializer
         return PlaylistSerializer
     
+    def retrieve(self, request, *args, **kwargs):
+        """プレイリスト詳細（プレイリスト・楽曲の更新日時と楽曲数が変わっていなければ304を返す）"""
+        watermark = (Playlist.objects
+                     .filter(Q(user=request.user) | Q(is_public=True), pk=kwargs.get('pk'))
+                     .annotate(track_count=Count('playlisttrack'),
+                               tracks_updated=Max('playlisttrack__track__updated_at'))
+                     .values_list('updated_at', 'is_public', 'track_count', 'tracks_updated')
+                     .first())
+        etag = make_etag(request, *watermark) if watermark else None
+        return conditional_response(request, etag, lambda: super(PlaylistViewSet, self).retrieve(request, *args, **kwargs))
+    
     def perform_create(self, serializer):
         """プレイリスト作成時にユーザーを自動設定"""
-        serializer.save(user=self.request.user)
+        playlist = serializer.save(user=self.request.user)
+        if playlist.is_public:
+            invalidate_public_feed()
+    
+    def perform_update(self, serializer):
+        """公開中または公開に切り替えたプレイリストの更新時はフィードのキャッシュを破棄"""
+        was_public = serializer.instance.is_public
+        playlist = serializer.save()
+        if was_public or playlist.is_public:
+            invalidate_public_feed()
+    
+    def perform_destroy(self, instance):
+        """公開プレイリストの削除時はフィードのキャッシュを破棄"""
+        was_public = instance.is_public
+        instance.delete()
+        if was_public:
+            invalidate_public_feed()
+    
+    @action(detail=False, methods=['get'])
+    def public(self, request):
+        """
+        公開プレイリストのフィード（更新日時の新しい順）
+        
+        ページごとにキャッシュし、公開プレイリストが更新されたときに破棄する。
+        RESPONSE_CACHE_ENABLED が無効の場合はキャッシュしない。
+        """
+        if not settings.RESPONSE_CACHE_ENABLED:
+            page = self.paginate_queryset(self.get_queryset())
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        cache_key = public_feed_cache_key(request.get_full_path())
+        data = cache.get(cache_key)
+        if data is None:
+            page = self.paginate_queryset(self.get_queryset())
+            data = self.get_paginated_response(self.get_serializer(page, many=True).data).data
+            cache.set(cache_key, data, settings.PUBLIC_PLAYLIST_FEED_CACHE_TIMEOUT)
+        return Response(data)
     
     @action(detail=True, methods=['post'])
     def add_track(self, request, pk=None):
@@ -58,10 +147,17 @@ class PlaylistViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        # 位置が指定されていない場合は最後に追加
-        if position is None:
-            last_position = PlaylistTrack.objects.filter(playlist=playlist).order_by('-position').first()
-            position = 0 if last_position is None else last_position.position + 1
+        # 位置は0始まり。指定されていない場合は最後に追加
+        if position is not None:
+            try:
+                position = int(position)
+                if position < 0:
+                    raise ValueError
+            except (TypeError, ValueError):
+                return Response(
+                    {"position": "位置は0以上の整数で指定してください。"}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
         
         # 既に同じ曲が含まれている場合は追加しない
         if PlaylistTrack.objects.filter(playlist=playlist, track=track).exists():
@@ -70,22 +166,81 @@ class PlaylistViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # 同じpositionの曲があれば、それ以降の曲の位置をずらす
+        # 前後の曲のrankの中間値を使うため、他の曲の行は書き換えない
         with transaction.atomic():
-            PlaylistTrack.objects.filter(
-                playlist=playlist, 
-                position__gte=position
-            ).update(position=models.F('position') + 1)
-            
+            # 同時に追加されたときにrankが衝突しないよう、プレイリストの行をロックする
+            Playlist.objects.select_for_update().get(pk=playlist.pk)
             playlist_track = PlaylistTrack.objects.create(
                 playlist=playlist,
                 track=track,
-                position=position
+                rank=rank_for_position(playlist, position)
             )
+            touch_playlist(playlist)
         
         serializer = PlaylistTrackSerializer(playlist_track)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     
+    @action(detail=True, methods=['post'])
+    def add_tracks(self, request, pk=None):
+        """
+        プレイリストに複数の楽曲をまとめて追加
+        
+        リクエスト:
+            tracks: 追加する楽曲IDのリスト（この順に並べる）
+            position: 0始まりの挿入位置（省略時は末尾）
+        """
+        playlist = self.get_object()
+        
+        # 自分のプレイリストのみ編集可能
+        if playlist.user != request.user:
+            return Response(
+                {"detail": "このプレイリストを編集する権限がありません。"}, 
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        track_ids = request.data.get('tracks')
+        position = request.data.get('position')
+        
+        if not isinstance(track_ids, list) or not track_ids:
+            return Response(
+                {"tracks": "楽曲IDのリストは必須です。"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            track_ids = [int(track_id) for track_id in track_ids]
+            if position is not None:
+                position = int(position)
+                if position < 0:
+                    raise ValueError
+        except (TypeError, ValueError):
+            return Response(
+                {"detail": "楽曲IDと位置は0以上の整数で指定してください。"}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        tracks = Track.objects.in_bulk(track_ids)
+        missing = [track_id for track_id in track_ids if track_id not in tracks]
+        if missing:
+            return Response(
+                {"tracks": f"指定された楽曲が見つかりません: {missing}"}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        playlist_tracks, skipped = add_tracks_to_playlist(
+            playlist, [tracks[track_id] for track_id in track_ids], position
+        )
+        # 追加した曲は連続して並ぶため、先頭の位置だけを求めて残りは順に振る
+        if playlist_tracks:
+            first_position = get_position(playlist_tracks[0])
+            for offset, playlist_track in enumerate(playlist_tracks):
+                playlist_track.position = first_position + offset
+        
+        serializer = PlaylistTrackSerializer(playlist_tracks, many=True)
+        return Response({
+            'added': serializer.data,
+            'skipped': [track.pk for track in skipped],
+        }, status=status.HTTP_201_CREATED)
+    
     @action(detail=True, methods=['delete'])
     def remove_track(self, request, pk=None):
         """プレイリストから楽曲を削除"""
@@ -114,23 +269,22 @@ class PlaylistViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        removed_position = playlist_track.position
-        
+        # rankは間隔が空いていてよいため、後続の曲の位置を詰める必要はない
         with transaction.atomic():
-            # 削除する曲の情報を保存
             playlist_track.delete()
-            
-            # 削除した曲より後の曲の位置を詰める
-            PlaylistTrack.objects.filter(
-                playlist=playlist, 
-                position__gt=removed_position
-            ).update(position=models.F('position') - 1)
+            touch_playlist(playlist)
         
         return Response(status=status.HTTP_204_NO_CONTENT)
     
     @action(detail=True, methods=['put'])
     def reorder_tracks(self, request, pk=None):
-        """プレイリスト内の楽曲順序を変更"""
+        """
+        プレイリスト内の楽曲順序を変更
+        
+        リクエスト:
+            tracks: 新しい並び順の楽曲IDのリスト（プレイリストの全楽曲）
+            track_orders: 互換用。{"track": 楽曲ID, "position": 移動先の位置} のリスト
+        """
         playlist = self.get_object()
         
         # 自分のプレイリストのみ編集可能
@@ -140,34 +294,88 @@ class PlaylistViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        track_orders = request.data.get('track_orders', [])
-        
-        if not isinstance(track_orders, list):
-            return Response(
-                {"track_orders": "トラック順序のリストが必要です。"}, 
-                status=status.HTTP_400_BAD_REQUEST
+        # 並び順の読み出しから書き込みまでの間に、楽曲の追加・並べ替え・振り直しが割り込まないよう
+        # プレイリストの行をロックし、同じトランザクションで読み書きする
+        with transaction.atomic():
+            Playlist.objects.select_for_update().get(pk=playlist.pk)
+            
+            current = list(
+                PlaylistTrack.objects.filter(playlist=playlist).order_by('rank').values_list('id', 'track_id', 'rank')
             )
+            playlist_track_ids = {track_id: playlist_track_id for playlist_track_id, track_id, _ in current}
         
-        with transaction.atomic():
-            for order in track_orders:
-                track_id = order.get('track')
-                new_position = order.get('position')
-                
-                if not track_id or new_position is None:
+            if 'tracks' in request.data:
+                # 新しい並び順を楽曲IDのリストで受け取る
+                track_ids = request.data.get('tracks')
+                if not isinstance(track_ids, list):
                     return Response(
-                        {"detail": "各エントリには'track'と'position'が必要です。"}, 
+                        {"tracks": "楽曲IDのリストが必要です。"}, 
                         status=status.HTTP_400_BAD_REQUEST
                     )
-                
                 try:
-                    playlist_track = PlaylistTrack.objects.get(playlist=playlist, track_id=track_id)
-                    playlist_track.position = new_position
-                    playlist_track.save()
-                except PlaylistTrack.DoesNotExist:
+                    track_ids = [int(track_id) for track_id in track_ids]
+                except (TypeError, ValueError):
+                    return Response(
+                        {"tracks": "楽曲IDは整数で指定してください。"}, 
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                if len(track_ids) != len(current) or set(track_ids) != set(playlist_track_ids):
+                    return Response(
+                        {"tracks": "プレイリストの全楽曲を重複なく指定してください。"}, 
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                ordered_ids = [playlist_track_ids[track_id] for track_id in track_ids]
+            else:
+                # 互換用: 動かす楽曲と移動先の位置のリスト
+                track_orders = request.data.get('track_orders', [])
+            
+                if not isinstance(track_orders, list):
                     return Response(
-                        {"detail": f"トラックID {track_id} はプレイリストに存在しません。"}, 
-                        status=status.HTTP_404_NOT_FOUND
+                        {"track_orders": "トラック順序のリストが必要です。"}, 
+                        status=status.HTTP_400_BAD_REQUEST
                     )
+            
+                moves = {}
+                for order in track_orders:
+                    track_id = order.get('track')
+                    new_position = order.get('position')
+                
+                    if not track_id or new_position is None:
+                        return Response(
+                            {"detail": "各エントリには'track'と'position'が必要です。"}, 
+                            status=status.HTTP_400_BAD_REQUEST
+                        )
+                
+                    try:
+                        track_id = int(track_id)
+                        new_position = int(new_position)
+                    except (TypeError, ValueError):
+                        return Response(
+                            {"detail": "'track'と'position'は整数で指定してください。"}, 
+                            status=status.HTTP_400_BAD_REQUEST
+                        )
+                
+                    if not 0 <= new_position < len(current):
+                        return Response(
+                            {"detail": f"'position'は0以上{len(current)}未満で指定してください。"}, 
+                            status=status.HTTP_400_BAD_REQUEST
+                        )
+                
+                    if track_id not in playlist_track_ids:
+                        return Response(
+                            {"detail": f"トラックID {track_id} はプレイリストに存在しません。"}, 
+                            status=status.HTTP_404_NOT_FOUND
+                        )
+                    moves[playlist_track_ids[track_id]] = new_position
+            
+                # 指定された曲を取り除き、指定位置の小さい順に差し込んで新しい並び順を作る
+                ordered_ids = [playlist_track_id for playlist_track_id, _, _ in current if playlist_track_id not in moves]
+                for playlist_track_id, new_position in sorted(moves.items(), key=lambda move: move[1]):
+                    ordered_ids.insert(new_position, playlist_track_id)
+        
+            # 並び順が変わらない楽曲（最長増加部分列）は書き換えず、動かした楽曲のrankだけを更新する
+            current_ranks = {playlist_track_id: rank for playlist_track_id, _, rank in current}
+            reorder_playlist(playlist, ordered_ids, current_ranks)
         
         # 更新後のプレイリストを返す
         serializer = PlaylistDetailSerializer(playlist)
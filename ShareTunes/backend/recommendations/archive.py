@@ -0,0 +1,300 @@
+import gzip
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from feedbacks.models import Feedback
+from sharetunes.exports import iter_keyset
+
+from .cache import invalidate_recommendation_list
+from .models import PromptTemplate, Recommendation, RecommendationPayload, RecommendedTrack
+from .storage import compress_text, split_prompt, template_hash
+
+# 1回のトランザクションでアーカイブ・削除する推薦の件数（書き込みロックを保持する時間の上限になる）
+ARCHIVE_BATCH_SIZE = 500
+
+ARCHIVE_FILENAME = 'recommendations-{month}.jsonl.gz'
+
+TRACK_FIELDS = ('id', 'spotify_id', 'name', 'artist', 'album', 'image_url', 'preview_url',
+                'explanation', 'position')
+FEEDBACK_FIELDS = ('id', 'user_id', 'feedback_type', 'comment', 'created_at', 'updated_at')
+
+
+class ArchiveJSONEncoder(DjangoJSONEncoder):
+    """日時をマイクロ秒まで残す（DjangoJSONEncoder はミリ秒に丸めるため、復元後の日時がずれる）"""
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+@dataclass
+class ArchiveStats:
+    """アーカイブ・復元の件数と所要時間"""
+    recommendations: int = 0
+    tracks: int = 0
+    feedbacks: int = 0
+    skipped: int = 0
+    bytes_written: int = 0
+    batches: int = 0
+    files: set = field(default_factory=set)
+    started_at: float = field(default_factory=time.perf_counter)
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started_at
+
+    @property
+    def throughput(self):
+        """1秒あたりの推薦の件数"""
+        return self.recommendations / self.elapsed if self.elapsed else 0.0
+
+
+def archive_path(archive_dir, created_at):
+    """推薦の作成月（ローカル時刻）ごとのアーカイブファイルのパス"""
+    month = timezone.localtime(created_at).strftime('%Y-%m')
+    return os.path.join(archive_dir, ARCHIVE_FILENAME.format(month=month))
+
+
+def build_archive_records(recommendations):
+    """推薦を、楽曲とフィードバックを入れ子にした1推薦1レコードにする"""
+    ids = [recommendation.pk for recommendation in recommendations]
+
+    feedbacks = {}
+    for feedback in (Feedback.objects
+                     .filter(track__recommendation_id__in=ids)
+                     .order_by('id')
+                     .values('track_id', *FEEDBACK_FIELDS)):
+        feedbacks.setdefault(feedback.pop('track_id'), []).append(feedback)
+
+    tracks = {}
+    for track in (RecommendedTrack.objects
+                  .filter(recommendation_id__in=ids)
+                  .order_by('recommendation_id', 'position', 'id')
+                  .values('recommendation_id', *TRACK_FIELDS)):
+        track['feedbacks'] = feedbacks.get(track['id'], [])
+        tracks.setdefault(track.pop('recommendation_id'), []).append(track)
+
+    return [
+        {
+            'id': recommendation.pk,
+            'user_id': recommendation.user_id,
+            'context_description': recommendation.context_description,
+            'created_at': recommendation.created_at,
+            'updated_at': recommendation.updated_at,
+            'prompt_text': recommendation.prompt_text,
+            'llm_response': recommendation.llm_response,
+            'tracks': tracks.get(recommendation.pk, []),
+        }
+        for recommendation in recommendations
+    ]
+
+
+def write_archive_records(archive_dir, records):
+    """
+    レコードを作成月ごとのファイルへ追記する
+
+    gzipのメンバーとして追記するため、既存のファイルを読み直さずに書き足せる。
+    削除より前にディスクへ書き切るよう、ファイルごとにfsyncする。
+
+    Returns:
+        dict: ファイルパスをキー、書き込んだバイト数を値とする辞書
+    """
+    encoder = ArchiveJSONEncoder(ensure_ascii=False)
+    lines = {}
+    for record in records:
+        lines.setdefault(archive_path(archive_dir, record['created_at']), []).append(
+            encoder.encode(record) + '\n'
+        )
+
+    written = {}
+    for path, file_lines in lines.items():
+        data = ''.join(file_lines).encode('utf-8')
+        with open(path, 'ab') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='ab') as output:
+                output.write(data)
+            raw.flush()
+            os.fsync(raw.fileno())
+        written[path] = len(data)
+    return written
+
+
+def archive_recommendations(cutoff, archive_dir, batch_size=ARCHIVE_BATCH_SIZE, dry_run=False,
+                            pause=0.0, on_batch=None):
+    """
+    cutoff より前に作成された推薦をアーカイブファイルへ書き出してから削除する
+
+    推薦はIDのキーセットで batch_size 件ずつ読み込み、バッチごとに
+    「書き出し → fsync → 短いトランザクションでの削除」を繰り返す。
+    削除の途中で中断しても、書き出し済みのバッチは復元時に重複を読み飛ばすため再実行してよい。
+
+    Args:
+        cutoff (datetime): この日時より前に作成された推薦が対象
+        archive_dir (str): アーカイブの保存先
+        batch_size (int): 1バッチの推薦の件数
+        dry_run (bool): Trueの場合は件数を数えるだけで書き出し・削除しない
+        pause (float): バッチごとに待つ秒数（他の書き込みにロックを譲るため）
+        on_batch (callable, optional): バッチごとに ArchiveStats を受け取る関数
+
+    Returns:
+        ArchiveStats: アーカイブした件数と所要時間
+    """
+    stats = ArchiveStats()
+    queryset = Recommendation.objects.filter(created_at__lt=cutoff)
+    if dry_run:
+        stats.recommendations = queryset.count()
+        stats.tracks = RecommendedTrack.objects.filter(recommendation__in=queryset).count()
+        stats.feedbacks = Feedback.objects.filter(track__recommendation__in=queryset).count()
+        return stats
+
+    os.makedirs(archive_dir, exist_ok=True)
+    queryset = queryset.select_related('payload__prompt_template')
+    for recommendations in iter_keyset(queryset, batch_size):
+        records = build_archive_records(recommendations)
+        written = write_archive_records(archive_dir, records)
+
+        ids = [record['id'] for record in records]
+        with transaction.atomic():
+            # 楽曲・フィードバック・ペイロードは外部キーのCASCADEでまとめて削除される
+            Recommendation.objects.filter(id__in=ids).delete()
+        for user_id in {record['user_id'] for record in records}:
+            invalidate_recommendation_list(user_id)
+
+        stats.recommendations += len(records)
+        stats.tracks += sum(len(record['tracks']) for record in records)
+        stats.feedbacks += sum(len(track['feedbacks']) for record in records for track in record['tracks'])
+        stats.bytes_written += sum(written.values())
+        stats.files.update(written)
+        stats.batches += 1
+        if on_batch is not None:
+            on_batch(stats)
+        if pause:
+            time.sleep(pause)
+    return stats
+
+
+def iter_archive_records(path):
+    """アーカイブファイルのレコードを1件ずつ読み込む"""
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        for line in archive:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _batched(records, batch_size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _build_payloads(records, templates):
+    """復元する推薦のペイロード（テンプレートは既存の行を再利用する）"""
+    payloads = []
+    for record in records:
+        template_text, body = split_prompt(record['prompt_text'])
+        template_id = None
+        if template_text:
+            key = template_hash(template_text)
+            if key not in templates:
+                templates[key] = PromptTemplate.objects.get_or_create(
+                    hash=key, defaults={'text': template_text}
+                )[0].pk
+            template_id = templates[key]
+        payloads.append(RecommendationPayload(
+            recommendation_id=record['id'],
+            prompt_template_id=template_id,
+            prompt_body=compress_text(body),
+            llm_response=compress_text(record['llm_response']),
+        ))
+    return payloads
+
+
+def restore_batch(records, templates, stats):
+    """アーカイブのレコードを元のIDのまま書き戻す（既に存在する推薦と、削除済みユーザーの推薦は読み飛ばす）"""
+    existing = set(
+        Recommendation.objects.filter(id__in=[record['id'] for record in records]).values_list('id', flat=True)
+    )
+    user_ids = set(
+        User.objects
+        .filter(id__in={record['user_id'] for record in records}
+                | {feedback['user_id'] for record in records
+                   for track in record['tracks'] for feedback in track['feedbacks']})
+        .values_list('id', flat=True)
+    )
+    restorable = [record for record in records
+                  if record['id'] not in existing and record['user_id'] in user_ids]
+    stats.skipped += len(records) - len(restorable)
+    if not restorable:
+        return
+
+    recommendations = [
+        Recommendation(id=record['id'], user_id=record['user_id'],
+                       context_description=record['context_description'])
+        for record in restorable
+    ]
+    tracks = [
+        RecommendedTrack(recommendation_id=record['id'],
+                         **{name: track[name] for name in TRACK_FIELDS})
+        for record in restorable for track in record['tracks']
+    ]
+    feedback_records = [
+        (track['id'], feedback)
+        for record in restorable for track in record['tracks'] for feedback in track['feedbacks']
+        if feedback['user_id'] in user_ids
+    ]
+    feedbacks = [
+        Feedback(track_id=track_id, **{name: feedback[name] for name in FEEDBACK_FIELDS})
+        for track_id, feedback in feedback_records
+    ]
+
+    with transaction.atomic():
+        Recommendation.objects.bulk_create(recommendations)
+        RecommendationPayload.objects.bulk_create(_build_payloads(restorable, templates))
+        RecommendedTrack.objects.bulk_create(tracks)
+        Feedback.objects.bulk_create(feedbacks)
+
+        # bulk_create では auto_now / auto_now_add の日時が現在時刻になるため、元の日時で上書きする
+        for instance, record in zip(recommendations + feedbacks,
+                                    restorable + [feedback for _, feedback in feedback_records]):
+            instance.created_at = parse_datetime(record['created_at'])
+            instance.updated_at = parse_datetime(record['updated_at'])
+        Recommendation.objects.bulk_update(recommendations, ['created_at', 'updated_at'], batch_size=ARCHIVE_BATCH_SIZE)
+        Feedback.objects.bulk_update(feedbacks, ['created_at', 'updated_at'], batch_size=ARCHIVE_BATCH_SIZE)
+
+    for user_id in {record['user_id'] for record in restorable}:
+        invalidate_recommendation_list(user_id)
+    stats.recommendations += len(restorable)
+    stats.tracks += len(tracks)
+    stats.feedbacks += len(feedbacks)
+
+
+def restore_archive(path, batch_size=ARCHIVE_BATCH_SIZE, on_batch=None):
+    """
+    アーカイブファイルの推薦を、楽曲・フィードバックとともにDBへ戻す
+
+    Returns:
+        ArchiveStats: 復元した件数と所要時間
+    """
+    stats = ArchiveStats()
+    stats.files.add(path)
+    templates = {}
+    for records in _batched(iter_archive_records(path), batch_size):
+        restore_batch(records, templates, stats)
+        stats.batches += 1
+        if on_batch is not None:
+            on_batch(stats)
+    return stats
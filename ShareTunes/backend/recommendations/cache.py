@@ -0,0 +1,108 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+# ユーザーごとの推薦一覧キャッシュのバージョン。上げるとそのユーザーの過去のページはすべて参照されなくなる
+LIST_VERSION_KEY = 'recommendations:list:{user_id}:version'
+LIST_PAGE_KEY = 'recommendations:list:{user_id}:{version}:{digest}'
+
+
+class ResponseCacheStats:
+    """レスポンスキャッシュのヒット率と、ヒットにより省略できたシリアライズ時間の集計"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.build_ms = 0.0
+            self.saved_ms = 0.0
+
+    def record_hit(self, saved_ms):
+        with self._lock:
+            self.hits += 1
+            self.saved_ms += saved_ms
+
+    def record_miss(self, build_ms):
+        with self._lock:
+            self.misses += 1
+            self.build_ms += build_ms
+
+    def snapshot(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+                'build_ms': self.build_ms,
+                'saved_ms': self.saved_ms,
+            }
+
+
+list_cache_stats = ResponseCacheStats()
+
+
+def get_list_version(user_id):
+    return cache.get_or_set(LIST_VERSION_KEY.format(user_id=user_id), 1, timeout=None)
+
+
+def invalidate_recommendation_list(user_id):
+    """ユーザーの推薦一覧のキャッシュを破棄する（推薦の生成・更新・アーカイブ時に呼ぶ）"""
+    key = LIST_VERSION_KEY.format(user_id=user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # キーが失効している場合は作り直す（古いバージョンのページと重ならない値にする）
+        cache.set(key, int(time.time()), timeout=None)
+
+
+def cached_list_response(request, etag, build_response):
+    """
+    推薦一覧のページをユーザーごとにキャッシュして返す
+
+    キーにはバージョンに加えてETag（更新日時・件数の集計値）も含めるため、
+    別プロセスでの推薦の更新もキャッシュの破棄を待たずに反映される。
+
+    Args:
+        request: リクエスト
+        etag (str): 推薦一覧のETag
+        build_response (callable): キャッシュがない場合にレスポンスを作る関数
+
+    RESPONSE_CACHE_ENABLED が無効の場合はキャッシュせずに毎回レスポンスを作る。
+
+    Returns:
+        Response: X-Cache ヘッダー（HIT/MISS/BYPASS）付きのレスポンス
+    """
+    if not settings.RESPONSE_CACHE_ENABLED:
+        response = build_response()
+        response['X-Cache'] = 'BYPASS'
+        return response
+
+    user_id = request.user.pk
+    digest = hashlib.md5(f'{request.build_absolute_uri()}|{etag}'.encode('utf-8')).hexdigest()
+    key = LIST_PAGE_KEY.format(user_id=user_id, version=get_list_version(user_id), digest=digest)
+
+    entry = cache.get(key)
+    if entry is not None:
+        list_cache_stats.record_hit(entry['build_ms'])
+        response = Response(entry['data'])
+        response['X-Cache'] = 'HIT'
+        return response
+
+    start = time.perf_counter()
+    response = build_response()
+    build_ms = (time.perf_counter() - start) * 1000
+    if response.status_code == 200:
+        cache.set(key, {'data': response.data, 'build_ms': build_ms},
+                  settings.RECOMMENDATION_LIST_CACHE_TIMEOUT)
+        list_cache_stats.record_miss(build_ms)
+    response['X-Cache'] = 'MISS'
+    return response
@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recommendations.archive import ARCHIVE_BATCH_SIZE, archive_recommendations
+
+
+class Command(BaseCommand):
+    help = '保持期間を過ぎた推薦を楽曲・フィードバックとともに月ごとのgzip圧縮JSONLへ書き出し、バッチごとに削除する'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=settings.RECOMMENDATION_RETENTION_DAYS,
+                            help=f'この日数より前に作成された推薦を対象とする（デフォルト: {settings.RECOMMENDATION_RETENTION_DAYS}）')
+        parser.add_argument('--archive-dir', default=settings.RECOMMENDATION_ARCHIVE_DIR,
+                            help='アーカイブの保存先')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE,
+                            help=f'1回のトランザクションで削除する推薦の件数（デフォルト: {ARCHIVE_BATCH_SIZE}）')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='バッチごとに待つ秒数（他の書き込みを優先させる場合に指定）')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='対象の件数を表示するだけで、書き出し・削除は行わない')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+        self.stdout.write(f'{timezone.localtime(cutoff):%Y-%m-%d %H:%M} より前に作成された推薦をアーカイブします')
+
+        def report(stats):
+            self.stdout.write(
+                f'  バッチ {stats.batches}: 累計 {stats.recommendations}件 '
+                f'（{stats.throughput:.0f}件/秒）'
+            )
+
+        stats = archive_recommendations(
+            cutoff, options['archive_dir'], batch_size=options['batch_size'],
+            dry_run=options['dry_run'], pause=options['pause'],
+            on_batch=report if options['verbosity'] > 1 else None,
+        )
+        if options['dry_run']:
+            self.stdout.write(
+                f'対象: 推薦 {stats.recommendations}件, 楽曲 {stats.tracks}曲, フィードバック {stats.feedbacks}件'
+            )
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f'完了: 推薦 {stats.recommendations}件, 楽曲 {stats.tracks}曲, フィードバック {stats.feedbacks}件 '
+            f'→ {len(stats.files)}ファイル（非圧縮 {stats.bytes_written / 1024:.0f}KiB）'
+            f'（所要時間: {stats.elapsed:.2f}秒, {stats.throughput:.0f}件/秒）'
+        ))
@@ -0,0 +1,115 @@
+import json
+import os
+import platform
+import statistics
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from sharetunes import microbench
+from sharetunes.benchmarking import benchmark_database, measure_per_call, percentile
+from sharetunes.microbench.cases import pipeline_cases, serializer_cases
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(microbench.__file__), 'baseline.json')
+
+
+class Command(BaseCommand):
+    help = ('推薦の生成（抽出・プロンプト生成・パース）と推薦・プレイリストのシリアライズの1回あたりの時間を計測し、'
+            '保存したベースラインと比較する（メモリ上のテストDBを使用。サーバーや外部APIは不要）')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=15, help='ケースごとの計測回数')
+        parser.add_argument('--min-sample-time', type=float, default=0.02,
+                            help='1回の計測の最短秒数（呼び出し回数をこの時間に達するまで増やす）')
+        parser.add_argument('--only', action='append', default=[],
+                            help='名前にこの文字列を含むケースのみ計測する（複数指定可）')
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='ベースラインのJSONファイル')
+        parser.add_argument('--save-baseline', action='store_true', help='計測結果をベースラインとして保存する')
+        parser.add_argument('--compare', action='store_true',
+                            help='ベースラインと比較し、閾値を超えて遅くなったケースがあれば終了コード1で終了する')
+        parser.add_argument('--threshold', type=float, default=0.15,
+                            help='回帰とみなす中央値の増加率（0.15 = 15%%）')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            cases = pipeline_cases() + serializer_cases()
+            if options['only']:
+                cases = [(name, func) for name, func in cases if any(word in name for word in options['only'])]
+            if not cases:
+                raise CommandError('計測するケースがありません')
+
+            results = {}
+            for name, func in cases:
+                timings, number = measure_per_call(func, options['repeat'], options['min_sample_time'])
+                results[name] = {
+                    'median_us': statistics.median(timings),
+                    'min_us': min(timings),
+                    'p95_us': percentile(timings, 0.95),
+                    'stdev_us': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+                    'number': number,
+                    'repeat': len(timings),
+                }
+
+        baseline = self.load_baseline(options['baseline']) if options['compare'] else None
+        regressions = self.report(results, baseline, options['threshold'])
+
+        if options['save_baseline']:
+            self.save_baseline(options['baseline'], results)
+        if regressions:
+            raise CommandError(
+                f"{len(regressions)}件のケースがベースラインより{options['threshold']:.0%}以上遅くなりました: "
+                + ', '.join(regressions)
+            )
+
+    def report(self, results, baseline, threshold):
+        """結果を表示し、回帰したケースの名前を返す"""
+        regressions = []
+        width = max(len(name) for name in results)
+        for name, result in results.items():
+            line = (f"{name:<{width}}  median={result['median_us']:9.1f}us  min={result['min_us']:9.1f}us  "
+                    f"p95={result['p95_us']:9.1f}us  (x{result['number']} x{result['repeat']})")
+            previous = (baseline or {}).get('results', {}).get(name)
+            if previous:
+                change = result['median_us'] / previous['median_us'] - 1
+                line += f"  baseline={previous['median_us']:9.1f}us {change:+7.1%}"
+                if change > threshold:
+                    regressions.append(name)
+                    self.stdout.write(self.style.ERROR(f'{line}  回帰'))
+                    continue
+                if change < -threshold:
+                    self.stdout.write(self.style.SUCCESS(f'{line}  改善'))
+                    continue
+            elif baseline is not None:
+                line += '  （ベースラインなし）'
+            self.stdout.write(line)
+        return regressions
+
+    def load_baseline(self, path):
+        if not os.path.exists(path):
+            raise CommandError(f'ベースラインがありません: {path}（--save-baseline で作成してください）')
+        with open(path, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+        environment = baseline.get('environment', {})
+        if environment.get('python') != platform.python_version() or environment.get('machine') != platform.machine():
+            self.stdout.write(self.style.WARNING(
+                f"ベースラインの計測環境（Python {environment.get('python')}, {environment.get('machine')}）が"
+                f"現在の環境と異なります。同じ環境で計測したベースラインと比較してください"
+            ))
+        return baseline
+
+    def save_baseline(self, path, results):
+        baseline = {
+            'environment': {
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'cpus': os.cpu_count(),
+                'created_at': timezone.now().isoformat(),
+            },
+            'results': {name: {key: round(value, 3) if isinstance(value, float) else value
+                               for key, value in result.items()}
+                        for name, result in results.items()},
+        }
+        with open(path, 'w', encoding='utf-8') as baseline_file:
+            json.dump(baseline, baseline_file, ensure_ascii=False, indent=2)
+            baseline_file.write('\n')
+        self.stdout.write(self.style.SUCCESS(f'ベースラインを保存しました: {path}'))
@@ -0,0 +1,77 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from recommendations.cache import invalidate_recommendation_list, list_cache_stats
+from recommendations.models import Recommendation, RecommendedTrack
+from recommendations.views import RecommendationViewSet
+from sharetunes.benchmarking import benchmark_database, summarize
+
+
+class Command(BaseCommand):
+    help = '推薦一覧のポーリングを再現し、ユーザーごとのレスポンスキャッシュのヒット率と削減時間を計測する（テストDBを使用）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--recommendations', type=int, default=200,
+                            help='ユーザーあたりの推薦数（デフォルト: 200）')
+        parser.add_argument('--polls', type=int, default=2000,
+                            help='一覧取得の総リクエスト数')
+        parser.add_argument('--write-ratio', type=float, default=0.05,
+                            help='リクエストごとに推薦の生成・フィードバックが起きる確率')
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # 1プロセス内の計測のため、ワーカー数の設定によらずキャッシュを使う
+        with benchmark_database(), override_settings(RESPONSE_CACHE_ENABLED=True):
+            users = self.populate(options['users'], options['recommendations'])
+            cache.clear()
+            list_cache_stats.reset()
+
+            factory = APIRequestFactory()
+            view = RecommendationViewSet.as_view({'get': 'list'})
+            timings = {'HIT': [], 'MISS': []}
+            for _ in range(options['polls']):
+                user = rng.choice(users)
+                if rng.random() < options['write_ratio']:
+                    # 推薦の生成（またはフィードバックの変更）でキャッシュが破棄される
+                    self.add_recommendation(user)
+                    invalidate_recommendation_list(user.pk)
+
+                request = factory.get(f"/api/recommendations/?page_size={options['page_size']}",
+                                      HTTP_HOST='localhost')
+                force_authenticate(request, user=user)
+                start = time.perf_counter()
+                response = view(request)
+                response.render()
+                timings[response['X-Cache']].append((time.perf_counter() - start) * 1000)
+
+            stats = list_cache_stats.snapshot()
+            self.stdout.write(f"ヒット率: {stats['hit_ratio']:.1%}（ヒット {stats['hits']}回 / ミス {stats['misses']}回）")
+            self.stdout.write(f"シリアライズ時間: ミス時の合計 {stats['build_ms']:.0f}ms, ヒットにより削減 {stats['saved_ms']:.0f}ms")
+            for label, values in timings.items():
+                if values:
+                    self.stdout.write(f'{label}: {summarize(values)}')
+
+    def populate(self, user_count, recommendation_count):
+        self.stdout.write(f'{user_count}ユーザー × {recommendation_count}件の推薦を生成しています...')
+        users = [User.objects.create(username=f'benchmark{i}') for i in range(user_count)]
+        for user in users:
+            for _ in range(recommendation_count):
+                self.add_recommendation(user)
+        return users
+
+    def add_recommendation(self, user):
+        recommendation = Recommendation.objects.create(user=user, prompt_text='', llm_response='')
+        RecommendedTrack.objects.bulk_create([
+            RecommendedTrack(recommendation=recommendation, spotify_id=f'{recommendation.pk}-{position}',
+                             name=f'Track {position}', artist='Artist', position=position)
+            for position in range(10)
+        ])
@@ -0,0 +1,127 @@
+import json
+import random
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from recommendations.models import Recommendation, RecommendationPayload
+from recommendations.services import RecommendationService
+from sharetunes.benchmarking import benchmark_database, measure, summarize
+
+# 比較用に、従来どおりプロンプトと生レスポンスを平文で持つテーブル
+LEGACY_TABLE = 'benchmark_legacy_recommendation'
+
+
+class SampleRecommendationService(RecommendationService):
+    """Spotify APIを呼ばずに、与えたデータからプロンプトを作る"""
+
+    def __init__(self, spotify_data):
+        self.spotify_data = spotify_data
+
+    def get_spotify_user_data(self):
+        return self.spotify_data
+
+
+class Command(BaseCommand):
+    help = 'プロンプト・LLMの生レスポンスの保存サイズと詳細取得の時間を、平文で保存する従来の形式と比較する（テストDBを使用）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recommendations', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=200,
+                            help='詳細取得の計測回数')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with benchmark_database():
+            user = User.objects.create(username='benchmark')
+            samples = [self.make_sample(rng, i) for i in range(options['recommendations'])]
+            recommendations = Recommendation.objects.bulk_create([
+                Recommendation(user=user, context_description=f'#{i}') for i in range(len(samples))
+            ])
+
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'CREATE TABLE {LEGACY_TABLE} '
+                    '(id integer PRIMARY KEY, prompt_text text NOT NULL, llm_response text NOT NULL)'
+                )
+                before = self.database_size()
+                cursor.executemany(
+                    f'INSERT INTO {LEGACY_TABLE} (id, prompt_text, llm_response) VALUES (%s, %s, %s)',
+                    [(recommendation.pk, prompt, response)
+                     for recommendation, (prompt, response) in zip(recommendations, samples)]
+                )
+                legacy_bytes = self.database_size() - before
+
+            before = self.database_size()
+            for recommendation, (prompt, response) in zip(recommendations, samples):
+                RecommendationPayload.save_for(recommendation, prompt, response)
+            payload_bytes = self.database_size() - before
+
+            raw_bytes = sum(len(prompt.encode('utf-8')) + len(response.encode('utf-8'))
+                            for prompt, response in samples)
+            self.stdout.write(f'{len(samples)}件の推薦（平文の合計 {raw_bytes / 1024:.0f}KiB）')
+            self.stdout.write(f'従来の形式: {legacy_bytes / 1024:.0f}KiB')
+            self.stdout.write(
+                f'テンプレート分離 + 圧縮: {payload_bytes / 1024:.0f}KiB '
+                f'（{1 - payload_bytes / legacy_bytes:.0%} 削減）'
+            )
+
+            ids = [recommendation.pk for recommendation in recommendations]
+
+            def read_legacy():
+                with connection.cursor() as cursor:
+                    cursor.execute(f'SELECT prompt_text, llm_response FROM {LEGACY_TABLE} WHERE id = %s',
+                                   [rng.choice(ids)])
+                    cursor.fetchone()
+
+            def read_payload():
+                recommendation = (Recommendation.objects
+                                  .select_related('payload__prompt_template')
+                                  .get(pk=rng.choice(ids)))
+                recommendation.prompt_text
+                recommendation.llm_response
+
+            self.stdout.write(f'詳細取得（従来の形式）: {summarize(measure(read_legacy, options["repeat"]))}')
+            self.stdout.write(f'詳細取得（展開あり）: {summarize(measure(read_payload, options["repeat"]))}')
+
+    def database_size(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA page_count')
+            page_count = cursor.fetchone()[0]
+            cursor.execute('PRAGMA page_size')
+            return page_count * cursor.fetchone()[0]
+
+    def make_sample(self, rng, index):
+        """実際の推薦と同じ構成のプロンプトとLLMレスポンスを作る"""
+        tracks = [
+            {'name': f'Track {rng.randrange(10000)}', 'artists': [{'name': f'Artist {rng.randrange(500)}'}]}
+            for _ in range(20)
+        ]
+        service = SampleRecommendationService({
+            'recent_tracks': {'items': [{'track': track} for track in tracks[:10]]},
+            'top_artists': {'items': [
+                {'name': f'Artist {rng.randrange(500)}', 'genres': ['j-pop', 'rock', 'anime']}
+                for _ in range(10)
+            ]},
+            'top_tracks': {'items': tracks[10:]},
+        })
+        prompt = service.generate_llm_prompt(rng.choice([None, '雨の日の通勤', '集中して作業したい']))
+        content = json.dumps({'recommendations': [
+            {
+                'track_name': f'Song {rng.randrange(10000)}',
+                'artist_name': f'Artist {rng.randrange(500)}',
+                'album_name': f'Album {rng.randrange(1000)}',
+                'explanation': 'ユーザーがよく聴くアーティストと雰囲気が近く、最近の再生傾向にも合っています。',
+            }
+            for _ in range(5)
+        ]}, ensure_ascii=False)
+        response = {
+            'id': f'chatcmpl-{index}',
+            'object': 'chat.completion',
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                         'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': 900, 'completion_tokens': 400, 'total_tokens': 1300},
+        }
+        return prompt, json.dumps(response, ensure_ascii=False)
@@ -0,0 +1,145 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, transaction
+
+from recommendations.models import PromptTemplate, Recommendation, RecommendationPayload, RecommendedTrack
+from sharetunes.benchmarking import summarize
+
+SAMPLE_PROMPT = 'あなたは音楽の専門家として、以下の情報からユーザーに合った楽曲を推薦してください。\n## ユーザーの音楽履歴\n'
+SAMPLE_RESPONSE = {'choices': [{'message': {'content': '{"recommendations": []}'}}]}
+
+
+class Command(BaseCommand):
+    help = ('推薦の生成と同じ書き込みを複数プロセス（gunicornのワーカー相当）から同時に行い、SQLiteのチューニング（PRAGMA・トランザクションの種類）の'
+            '有無でスループットと "database is locked" の件数を比較する（一時ファイルのDBを使用）')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help='同時に書き込むプロセス数')
+        parser.add_argument('--readers', type=int, default=2, help='同時に一覧を読み込むプロセス数')
+        parser.add_argument('--recommendations', type=int, default=100,
+                            help='書き込みプロセスあたりの推薦の生成数')
+        parser.add_argument('--tracks', type=int, default=5, help='推薦あたりの楽曲数')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('このベンチマークはSQLiteのみ対応しています')
+
+        profiles = (
+            ('チューニングなし', {}),
+            ('チューニングあり', {'pragmas': settings.SQLITE_PRAGMAS, 'transaction_mode': 'IMMEDIATE'}),
+        )
+        for label, db_options in profiles:
+            with self.temporary_database(db_options):
+                result = self.run(options)
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            self.stdout.write(
+                f"  書き込み: {result['written']}件 / {result['elapsed']:.2f}秒 "
+                f"（{result['written'] / result['elapsed']:.0f}件/秒）, "
+                f"失敗（database is locked）: {result['locked']}件"
+            )
+            if result['write_timings']:
+                self.stdout.write(f"  書き込みトランザクション: {summarize(result['write_timings'])}")
+            if result['read_timings']:
+                self.stdout.write(f"  一覧の読み込み: {summarize(result['read_timings'])}")
+
+    @contextmanager
+    def temporary_database(self, db_options):
+        """
+        一時ファイルのDBに切り替える
+
+        ワーカーのプロセスはフォーク時に切り替え後の settings_dict を引き継ぐため、すべて同じDBに接続する。
+        """
+        settings_dict = connection.settings_dict
+        original = {'NAME': settings_dict['NAME'], 'OPTIONS': settings_dict['OPTIONS']}
+        directory = tempfile.mkdtemp()
+        connection.close()
+        settings_dict['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+        settings_dict['OPTIONS'] = db_options
+        try:
+            with connection.schema_editor() as editor:
+                for model in (User, PromptTemplate, Recommendation, RecommendationPayload, RecommendedTrack):
+                    editor.create_model(model)
+            yield
+        finally:
+            connection.close()
+            settings_dict.update(original)
+            shutil.rmtree(directory)
+
+    def run(self, options):
+        user = User.objects.create(username='benchmark')
+        # 子プロセスに接続を引き継がないよう、フォーク前に閉じる
+        connection.close()
+
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        writers_done = context.Event()
+        barrier = context.Barrier(options['writers'] + options['readers'])
+
+        def worker(body):
+            result = {'written': 0, 'locked': 0, 'write_timings': [], 'read_timings': []}
+            barrier.wait()
+            try:
+                body(result)
+            finally:
+                connection.close()
+                results.put(result)
+
+        def write(result):
+            for _ in range(options['recommendations']):
+                start = time.perf_counter()
+                try:
+                    with transaction.atomic():
+                        recommendation = Recommendation.objects.create(
+                            user=user, prompt_text=SAMPLE_PROMPT, llm_response=SAMPLE_RESPONSE,
+                        )
+                        RecommendedTrack.objects.bulk_create([
+                            RecommendedTrack(recommendation=recommendation, spotify_id=f'{recommendation.pk}-{position}',
+                                             name=f'Track {position}', artist='Artist', position=position)
+                            for position in range(options['tracks'])
+                        ])
+                except OperationalError as e:
+                    if 'locked' not in str(e):
+                        raise
+                    result['locked'] += 1
+                    continue
+                result['write_timings'].append((time.perf_counter() - start) * 1000)
+                result['written'] += 1
+
+        def read(result):
+            while not writers_done.is_set():
+                start = time.perf_counter()
+                try:
+                    list(Recommendation.objects.filter(user=user).order_by('-created_at', '-id')[:20])
+                except OperationalError as e:
+                    if 'locked' not in str(e):
+                        raise
+                    result['locked'] += 1
+                    continue
+                result['read_timings'].append((time.perf_counter() - start) * 1000)
+
+        writers = [context.Process(target=worker, args=(write,)) for _ in range(options['writers'])]
+        readers = [context.Process(target=worker, args=(read,)) for _ in range(options['readers'])]
+        start = time.perf_counter()
+        for process in writers + readers:
+            process.start()
+
+        for process in writers:
+            process.join()
+        elapsed = time.perf_counter() - start
+        writers_done.set()
+
+        total = {'written': 0, 'locked': 0, 'write_timings': [], 'read_timings': [], 'elapsed': elapsed}
+        for _ in range(len(writers) + len(readers)):
+            for key, value in results.get().items():
+                total[key] += value
+        for process in readers:
+            process.join()
+        return total
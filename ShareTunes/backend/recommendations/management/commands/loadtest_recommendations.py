@@ -0,0 +1,116 @@
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from sharetunes.benchmarking import benchmark_database
+from sharetunes.loadtest import (
+    AppServer, ChatCompletionStubHandler, Latency, SpotifyStubHandler, StubBehavior, StubServer, run_load,
+)
+from users.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = ('SpotifyとLLM（OpenAI互換API）のスタブのサーバーを起動し、同時に操作するユーザーを模擬して '
+            '/api/recommendations/generate/ などのRPSとレイテンシを計測する（一時ファイルのテストDBを使用）')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=4, help='同時に操作するユーザー数')
+        parser.add_argument('--duration', type=float, default=None, help='計測する秒数')
+        parser.add_argument('--iterations', type=int, default=None,
+                            help='ユーザーごとの操作の繰り返し回数（--duration 未指定時の既定値は5）')
+        parser.add_argument('--llm-latency', default='800,2000',
+                            help='LLMの応答時間（ミリ秒）。"中央値" または "中央値,p95"')
+        parser.add_argument('--llm-error-rate', type=float, default=0.0, help='LLMが503を返す割合')
+        parser.add_argument('--llm-tracks', type=int, default=5, help='LLMが返す推薦の曲数')
+        parser.add_argument('--llm-padding', type=int, default=0,
+                            help='推薦理由に足す文字数（レスポンスの大きさの調整）')
+        parser.add_argument('--spotify-latency', default='40,120',
+                            help='Spotify APIの応答時間（ミリ秒）。"中央値" または "中央値,p95"')
+        parser.add_argument('--spotify-error-rate', type=float, default=0.0,
+                            help='Spotify APIが503を返す割合（spotipyが再試行する）')
+        parser.add_argument('--spotify-items', type=int, default=20, help='再生履歴・トップの件数')
+        parser.add_argument('--output', help='結果をJSONで書き出すファイル（変更前後の比較用）')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1:
+            raise CommandError('--users は1以上を指定してください')
+        iterations = options['iterations']
+        if iterations is None and options['duration'] is None:
+            iterations = 5
+
+        spotify = StubServer(SpotifyStubHandler, StubBehavior(
+            latency=Latency.parse(options['spotify_latency']),
+            error_rate=options['spotify_error_rate'],
+            items=options['spotify_items'],
+        ))
+        llm = StubServer(ChatCompletionStubHandler, StubBehavior(
+            latency=Latency.parse(options['llm_latency']),
+            error_rate=options['llm_error_rate'],
+            items=options['llm_tracks'],
+            padding=options['llm_padding'],
+        ))
+
+        directory = tempfile.mkdtemp()
+        try:
+            # リクエストはスレッドごとに別の接続で処理するため、メモリ上ではなくファイルのDBを使う
+            with benchmark_database(os.path.join(directory, 'loadtest.sqlite3')), spotify, llm:
+                tokens = self.create_users(options['users'])
+                with override_settings(
+                    ALLOWED_HOSTS=['127.0.0.1'],
+                    SPOTIFY_CLIENT_ID='stub', SPOTIFY_CLIENT_SECRET='stub',
+                    SPOTIFY_API_URL=f'{spotify.url}/v1/', SPOTIFY_ACCOUNTS_URL=spotify.url,
+                    LLM_PROVIDERS=['openai'], OPENAI_API_KEY='stub',
+                    OPENAI_API_URL=f'{llm.url}/v1/chat/completions',
+                ), AppServer(get_wsgi_application()) as app:
+                    results, elapsed = run_load(app.url, tokens, duration=options['duration'], iterations=iterations)
+        finally:
+            shutil.rmtree(directory)
+
+        summary = {
+            'users': options['users'],
+            'elapsed': elapsed,
+            'endpoints': {name: result.summary(elapsed) for name, result in sorted(results.items())},
+            'stubs': {
+                'spotify': {'requests': spotify.requests, 'errors': spotify.errors},
+                'llm': {'requests': llm.requests, 'errors': llm.errors},
+            },
+        }
+        self.report(summary)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(summary, output, ensure_ascii=False, indent=2)
+
+    def create_users(self, count):
+        """Spotifyのトークンが有効なユーザーを作り、JWTのアクセストークンを返す"""
+        tokens = []
+        for index in range(count):
+            user = User.objects.create(username=f'loadtest{index}')
+            UserProfile.objects.create(
+                user=user,
+                spotify_id=f'loadtest{index}',
+                spotify_access_token='stub-access-token',
+                spotify_token_expires_at=timezone.now() + timedelta(hours=1),
+            )
+            tokens.append(str(RefreshToken.for_user(user).access_token))
+        return tokens
+
+    def report(self, summary):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"同時ユーザー数: {summary['users']}, 経過時間: {summary['elapsed']:.2f}秒"
+        ))
+        for name, endpoint in summary['endpoints'].items():
+            self.stdout.write(
+                f"  {name}: {endpoint['requests']}件 ({endpoint['rps']:.2f} req/s), エラー {endpoint['errors']}件, "
+                f"p50={endpoint['p50_ms']:.1f}ms p95={endpoint['p95_ms']:.1f}ms p99={endpoint['p99_ms']:.1f}ms"
+            )
+        for name, stub in summary['stubs'].items():
+            self.stdout.write(f"  スタブ {name}: {stub['requests']}件（うち注入したエラー {stub['errors']}件）")
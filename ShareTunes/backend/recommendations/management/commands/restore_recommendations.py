@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from recommendations.archive import ARCHIVE_BATCH_SIZE, restore_archive
+
+
+class Command(BaseCommand):
+    help = 'archive_recommendations で書き出した推薦を、楽曲・フィードバックとともに元のIDのままDBへ戻す'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='アーカイブファイル（recommendations-YYYY-MM.jsonl.gz）')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        for path in options['paths']:
+            try:
+                stats = restore_archive(path, batch_size=options['batch_size'])
+            except FileNotFoundError:
+                raise CommandError(f'アーカイブファイルが見つかりません: {path}')
+
+            self.stdout.write(self.style.SUCCESS(
+                f'{path}: 推薦 {stats.recommendations}件, 楽曲 {stats.tracks}曲, '
+                f'フィードバック {stats.feedbacks}件を復元しました'
+                f'（既存・ユーザー削除済みのため読み飛ばし {stats.skipped}件）'
+                f'（所要時間: {stats.elapsed:.2f}秒, {stats.throughput:.0f}件/秒）'
+            ))
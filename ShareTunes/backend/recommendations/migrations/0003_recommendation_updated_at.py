@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0002_recommendation_recommendation_user_created'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recommendation',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, help_text='推薦楽曲の情報を含めた最終更新日時'),
+        ),
+    ]
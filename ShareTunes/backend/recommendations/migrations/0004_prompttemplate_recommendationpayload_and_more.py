@@ -0,0 +1,140 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+import hashlib
+import re
+import zlib
+
+# 1回に変換する推薦の件数
+BATCH_SIZE = 500
+
+# recommendations.storage と同じ規則（マイグレーションではアプリのコードに依存しない）
+VARIABLE_SECTION_RE = re.compile(r'\s*\n## ')
+
+
+def _compress(text):
+    return zlib.compress(text.encode('utf-8'), 6) if text else b''
+
+
+def _decompress(data):
+    return zlib.decompress(bytes(data)).decode('utf-8') if data else ''
+
+
+def move_payloads(apps, schema_editor):
+    """既存のプロンプトと生レスポンスを、テンプレートの参照と圧縮済みのペイロードへ分割して移す"""
+    Recommendation = apps.get_model('recommendations', 'Recommendation')
+    PromptTemplate = apps.get_model('recommendations', 'PromptTemplate')
+    RecommendationPayload = apps.get_model('recommendations', 'RecommendationPayload')
+
+    templates = {}
+    last_id = 0
+    while True:
+        rows = list(Recommendation.objects
+                    .filter(id__gt=last_id)
+                    .order_by('id')
+                    .values_list('id', 'prompt_text', 'llm_response')[:BATCH_SIZE])
+        if not rows:
+            break
+        payloads = []
+        for recommendation_id, prompt_text, llm_response in rows:
+            prompt_text = prompt_text or ''
+            match = VARIABLE_SECTION_RE.search(prompt_text)
+            split_at = match.start() if match else len(prompt_text)
+            template_text, body = prompt_text[:split_at], prompt_text[split_at:]
+            template_id = None
+            if template_text:
+                key = hashlib.sha256(template_text.encode('utf-8')).hexdigest()
+                if key not in templates:
+                    templates[key] = PromptTemplate.objects.get_or_create(
+                        hash=key, defaults={'text': template_text}
+                    )[0].id
+                template_id = templates[key]
+            payloads.append(RecommendationPayload(
+                recommendation_id=recommendation_id,
+                prompt_template_id=template_id,
+                prompt_body=_compress(body),
+                llm_response=_compress(llm_response or ''),
+            ))
+        RecommendationPayload.objects.bulk_create(payloads)
+        last_id = rows[-1][0]
+
+
+def restore_payloads(apps, schema_editor):
+    Recommendation = apps.get_model('recommendations', 'Recommendation')
+    RecommendationPayload = apps.get_model('recommendations', 'RecommendationPayload')
+
+    last_id = 0
+    while True:
+        payloads = list(RecommendationPayload.objects
+                        .filter(recommendation_id__gt=last_id)
+                        .select_related('prompt_template')
+                        .order_by('recommendation_id')[:BATCH_SIZE])
+        if not payloads:
+            break
+        recommendations = []
+        for payload in payloads:
+            template = payload.prompt_template.text if payload.prompt_template else ''
+            recommendations.append(Recommendation(
+                id=payload.recommendation_id,
+                prompt_text=template + _decompress(payload.prompt_body),
+                llm_response=_decompress(payload.llm_response),
+            ))
+        Recommendation.objects.bulk_update(recommendations, ['prompt_text', 'llm_response'])
+        last_id = payloads[-1].recommendation_id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0003_recommendation_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PromptTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.CharField(help_text='テンプレート本文のSHA-256', max_length=64, unique=True)),
+                ('text', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'プロンプトテンプレート',
+                'verbose_name_plural': 'プロンプトテンプレート',
+            },
+        ),
+        migrations.CreateModel(
+            name='RecommendationPayload',
+            fields=[
+                ('recommendation', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='payload', serialize=False, to='recommendations.recommendation')),
+                ('prompt_body', models.BinaryField(default=b'', help_text='プロンプトのテンプレート以降の部分（zlib圧縮）')),
+                ('llm_response', models.BinaryField(default=b'', help_text='LLMからの生のレスポンス（zlib圧縮）')),
+                ('prompt_template', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='recommendations.prompttemplate')),
+            ],
+            options={
+                'verbose_name': '推薦ペイロード',
+                'verbose_name_plural': '推薦ペイロード',
+            },
+        ),
+        # 巻き戻し時に列を空文字で作り直してから復元できるよう、削除前にデフォルト値を付ける
+        migrations.AlterField(
+            model_name='recommendation',
+            name='prompt_text',
+            field=models.TextField(default='', help_text='LLMに送られたプロンプトテキスト'),
+        ),
+        migrations.AlterField(
+            model_name='recommendation',
+            name='llm_response',
+            field=models.TextField(default='', help_text='LLMからの生のレスポンス'),
+        ),
+        migrations.RunPython(move_payloads, restore_payloads),
+        migrations.RemoveField(
+            model_name='recommendation',
+            name='llm_response',
+        ),
+        migrations.RemoveField(
+            model_name='recommendation',
+            name='prompt_text',
+        ),
+    ]
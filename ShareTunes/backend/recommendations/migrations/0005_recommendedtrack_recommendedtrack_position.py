@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0004_prompttemplate_recommendationpayload_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recommendedtrack',
+            index=models.Index(fields=['recommendation', 'position'], name='recommendedtrack_position'),
+        ),
+    ]
@@ -1,22 +1,88 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+from .storage import compress_text, decompress_text, split_prompt, stringify_response, template_hash
+
+class PromptTemplate(models.Model):
+    """推薦プロンプトの固定部分（同じテンプレートは1行だけ保存し、ハッシュで参照する）"""
+    hash = models.CharField(max_length=64, unique=True, help_text="テンプレート本文のSHA-256")
+    text = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'プロンプトテンプレート'
+        verbose_name_plural = 'プロンプトテンプレート'
+        
+    def __str__(self):
+        return self.hash[:12]
+
 class Recommendation(models.Model):
-    """音楽推薦モデル"""
+    """
+    音楽推薦モデル
+    
+    プロンプトとLLMの生レスポンスは RecommendationPayload に圧縮して保存し、
+    prompt_text / llm_response プロパティで参照したときにだけ読み込む。
+    """
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendations')
-    prompt_text = models.TextField(help_text="LLMに送られたプロンプトテキスト")
-    llm_response = models.TextField(help_text="LLMからの生のレスポンス")
     context_description = models.CharField(max_length=255, blank=True, null=True, help_text="推薦コンテキスト(気分、状況など)")
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, help_text="推薦楽曲の情報を含めた最終更新日時")
     
     class Meta:
         verbose_name = '楽曲推薦'
         verbose_name_plural = '楽曲推薦'
         ordering = ['-created_at']
+        indexes = [
+            # ユーザーごとの新しい順の一覧（キーセットページネーション）用
+            models.Index(fields=['user', '-created_at', '-id'], name='recommendation_user_created'),
+        ]
+
+    # 保存前に設定されたプロンプト・レスポンス（save時にRecommendationPayloadへ書き込む）
+    _pending_payload = None
 
     def __str__(self):
         return f"{self.user.username}への推薦 ({self.created_at.strftime('%Y-%m-%d %H:%M')})"
 
+    def _get_payload_value(self, key):
+        if self._pending_payload and key in self._pending_payload:
+            return self._pending_payload[key]
+        try:
+            payload = self.payload
+        except RecommendationPayload.DoesNotExist:
+            return ''
+        return payload.prompt_text if key == 'prompt_text' else payload.response_text
+
+    def _set_payload_value(self, key, value):
+        if self._pending_payload is None:
+            self._pending_payload = {}
+        self._pending_payload[key] = value
+
+    @property
+    def prompt_text(self):
+        """LLMに送られたプロンプトテキスト"""
+        return self._get_payload_value('prompt_text')
+
+    @prompt_text.setter
+    def prompt_text(self, value):
+        self._set_payload_value('prompt_text', value or '')
+
+    @property
+    def llm_response(self):
+        """LLMからの生のレスポンス"""
+        return self._get_payload_value('llm_response')
+
+    @llm_response.setter
+    def llm_response(self, value):
+        self._set_payload_value('llm_response', stringify_response(value))
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if self._pending_payload:
+            prompt_text = self._get_payload_value('prompt_text')
+            llm_response = self._get_payload_value('llm_response')
+            self.payload = RecommendationPayload.save_for(self, prompt_text, llm_response)
+            self._pending_payload = None
+
 class RecommendedTrack(models.Model):
     """推薦された楽曲モデル"""
     recommendation = models.ForeignKey(Recommendation, on_delete=models.CASCADE, related_name='tracks')
@@ -33,6 +99,52 @@ class RecommendedTrack(models.Model):
         verbose_name = '推薦楽曲'
         verbose_name_plural = '推薦楽曲'
         ordering = ['position']
+        indexes = [
+            # 推薦の詳細で楽曲を並び順どおりに読むため（ソートを省く）
+            models.Index(fields=['recommendation', 'position'], name='recommendedtrack_position'),
+        ]
+        
+    def __str__(self):
+        return f"{self.name} by {self.artist}"
+
+class RecommendationPayload(models.Model):
+    """推薦のプロンプト（可変部分）とLLMの生レスポンスを圧縮して保存するテーブル"""
+    recommendation = models.OneToOneField(Recommendation, on_delete=models.CASCADE, primary_key=True, related_name='payload')
+    prompt_template = models.ForeignKey(PromptTemplate, on_delete=models.PROTECT, blank=True, null=True)
+    prompt_body = models.BinaryField(default=b'', help_text="プロンプトのテンプレート以降の部分（zlib圧縮）")
+    llm_response = models.BinaryField(default=b'', help_text="LLMからの生のレスポンス（zlib圧縮）")
+    
+    class Meta:
+        verbose_name = '推薦ペイロード'
+        verbose_name_plural = '推薦ペイロード'
         
     def __str__(self):
-        return f"{self.name} by {self.artist}"
\ No newline at end of file
+        return f"{self.recommendation_id} のペイロード"
+
+    @property
+    def prompt_text(self):
+        template = self.prompt_template.text if self.prompt_template_id else ''
+        return template + decompress_text(self.prompt_body)
+
+    @property
+    def response_text(self):
+        return decompress_text(self.llm_response)
+
+    @classmethod
+    def save_for(cls, recommendation, prompt_text, llm_response):
+        """プロンプトをテンプレートと可変部分に分け、圧縮して保存"""
+        template_text, body = split_prompt(prompt_text)
+        template = None
+        if template_text:
+            template, _ = PromptTemplate.objects.get_or_create(
+                hash=template_hash(template_text), defaults={'text': template_text}
+            )
+        payload, _ = cls.objects.update_or_create(
+            recommendation=recommendation,
+            defaults={
+                'prompt_template': template,
+                'prompt_body': compress_text(body),
+                'llm_response': compress_text(llm_response),
+            },
+        )
+        return payload
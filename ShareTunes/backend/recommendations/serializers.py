@@ -19,6 +19,15 @@ class RecommendationSerializer(serializers.ModelSerializer):
         model = Recommendation
         fields = ('id', 'context_description', 'created_at', 'tracks')
         
+class RecommendationSummarySerializer(serializers.ModelSerializer):
+    """一覧の要約表示用（楽曲数と先頭数曲のみ）"""
+    track_count = serializers.IntegerField(read_only=True)
+    tracks = RecommendedTrackSerializer(source='preview_tracks', many=True, read_only=True)
+    
+    class Meta:
+        model = Recommendation
+        fields = ('id', 'context_description', 'created_at', 'track_count', 'tracks')
+        
 class RecommendationDetailSerializer(serializers.ModelSerializer):
     tracks = RecommendedTrackSerializer(many=True, read_only=True)
     
@@ -1,14 +1,17 @@
 import json
+import logging
 import requests
 import os
 from django.conf import settings
 from django.utils import timezone
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
 
 import google.generativeai as genai
 
+from sharetunes.metrics import span
 from users.models import UserProfile
+from users.services import create_spotify_client
+
+logger = logging.getLogger(__name__)
 
 class RecommendationService:
     """LLMを活用した音楽推薦サービス"""
@@ -22,12 +25,7 @@ class RecommendationService:
             
         self.spotify_client = None
         if settings.SPOTIFY_CLIENT_ID and settings.SPOTIFY_CLIENT_SECRET:
-            self.spotify_client = spotipy.Spotify(
-                client_credentials_manager=SpotifyClientCredentials(
-                    client_id=settings.SPOTIFY_CLIENT_ID,
-                    client_secret=settings.SPOTIFY_CLIENT_SECRET
-                )
-            )
+            self.spotify_client = create_spotify_client(client_credentials=True)
     
     def get_spotify_user_data(self):
         """
@@ -47,7 +45,7 @@ class RecommendationService:
             return None
             
         # Spotifyクライアント初期化
-        sp = spotipy.Spotify(auth=self.user_profile.spotify_access_token)
+        sp = create_spotify_client(auth=self.user_profile.spotify_access_token)
         
         try:
             # データ取得
@@ -66,7 +64,7 @@ class RecommendationService:
                 'top_tracks': top_tracks
             }
         except Exception as e:
-            print(f"Spotify API error: {str(e)}")
+            logger.warning("Spotify API error: %s", e)
             return None
     
     def _extract_recent_tracks(self, recent_tracks_raw):
@@ -172,7 +170,8 @@ class RecommendationService:
     
     def generate_llm_prompt(self, context=None):
         """LLM用のプロンプトを生成"""
-        spotify_data = self.get_spotify_user_data()
+        with span('spotify_user_data'):
+            spotify_data = self.get_spotify_user_data()
         
         # 基本プロンプトテンプレート
         prompt = """あなたは音楽の専門家として、以下の情報からユーザーに合った楽曲を推薦してください。
@@ -341,7 +340,7 @@ class RecommendationService:
                 ]
             }
         except Exception as e:
-            print(f"Gemini API error: {str(e)}")
+            logger.exception("Gemini API error: %s", e)
             raise
         
     def call_llm_api(self, prompt):
@@ -372,14 +371,16 @@ class RecommendationService:
             try:
                 logger.info(f"プロバイダー '{provider}' を使用して推薦を取得しています...")
                 if provider == 'deepseek':
-                    return self.call_deepseek_api(prompt)
+                    call_api = self.call_deepseek_api
                 elif provider == 'openai':
-                    return self.call_openai_api(prompt)
+                    call_api = self.call_openai_api
                 elif provider == 'gemini':
-                    return self.call_gemini_api(prompt)
+                    call_api = self.call_gemini_api
                 else:
                     logger.warning(f"未知のプロバイダー: {provider} - スキップします")
                     continue
+                with span('llm', provider=provider):
+                    return call_api(prompt)
             except requests.exceptions.RequestException as e:
                 # ネットワーク関連のエラー
                 error_msg = f"{provider} API接続エラー: {str(e)}"
@@ -512,7 +513,7 @@ class RecommendationService:
                 
             return enriched_tracks
         except Exception as e:
-            print(f"Spotify enrichment error: {str(e)}")
+            logger.warning("Spotify enrichment error: %s", e)
             return track_data  # エラー時は元のデータを返す
     
     def get_recommendations(self, context=None):
@@ -533,16 +534,18 @@ class RecommendationService:
         
         try:
             # プロンプト生成
-            prompt = self.generate_llm_prompt(context)
+            with span('prompt'):
+                prompt = self.generate_llm_prompt(context)
             logger.info("推薦用プロンプトを生成しました")
             
-            # LLM API呼び出し
+            # LLM API呼び出し（プロバイダーごとの区間は call_llm_api 内で計測）
             logger.info("LLM APIを呼び出します")
             llm_response = self.call_llm_api(prompt)
             
             # レスポンスパース
             logger.info("LLMレスポンスをパースします")
-            parsed_data = self.parse_llm_response(llm_response)
+            with span('parse'):
+                parsed_data = self.parse_llm_response(llm_response)
 
             if 'recommendations' not in parsed_data:
                 raise ValueError("推薦データが含まれていません")
@@ -552,7 +555,8 @@ class RecommendationService:
                 
             # 楽曲データを充実
             logger.info(f"{len(parsed_data['recommendations'])}件の推薦トラックデータを充実させます")
-            enriched_tracks = self.enrich_track_data(parsed_data['recommendations'])
+            with span('enrich'):
+                enriched_tracks = self.enrich_track_data(parsed_data['recommendations'])
             
             return {
                 'prompt': prompt,
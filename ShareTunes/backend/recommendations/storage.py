@@ -0,0 +1,51 @@
+import hashlib
+import json
+import re
+import zlib
+
+# プロンプトの可変部分（ユーザーの音楽履歴・状況など）は見出しから始まる
+_VARIABLE_SECTION_RE = re.compile(r'\s*\n## ')
+
+# 圧縮レベル（保存時のCPU負荷とサイズのバランス）
+COMPRESSION_LEVEL = 6
+
+
+def split_prompt(prompt):
+    """
+    プロンプトを固定のテンプレート部分と可変部分に分ける
+
+    Returns:
+        tuple: (テンプレート, 可変部分)
+    """
+    prompt = prompt or ''
+    match = _VARIABLE_SECTION_RE.search(prompt)
+    if match is None:
+        return prompt, ''
+    return prompt[:match.start()], prompt[match.start():]
+
+
+def template_hash(text):
+    """テンプレートを一意に識別するハッシュ"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def compress_text(text):
+    """文字列をzlib圧縮したバイト列にする（空の場合は空のバイト列）"""
+    if not text:
+        return b''
+    return zlib.compress(text.encode('utf-8'), COMPRESSION_LEVEL)
+
+
+def decompress_text(data):
+    if not data:
+        return ''
+    return zlib.decompress(bytes(data)).decode('utf-8')
+
+
+def stringify_response(llm_response):
+    """LLMの生レスポンスを保存用の文字列にする（辞書はJSON文字列にする）"""
+    if llm_response is None:
+        return ''
+    if isinstance(llm_response, str):
+        return llm_response
+    return json.dumps(llm_response, ensure_ascii=False, default=str)
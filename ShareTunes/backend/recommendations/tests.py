@@ -0,0 +1,302 @@
+import os
+import tempfile
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from feedbacks.models import Feedback
+from playlists.models import Playlist
+from sharetunes.queries import record_queries
+from sharetunes.testing import assert_max_queries
+from .archive import archive_recommendations, iter_archive_records, restore_archive
+from .models import PromptTemplate, Recommendation, RecommendationPayload, RecommendedTrack
+from .storage import decompress_text, split_prompt
+
+
+class SaveRecommendationAsPlaylistTests(APITestCase):
+    """推薦をプレイリストとして保存するAPI"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='recommendation-owner')
+        cls.recommendation = Recommendation.objects.create(user=cls.user, context_description='雨の日')
+        RecommendedTrack.objects.bulk_create([
+            RecommendedTrack(recommendation=cls.recommendation, spotify_id=f'spotify{position}',
+                             name=f'推薦曲{position}', artist='アーティスト', explanation='', position=position)
+            for position in range(3)
+        ])
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def save(self, data, format=None):
+        return self.client.post(f'/api/recommendations/{self.recommendation.pk}/save_playlist/', data, format=format)
+
+    def test_form_false_values_create_private_playlist(self):
+        for value in ('false', 'False', '0', 'off'):
+            response = self.save({'is_public': value})
+            self.assertEqual(response.status_code, 201, response.data)
+            self.assertFalse(Playlist.objects.get(pk=response.data['playlist']['id']).is_public, value)
+
+    def test_true_values_create_public_playlist(self):
+        for data, format in (({'is_public': 'true'}, None), ({'is_public': True}, 'json')):
+            response = self.save(data, format=format)
+            self.assertEqual(response.status_code, 201, response.data)
+            self.assertTrue(Playlist.objects.get(pk=response.data['playlist']['id']).is_public)
+            self.assertEqual(response.data['added'], 3)
+
+    def test_invalid_is_public_is_rejected(self):
+        response = self.save({'is_public': 'maybe'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('is_public', response.data)
+        self.assertFalse(Playlist.objects.exists())
+
+
+class RecommendationListCacheTests(APITestCase):
+    """推薦一覧のレスポンスキャッシュ"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='recommendation-reader')
+        Recommendation.objects.create(user=cls.user, context_description='朝の通勤')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    @override_settings(RESPONSE_CACHE_ENABLED=True)
+    def test_second_request_is_served_from_cache(self):
+        self.assertEqual(self.client.get('/api/recommendations/')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/api/recommendations/')['X-Cache'], 'HIT')
+
+    @override_settings(RESPONSE_CACHE_ENABLED=False)
+    def test_cache_is_bypassed_when_disabled(self):
+        for _ in range(2):
+            response = self.client.get('/api/recommendations/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['X-Cache'], 'BYPASS')
+            self.assertEqual(len(response.data['results']), 1)
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class RecommendationListQueryBudgetTests(APITestCase):
+    """推薦一覧のクエリ数が、推薦・楽曲の件数によらず一定であること"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='recommendation-list-owner')
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def create_recommendations(self, count, track_count=5):
+        for index in range(count):
+            recommendation = Recommendation.objects.create(user=self.user, context_description=f'推薦{index}')
+            RecommendedTrack.objects.bulk_create([
+                RecommendedTrack(recommendation=recommendation, spotify_id=f'spotify{position}',
+                                 name=f'推薦曲{position}', artist='アーティスト', explanation='', position=position)
+                for position in range(track_count)
+            ])
+
+    def assertConstantQueries(self, limit, path):
+        self.create_recommendations(1)
+        with record_queries() as small:
+            self.assertEqual(self.client.get(path).status_code, 200)
+        self.create_recommendations(15)
+        with assert_max_queries(small.count, max_repeats=1):
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 16)
+        self.assertLessEqual(small.count, limit)
+        return response
+
+    def test_list(self):
+        response = self.assertConstantQueries(3, '/api/recommendations/')
+        self.assertEqual(len(response.data['results'][0]['tracks']), 5)
+
+    def test_summary_list(self):
+        self.assertConstantQueries(3, '/api/recommendations/?summary=1')
+
+
+PROMPT_TEMPLATE = 'あなたは音楽の専門家です。\n以下の情報をもとに曲を推薦してください。'
+
+
+def make_prompt(body):
+    return f'{PROMPT_TEMPLATE}\n## ユーザーの状況\n{body}'
+
+
+class RecommendationPayloadTests(TestCase):
+    """プロンプトとLLMの生レスポンスの圧縮保存"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='payload-owner')
+
+    def create(self, prompt_text, llm_response):
+        return Recommendation.objects.create(user=self.user, prompt_text=prompt_text, llm_response=llm_response)
+
+    def test_round_trip_through_properties(self):
+        prompt = make_prompt('雨の日に聴きたい 🎧')
+        response = {'recommendations': [{'name': '夜に駆ける', 'artist': 'YOASOBI'}]}
+        recommendation = self.create(prompt, response)
+
+        loaded = Recommendation.objects.get(pk=recommendation.pk)
+        self.assertEqual(loaded.prompt_text, prompt)
+        self.assertEqual(loaded.llm_response, '{"recommendations": [{"name": "夜に駆ける", "artist": "YOASOBI"}]}')
+        payload = RecommendationPayload.objects.get(pk=recommendation.pk)
+        self.assertNotIn('雨の日'.encode(), bytes(payload.prompt_body))
+        self.assertEqual(payload.prompt_template.text, PROMPT_TEMPLATE)
+
+        loaded.llm_response = 'updated'
+        loaded.save()
+        loaded = Recommendation.objects.get(pk=recommendation.pk)
+        self.assertEqual((loaded.prompt_text, loaded.llm_response), (prompt, 'updated'))
+
+    def test_empty_and_template_less_prompts(self):
+        self.assertEqual(Recommendation.objects.create(user=self.user).prompt_text, '')
+        recommendation = self.create('テンプレートのないプロンプト', None)
+        loaded = Recommendation.objects.get(pk=recommendation.pk)
+        self.assertEqual((loaded.prompt_text, loaded.llm_response), ('テンプレートのないプロンプト', ''))
+
+    def test_same_template_is_stored_once(self):
+        first = self.create(make_prompt('朝の通勤'), 'a')
+        second = self.create(make_prompt('夜のドライブ'), 'b')
+
+        self.assertEqual(PromptTemplate.objects.count(), 1)
+        self.assertEqual(first.payload.prompt_template_id, second.payload.prompt_template_id)
+        self.assertEqual(Recommendation.objects.get(pk=second.pk).prompt_text, make_prompt('夜のドライブ'))
+
+
+class PayloadMigrationTests(TransactionTestCase):
+    """プロンプトとレスポンスをペイロードのテーブルへ移すマイグレーション（0004）"""
+
+    before = [('recommendations', '0003_recommendation_updated_at')]
+    after = [('recommendations', '0004_prompttemplate_recommendationpayload_and_more')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_forward_and_backward_preserve_text(self):
+        old_apps = self.migrate(self.before)
+        user = old_apps.get_model('auth', 'User').objects.create(username='migration-owner')
+        OldRecommendation = old_apps.get_model('recommendations', 'Recommendation')
+        rows = {
+            'template': (make_prompt('雨の日'), '{"recommendations": []}'),
+            'shared': (make_prompt('晴れの日'), 'ok'),
+            'plain': ('テンプレートなし', ''),
+            'empty': ('', ''),
+        }
+        ids = {
+            key: OldRecommendation.objects.create(user=user, prompt_text=prompt, llm_response=response).pk
+            for key, (prompt, response) in rows.items()
+        }
+
+        new_apps = self.migrate(self.after)
+        Payload = new_apps.get_model('recommendations', 'RecommendationPayload')
+        self.assertEqual(new_apps.get_model('recommendations', 'PromptTemplate').objects.count(), 2)
+        for key, (prompt, response) in rows.items():
+            payload = Payload.objects.select_related('prompt_template').get(recommendation_id=ids[key])
+            template = payload.prompt_template.text if payload.prompt_template else ''
+            self.assertEqual(template, split_prompt(prompt)[0])
+            self.assertEqual(template + decompress_text(payload.prompt_body), prompt)
+            self.assertEqual(decompress_text(payload.llm_response), response)
+
+        old_apps = self.migrate(self.before)
+        restored = old_apps.get_model('recommendations', 'Recommendation').objects.in_bulk(ids.values())
+        for key, (prompt, response) in rows.items():
+            self.assertEqual((restored[ids[key]].prompt_text, restored[ids[key]].llm_response), (prompt, response))
+
+
+class ArchiveRecommendationsTests(TestCase):
+    """古い推薦のアーカイブと復元"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        cls.user = User.objects.create(username='archive-owner')
+        cls.old = [cls.create_recommendation(f'古い推薦{index}', days=100 + index) for index in range(3)]
+        cls.recent = cls.create_recommendation('新しい推薦', days=1)
+
+    @classmethod
+    def create_recommendation(cls, context, days):
+        recommendation = Recommendation.objects.create(
+            user=cls.user, context_description=context,
+            prompt_text=make_prompt(context), llm_response={'context': context},
+        )
+        tracks = RecommendedTrack.objects.bulk_create([
+            RecommendedTrack(recommendation=recommendation, spotify_id=f'{context}{position}', name=f'曲{position}',
+                             artist='歌手', album='アルバム', image_url='https://example.com/a.jpg',
+                             explanation=f'{context}に合う', position=position)
+            for position in range(2)
+        ])
+        Feedback.objects.create(user=cls.user, track=tracks[0], feedback_type='like', comment='良い')
+        created_at = cls.now - timedelta(days=days)
+        Recommendation.objects.filter(pk=recommendation.pk).update(created_at=created_at, updated_at=created_at)
+        return recommendation
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.archive_dir = directory.name
+
+    def snapshot(self, recommendation_ids):
+        """推薦・ペイロード・楽曲・フィードバックの内容（比較用）"""
+        recommendations = Recommendation.objects.filter(id__in=recommendation_ids).order_by('id')
+        return [
+            {
+                'fields': (recommendation.id, recommendation.user_id, recommendation.context_description,
+                           recommendation.created_at, recommendation.updated_at),
+                'payload': (recommendation.prompt_text, recommendation.llm_response),
+                'tracks': list(recommendation.tracks.order_by('id').values()),
+                'feedbacks': list(Feedback.objects.filter(track__recommendation=recommendation)
+                                  .order_by('id').values()),
+            }
+            for recommendation in recommendations
+        ]
+
+    def archive(self, **kwargs):
+        return archive_recommendations(self.now - timedelta(days=30), self.archive_dir, **kwargs)
+
+    def test_only_rows_older_than_cutoff_are_archived(self):
+        dry_run = self.archive(dry_run=True)
+        self.assertEqual((dry_run.recommendations, dry_run.tracks, dry_run.feedbacks), (3, 6, 3))
+        self.assertEqual(os.listdir(self.archive_dir), [])
+
+        stats = self.archive(batch_size=2)
+
+        self.assertEqual((stats.recommendations, stats.tracks, stats.feedbacks, stats.batches), (3, 6, 3, 2))
+        self.assertEqual(list(Recommendation.objects.values_list('id', flat=True)), [self.recent.pk])
+        self.assertEqual(RecommendedTrack.objects.count(), 2)
+        self.assertEqual(Feedback.objects.count(), 1)
+        self.assertFalse(RecommendationPayload.objects.exclude(recommendation=self.recent).exists())
+        records = [record for path in stats.files for record in iter_archive_records(path)]
+        self.assertEqual(sorted(record['id'] for record in records), sorted(item.pk for item in self.old))
+
+    def test_archive_and_restore_round_trip(self):
+        ids = [recommendation.pk for recommendation in self.old]
+        before = self.snapshot(ids)
+
+        stats = self.archive(batch_size=2)
+        self.assertFalse(Recommendation.objects.filter(id__in=ids).exists())
+        for path in stats.files:
+            restore_archive(path, batch_size=2)
+
+        self.assertEqual(self.snapshot(ids), before)
+        self.assertEqual(PromptTemplate.objects.count(), 1)
+
+        # 同じファイルをもう一度復元しても重複しない
+        restored = restore_archive(next(iter(stats.files)))
+        self.assertEqual((restored.recommendations, restored.skipped), (0, 3))
+        self.assertEqual(Recommendation.objects.count(), 4)
@@ -6,6 +6,10 @@ urlpatterns = [
     path('', views.RecommendationViewSet.as_view({'get': 'list'}), name='recommendation-list'),
     # 個別の推薦詳細取得（GET）
     path('<int:pk>/', views.RecommendationViewSet.as_view({'get': 'retrieve'}), name='recommendation-detail'),
+    # 推薦をプレイリストとして保存（POST）
+    path('<int:pk>/save_playlist/', views.save_recommendation_as_playlist, name='save_recommendation_as_playlist'),
     # 新しい推薦生成（POST）
     path('generate/', views.generate_recommendation, name='generate_recommendation'),
+    # 推薦履歴のエクスポート（GET、NDJSON/CSV）
+    path('export/', views.export_recommendations, name='export_recommendations'),
 ]
\ No newline at end of file
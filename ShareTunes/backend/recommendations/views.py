@@ -1,42 +1,194 @@
-import traceback
+import contextvars
+import logging
 import time
 from concurrent.futures import ThreadPoolExecutor, TimeoutError
-from django.shortcuts import render
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Prefetch, Subquery
+from django.db.models.functions import Coalesce
+from django.shortcuts import get_object_or_404, render
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status, viewsets
 
+from sharetunes.conditional import conditional_response, make_etag
+from sharetunes.exports import export_response
+from sharetunes.metrics import span
+from sharetunes.profiling import profile_thread
+from sharetunes.pagination import CreatedAtKeysetPagination
+from .cache import cached_list_response, invalidate_recommendation_list
 from .models import Recommendation, RecommendedTrack
-from .serializers import RecommendationSerializer, RecommendationDetailSerializer
+from .serializers import RecommendationSerializer, RecommendationDetailSerializer, RecommendationSummarySerializer
 from .services import RecommendationService
+from playlists.models import Playlist
+from playlists.serializers import PlaylistDetailSerializer, PlaylistSerializer
+from playlists.services import add_tracks_to_playlist, invalidate_public_feed
+from tracks.models import Track
+from tracks.services import upsert_tracks
+
+logger = logging.getLogger(__name__)
+
+# 一覧の要約表示（?summary=1）で返す楽曲数の既定値と上限
+SUMMARY_TRACK_LIMIT = 3
+MAX_SUMMARY_TRACK_LIMIT = 10
 
 class RecommendationViewSet(viewsets.ModelViewSet):
     """推薦リストのCRUD操作用ViewSet"""
     serializer_class = RecommendationSerializer
     # テスト用に一時的にパーミッションを緩和
     permission_classes = [AllowAny]
+    pagination_class = CreatedAtKeysetPagination
     
-    def get_queryset(self):
+    def get_owned_queryset(self):
         # 認証されていない場合は空のクエリセットを返す
         if not self.request.user.is_authenticated:
             return Recommendation.objects.none()
         return Recommendation.objects.filter(user=self.request.user)
+    
+    def get_queryset(self):
+        queryset = self.get_owned_queryset()
+        # 推薦ごとの楽曲クエリを発行しないよう、楽曲はまとめて取得する
+        # プロンプトとLLMの生レスポンス（RecommendationPayload）は詳細でのみ読み込む
+        if self.action == 'retrieve':
+            return queryset.select_related('payload__prompt_template').prefetch_related('tracks')
+        
+        if not self.is_summary():
+            return queryset.prefetch_related('tracks')
+        
+        # 要約表示では楽曲数と先頭N曲のみを返す
+        track_count = (RecommendedTrack.objects
+                       .filter(recommendation=OuterRef('pk'))
+                       .order_by()
+                       .values('recommendation')
+                       .annotate(count=Count('id'))
+                       .values('count'))
+        return queryset.annotate(track_count=Coalesce(Subquery(track_count), 0)).prefetch_related(Prefetch(
+            'tracks',
+            queryset=RecommendedTrack.objects.order_by('position')[:self.get_summary_track_limit()],
+            to_attr='preview_tracks',
+        ))
+    
+    def is_summary(self):
+        return self.action == 'list' and self.request.query_params.get('summary') in ('1', 'true')
+    
+    def get_summary_track_limit(self):
+        """要約表示で返す楽曲数（summary_tracks クエリパラメータ）"""
+        try:
+            limit = int(self.request.query_params.get('summary_tracks', SUMMARY_TRACK_LIMIT))
+        except ValueError:
+            limit = SUMMARY_TRACK_LIMIT
+        return max(0, min(limit, MAX_SUMMARY_TRACK_LIMIT))
         
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return RecommendationDetailSerializer
+        if self.is_summary():
+            return RecommendationSummarySerializer
         return RecommendationSerializer
+    
+    def list(self, request, *args, **kwargs):
+        """
+        推薦一覧
+        
+        更新日時の最新値と件数が変わっていなければ304を返し、変わっていればユーザーごとに
+        キャッシュしたページを返す。
+        """
+        if not request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        watermark = self.get_owned_queryset().aggregate(latest=Max('updated_at'), count=Count('id'))
+        etag = make_etag(request, watermark['latest'], watermark['count'])
+        return conditional_response(request, etag, lambda: cached_list_response(
+            request, etag, lambda: super(RecommendationViewSet, self).list(request, *args, **kwargs)
+        ))
+    
+    def retrieve(self, request, *args, **kwargs):
+        """推薦詳細（推薦と楽曲数が変わっていなければ304を返す）"""
+        watermark = (self.get_owned_queryset()
+                     .filter(pk=kwargs.get('pk'))
+                     .annotate(track_count=Count('tracks'))
+                     .values_list('updated_at', 'track_count')
+                     .first())
+        etag = make_etag(request, *watermark) if watermark else None
+        return conditional_response(request, etag, lambda: super(RecommendationViewSet, self).retrieve(request, *args, **kwargs))
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_recommendations(request):
+    """ユーザーの推薦履歴をNDJSON/CSVでストリーミング出力するAPI"""
+    return export_response(request, 'recommendations')
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def save_recommendation_as_playlist(request, pk):
+    """
+    推薦された楽曲をプレイリストとして保存するAPI
+    
+    リクエスト:
+        playlist: 追加先の既存プレイリストID（省略時は新しいプレイリストを作成）
+        name, description, is_public: 新しく作成するプレイリストの情報
+    """
+    recommendation = get_object_or_404(Recommendation, pk=pk, user=request.user)
+    
+    playlist = None
+    playlist_id = request.data.get('playlist')
+    if playlist_id:
+        playlist = Playlist.objects.filter(pk=playlist_id, user=request.user).first()
+        if playlist is None:
+            return Response(
+                {"playlist": "指定されたプレイリストが見つかりません。"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+    
+    else:
+        # 新しいプレイリストの情報はプレイリスト作成APIと同じシリアライザーで検証する
+        # （フォーム送信の is_public="false" などを真偽値として正しく解釈するため）
+        playlist_serializer = PlaylistSerializer(data={
+            'name': (request.data.get('name')
+                     or recommendation.context_description
+                     or f"おすすめ {recommendation.created_at.strftime('%Y-%m-%d %H:%M')}"),
+            'description': request.data.get('description'),
+            'is_public': request.data.get('is_public', False),
+        })
+        playlist_serializer.is_valid(raise_exception=True)
+    
+    recommended_tracks = list(recommendation.tracks.order_by('position').values(
+        'spotify_id', 'name', 'artist', 'album', 'image_url', 'preview_url'
+    ))
+    
+    with transaction.atomic():
+        if playlist is None:
+            playlist = playlist_serializer.save(user=request.user)
+            if playlist.is_public:
+                transaction.on_commit(invalidate_public_feed)
+        
+        # 推薦楽曲をTrackカタログへまとめて登録し、推薦順に並べてプレイリストへ追加
+        spotify_ids = upsert_tracks(recommended_tracks)
+        tracks = Track.objects.in_bulk(spotify_ids, field_name='spotify_id')
+        playlist_tracks, skipped = add_tracks_to_playlist(
+            playlist,
+            [tracks[row['spotify_id']] for row in recommended_tracks if row['spotify_id'] in tracks]
+        )
+    
+    return Response({
+        'playlist': PlaylistDetailSerializer(playlist).data,
+        'added': len(playlist_tracks),
+        'skipped': [track.pk for track in skipped],
+    }, status=status.HTTP_201_CREATED)
 
 def execute_with_timeout(func, args=None, kwargs=None, timeout=60):
-    """指定された関数をタイムアウト付きで実行する"""
+    """
+    指定された関数をタイムアウト付きで実行する
+
+    関数は別スレッドで実行されるため、呼び出し元のコンテキスト変数（リクエストIDや
+    Server-Timing の計測結果）を引き継ぎ、リクエストをプロファイル中であればそのスレッドも計測する。
+    """
     if args is None:
         args = []
     if kwargs is None:
         kwargs = {}
         
     with ThreadPoolExecutor(max_workers=1) as executor:
-        future = executor.submit(func, *args, **kwargs)
+        future = executor.submit(contextvars.copy_context().run, profile_thread(func), *args, **kwargs)
         try:
             return future.result(timeout=timeout)
         except TimeoutError:
@@ -48,17 +200,14 @@ def execute_with_timeout(func, args=None, kwargs=None, timeout=60):
 def generate_recommendation(request):
     """LLMを使用して新しい音楽推薦を生成するAPI"""
     start_time = time.time()
-    print('==== 推薦生成リクエスト受信 ====')
-    print(f'リクエストデータ: {request.data}')
-    print(f'認証ヘッダー: {request.headers.get("Authorization", "なし")}')
+    logger.debug('推薦生成リクエスト受信: %s', request.data)
     
     context = request.data.get('context', None)
-    print(f'コンテキスト: {context}')
     
     try:
         # テスト用に認証チェックを追加
         if not request.user.is_authenticated:
-            print('未認証ユーザー - デモモードで応答')
+            logger.info('未認証ユーザー - デモモードで応答')
             # デモ用の応答を返す（実際のアプリでは認証が必要）
             return Response({
                 "message": "デモモード: 実際の推薦を生成するには認証が必要です",
@@ -83,15 +232,13 @@ def generate_recommendation(request):
             })
             
         # 認証済みユーザー向けのフル機能
-        print(f'認証ユーザー: {request.user.username}')
+        logger.info('推薦生成を開始します', extra={'user_id': request.user.pk, 'context': context})
         
         # 推薦サービス初期化
         try:
             service = RecommendationService(request.user)
-            print('RecommendationServiceの初期化成功')
         except Exception as service_init_error:
-            print(f'サービス初期化エラー: {str(service_init_error)}')
-            traceback.print_exc()
+            logger.exception('サービス初期化エラー: %s', service_init_error)
             return Response(
                 {"error": f"推薦サービスの初期化に失敗しました: {str(service_init_error)}"}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -105,16 +252,15 @@ def generate_recommendation(request):
                 kwargs={"context": context}, 
                 timeout=90
             )
-            print(f'推薦生成成功（所要時間: {time.time() - start_time:.2f}秒）')
+            logger.info('推薦生成成功（所要時間: %.2f秒）', time.time() - start_time)
         except TimeoutError as timeout_err:
-            print(f'推薦生成がタイムアウトしました: {str(timeout_err)}')
+            logger.warning('推薦生成がタイムアウトしました: %s', timeout_err)
             return Response(
                 {"error": f"推薦生成に時間がかかりすぎています。しばらく経ってからもう一度お試しください。"}, 
                 status=status.HTTP_504_GATEWAY_TIMEOUT
             )
         except Exception as rec_error:
-            print(f'推薦生成エラー: {str(rec_error)}')
-            traceback.print_exc()
+            logger.exception('推薦生成エラー: %s', rec_error)
             return Response(
                 {"error": f"推薦生成中にエラーが発生しました: {str(rec_error)}"}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -122,42 +268,62 @@ def generate_recommendation(request):
         
         # データベースに保存
         try:
-            recommendation = Recommendation.objects.create(
-                user=request.user,
-                prompt_text=result['prompt'],
-                llm_response=result['llm_response'],
-                context_description=result['context']
-            )
-            
-            # 各トラックを保存
-            for track_data in result['tracks']:
-                RecommendedTrack.objects.create(
-                    recommendation=recommendation,
-                    spotify_id=track_data.get('spotify_id', ''),
-                    name=track_data['track_name'],
-                    artist=track_data['artist_name'],
-                    album=track_data.get('album_name', ''),
-                    image_url=track_data.get('image_url', ''),
-                    preview_url=track_data.get('preview_url', ''),
-                    explanation=track_data['explanation'],
-                    position=track_data.get('position', 0)
+            # 推薦・楽曲・カタログへの書き込みは、途中で失敗した場合にすべて取り消す
+            with span('db_write'), transaction.atomic():
+                recommendation = Recommendation.objects.create(
+                    user=request.user,
+                    prompt_text=result['prompt'],
+                    llm_response=result['llm_response'],
+                    context_description=result['context']
                 )
-            
+
+                # 各トラックを1文でまとめて保存
+                recommended_tracks = RecommendedTrack.objects.bulk_create([
+                    RecommendedTrack(
+                        recommendation=recommendation,
+                        spotify_id=track_data.get('spotify_id', ''),
+                        name=track_data['track_name'],
+                        artist=track_data['artist_name'],
+                        album=track_data.get('album_name', ''),
+                        image_url=track_data.get('image_url', ''),
+                        preview_url=track_data.get('preview_url', ''),
+                        explanation=track_data['explanation'],
+                        position=track_data.get('position', 0)
+                    )
+                    for track_data in result['tracks']
+                ])
+
+                # Spotify IDが判明した楽曲を共有のTrackカタログへupsert
+                upsert_tracks(
+                    {
+                        'spotify_id': track.spotify_id,
+                        'name': track.name,
+                        'artist': track.artist,
+                        'album': track.album,
+                        'image_url': track.image_url,
+                        'preview_url': track.preview_url,
+                    }
+                    for track in recommended_tracks
+                )
+
+                # 推薦一覧のキャッシュはコミット後に破棄する
+                user_id = request.user.pk
+                transaction.on_commit(lambda: invalidate_recommendation_list(user_id))
+
             # レスポンス形式にシリアライズ
-            serializer = RecommendationDetailSerializer(recommendation)
-            print(f'全処理完了（所要時間: {time.time() - start_time:.2f}秒）')
-            return Response(serializer.data)
+            with span('serialize'):
+                data = RecommendationDetailSerializer(recommendation).data
+            logger.info('全処理完了（所要時間: %.2f秒）', time.time() - start_time)
+            return Response(data)
         except Exception as db_error:
-            print(f'データベース保存エラー: {str(db_error)}')
-            traceback.print_exc()
+            logger.exception('データベース保存エラー: %s', db_error)
             return Response(
                 {"error": f"推薦結果のデータベース保存中にエラーが発生しました: {str(db_error)}"}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
         
     except Exception as e:
-        print(f'全体エラー: {str(e)}')
-        traceback.print_exc()
+        logger.exception('全体エラー: %s', e)
         return Response(
             {"error": str(e)}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
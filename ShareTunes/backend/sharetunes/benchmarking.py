@@ -0,0 +1,77 @@
+import statistics
+import time
+import timeit
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+def percentile(values, ratio):
+    """ソート済みでない値のリストからパーセンタイル値を求める（最近傍法）"""
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(ratio * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(timings):
+    """計測値（ミリ秒）の要約を1行の文字列にする"""
+    return (
+        f'n={len(timings)} '
+        f'mean={statistics.mean(timings):.2f}ms '
+        f'p50={percentile(timings, 0.50):.2f}ms '
+        f'p95={percentile(timings, 0.95):.2f}ms '
+        f'p99={percentile(timings, 0.99):.2f}ms'
+    )
+
+
+def measure(func, repeat=20, warmup=2):
+    """関数を繰り返し実行して各回の所要時間（ミリ秒）を返す"""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def measure_per_call(func, repeat=15, min_sample_time=0.02):
+    """
+    短い関数の1回あたりの所要時間（マイクロ秒）を repeat 回計測する
+
+    1回の計測が min_sample_time 秒以上になるまで呼び出し回数を倍にしていき、
+    その間の実行をウォームアップとする。
+
+    Returns:
+        tuple: (各回の1呼び出しあたりのマイクロ秒のリスト, 1回の計測での呼び出し回数)
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while timer.timeit(number) < min_sample_time:
+        number *= 2
+    return [timer.timeit(number) / number * 1e6 for _ in range(repeat)], number
+
+
+@contextmanager
+def benchmark_database(test_name=None):
+    """
+    ベンチマーク用のテストDBを作成し、終了時に破棄する
+
+    本番のDBにデータを書き込まずに、マイグレーション済みのスキーマで計測するために使う。
+
+    Args:
+        test_name (str, optional): テストDBの名前。SQLiteでは既定でメモリ上のDBになるため、
+            複数のスレッドから同時に書き込む計測ではファイルのパスを指定する
+    """
+    old_name = connection.settings_dict['NAME']
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_test_name = test_settings.get('NAME')
+    if test_name:
+        test_settings['NAME'] = test_name
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings['NAME'] = old_test_name
@@ -0,0 +1,48 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def make_etag(request, *parts):
+    """
+    リソースの更新日時・件数などからETagを作る
+
+    同じURLでもユーザーやホストでレスポンスが変わるため、URLとユーザーIDも含める。
+    """
+    user_id = request.user.pk if request.user.is_authenticated else None
+    source = '|'.join(str(part) for part in (request.build_absolute_uri(), user_id, *parts))
+    return quote_etag(hashlib.md5(source.encode('utf-8')).hexdigest())
+
+
+def conditional_response(request, etag, build_response):
+    """
+    If-None-Match がETagと一致すればシリアライズせずに304を返す
+
+    ETagの計算は1回の集計クエリで済ませ、一致しない場合のみ build_response でレスポンスを作る。
+
+    Args:
+        request: リクエスト
+        etag (str): make_etag で作ったETag。Noneの場合は条件付きGETを行わない
+        build_response (callable): 通常のレスポンスを返す関数
+
+    Returns:
+        Response: 304 または build_response の結果（ETag付き）
+    """
+    if etag is None:
+        return build_response()
+
+    if get_conditional_response(request, etag=etag) is not None:
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = build_response()
+        if response.status_code != 200:
+            return response
+    response['ETag'] = etag
+
+    # ブラウザにはキャッシュした内容を毎回再検証させ、共有キャッシュには保存させない
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    return response
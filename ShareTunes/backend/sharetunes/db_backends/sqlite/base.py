@@ -0,0 +1,55 @@
+import re
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+# 接続ごとに設定できるPRAGMA（値はsettingsから渡すが、SQLに埋め込むため名前と値の形式を確認する）
+ALLOWED_PRAGMAS = ('journal_mode', 'busy_timeout', 'synchronous', 'mmap_size', 'cache_size', 'temp_store',
+                   'foreign_keys', 'wal_autocheckpoint')
+PRAGMA_VALUE_RE = re.compile(r'^(-?\d+|[A-Za-z_]+)$')
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+def apply_pragmas(connection, pragmas):
+    """
+    sqlite3の接続にPRAGMAを設定する
+
+    Args:
+        connection: sqlite3.Connection
+        pragmas (dict): PRAGMA名をキーとする設定値
+    """
+    for name, value in pragmas.items():
+        if name not in ALLOWED_PRAGMAS:
+            raise ImproperlyConfigured(f"未対応のPRAGMAです: {name}")
+        if not PRAGMA_VALUE_RE.match(str(value)):
+            raise ImproperlyConfigured(f"PRAGMA {name} の値が不正です: {value}")
+        connection.execute(f'PRAGMA {name} = {value}')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    接続ごとにPRAGMAを設定するSQLiteバックエンド
+
+    OPTIONS:
+        pragmas (dict): 新しい接続を開くたびに設定するPRAGMA
+        transaction_mode (str): atomic() で開始するトランザクションの種類。
+            IMMEDIATE にすると書き込みロックを最初に取るため、読み取りから書き込みへの昇格時に
+            busy_timeout を待たずに "database is locked" になることがない
+    """
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = params.pop('pragmas', {})
+        self.transaction_mode = (params.pop('transaction_mode', None) or 'DEFERRED').upper()
+        if self.transaction_mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(f"transaction_mode は {', '.join(TRANSACTION_MODES)} のいずれかです")
+        return params
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        apply_pragmas(connection, self.pragmas)
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
@@ -0,0 +1,215 @@
+import csv
+import io
+import zlib
+from datetime import datetime
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from rest_framework import status
+from rest_framework.response import Response
+
+from recommendations.models import Recommendation, RecommendedTrack
+from tracks.models import UserTrackHistory
+
+# 1回のクエリで読み込む行数
+EXPORT_BATCH_SIZE = 1000
+
+# 出力をまとめて書き出すバッファサイズ（バイト）
+EXPORT_FLUSH_SIZE = 64 * 1024
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+
+HISTORY_FIELDS = ('id', 'user_id', 'played_at', 'spotify_id', 'name', 'artist', 'album')
+
+RECOMMENDATION_FIELDS = ('id', 'user_id', 'created_at', 'context_description')
+RECOMMENDED_TRACK_FIELDS = ('position', 'spotify_id', 'name', 'artist', 'album', 'explanation')
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+def iter_keyset(queryset, batch_size=EXPORT_BATCH_SIZE):
+    """
+    クエリセットをIDのキーセットで分割して読み込む
+
+    全件を一度にメモリへ載せず、カーソルも開いたままにしないため、件数によらずメモリ使用量が一定になる。
+    values() のクエリセットを渡した場合は id を含めること。
+
+    Yields:
+        list: batch_size件ごとの行
+    """
+    last_id = 0
+    queryset = queryset.order_by('id')
+    while True:
+        batch = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last = batch[-1]
+        last_id = last['id'] if isinstance(last, dict) else last.id
+
+
+def iter_history_records(user=None, batch_size=EXPORT_BATCH_SIZE):
+    """再生履歴を1再生1レコードで出力"""
+    queryset = UserTrackHistory.objects.all()
+    if user is not None:
+        queryset = queryset.filter(user=user)
+    queryset = queryset.values(
+        'id', 'user_id', 'played_at',
+        'track__spotify_id', 'track__name', 'track__artist', 'track__album',
+    )
+    for batch in iter_keyset(queryset, batch_size):
+        for row in batch:
+            yield {
+                'id': row['id'],
+                'user_id': row['user_id'],
+                'played_at': row['played_at'],
+                'spotify_id': row['track__spotify_id'],
+                'name': row['track__name'],
+                'artist': row['track__artist'],
+                'album': row['track__album'],
+            }
+
+
+def iter_recommendation_records(user=None, batch_size=EXPORT_BATCH_SIZE):
+    """推薦を1推薦1レコード（楽曲はtracksに入れ子）で出力"""
+    queryset = Recommendation.objects.all()
+    if user is not None:
+        queryset = queryset.filter(user=user)
+    queryset = queryset.values(*RECOMMENDATION_FIELDS)
+    for batch in iter_keyset(queryset, batch_size):
+        # バッチ内の推薦楽曲は1クエリでまとめて取得
+        tracks = {}
+        for track in (RecommendedTrack.objects
+                      .filter(recommendation_id__in=[row['id'] for row in batch])
+                      .order_by('recommendation_id', 'position')
+                      .values('recommendation_id', *RECOMMENDED_TRACK_FIELDS)):
+            tracks.setdefault(track.pop('recommendation_id'), []).append(track)
+        for row in batch:
+            yield {**row, 'tracks': tracks.get(row['id'], [])}
+
+
+def flatten_recommendation_records(records):
+    """CSV用に推薦楽曲1曲を1行に展開"""
+    for record in records:
+        recommendation = {f'recommendation_{key}' if key == 'id' else key: value
+                          for key, value in record.items() if key != 'tracks'}
+        for track in record['tracks'] or [{}]:
+            yield {**recommendation, **track}
+
+
+FLAT_RECOMMENDATION_FIELDS = (
+    ('recommendation_id',) + RECOMMENDATION_FIELDS[1:] + RECOMMENDED_TRACK_FIELDS
+)
+
+
+def _buffered(pieces, flush_size=EXPORT_FLUSH_SIZE):
+    """細かい文字列をUTF-8にエンコードし、flush_size バイト以上になるごとにまとめて出力する"""
+    buffer = []
+    size = 0
+    for piece in pieces:
+        encoded = piece.encode('utf-8')
+        buffer.append(encoded)
+        size += len(encoded)
+        if size >= flush_size:
+            yield b''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def ndjson_chunks(records):
+    """レコードをNDJSON（1行1JSON）のバイト列チャンクとして出力"""
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    return _buffered(encoder.encode(record) + '\n' for record in records)
+
+
+def csv_chunks(records, fieldnames):
+    """レコードをヘッダー付きCSVのバイト列チャンクとして出力"""
+    def lines():
+        line = io.StringIO()
+        writer = csv.DictWriter(line, fieldnames=fieldnames, extrasaction='ignore')
+        writer.writeheader()
+        for record in records:
+            writer.writerow({
+                key: value.isoformat() if isinstance(value, datetime) else value
+                for key, value in record.items()
+            })
+            yield line.getvalue()
+            line.seek(0)
+            line.truncate()
+        yield line.getvalue()
+
+    return _buffered(lines())
+
+
+def gzip_chunks(chunks):
+    """バイト列チャンクを逐次gzip圧縮"""
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_chunks(kind, export_format='ndjson', user=None, compress=False):
+    """
+    エクスポート内容をバイト列チャンクのジェネレーターとして返す
+
+    Args:
+        kind (str): 'history' または 'recommendations'
+        export_format (str): 'ndjson' または 'csv'
+        user (User, optional): 対象ユーザー。省略時は全ユーザー
+        compress (bool): gzip圧縮するか
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"未対応の出力形式です: {export_format}")
+
+    if kind == 'history':
+        records = iter_history_records(user)
+        fieldnames = HISTORY_FIELDS
+    elif kind == 'recommendations':
+        records = iter_recommendation_records(user)
+        fieldnames = FLAT_RECOMMENDATION_FIELDS
+        if export_format == 'csv':
+            records = flatten_recommendation_records(records)
+    else:
+        raise ValueError(f"未対応のエクスポート種別です: {kind}")
+
+    if export_format == 'ndjson':
+        chunks = ndjson_chunks(records)
+    else:
+        chunks = csv_chunks(records, fieldnames)
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def export_response(request, kind):
+    """
+    エクスポートをストリーミングレスポンスとして返す
+
+    クエリパラメータ:
+        output: ndjson（デフォルト）または csv
+        gzip: 1 の場合はgzip圧縮したファイルとして返す
+    """
+    export_format = request.query_params.get('output', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return Response(
+            {"output": f"出力形式は {', '.join(EXPORT_FORMATS)} のいずれかを指定してください。"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    compress = request.query_params.get('gzip') in ('1', 'true')
+    chunks = export_chunks(kind, export_format, user=request.user, compress=compress)
+
+    filename = f"{kind}.{export_format}"
+    content_type = CONTENT_TYPES[export_format]
+    if compress:
+        filename += '.gz'
+        content_type = 'application/gzip'
+
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
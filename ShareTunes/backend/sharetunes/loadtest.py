@@ -0,0 +1,322 @@
+import json
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, urlparse
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+import requests
+
+from .benchmarking import percentile
+
+
+@dataclass
+class Latency:
+    """
+    スタブの応答までの待ち時間の分布
+
+    中央値とp95（ミリ秒）から対数正規分布を決める。p95を省略した場合は固定の待ち時間。
+    """
+    median_ms: float = 0.0
+    p95_ms: float = 0.0
+
+    @classmethod
+    def parse(cls, spec):
+        """"800" または "800,2000"（中央値,p95）の形式の文字列から作る"""
+        values = [float(value) for value in str(spec).split(',')]
+        if len(values) == 1:
+            return cls(values[0], values[0])
+        return cls(values[0], values[1])
+
+    def sample(self):
+        """待ち時間（秒）を1つ取り出す"""
+        if self.median_ms <= 0:
+            return 0.0
+        if self.p95_ms <= self.median_ms:
+            return self.median_ms / 1000
+        sigma = math.log(self.p95_ms / self.median_ms) / 1.645
+        return random.lognormvariate(math.log(self.median_ms), sigma) / 1000
+
+
+@dataclass
+class StubBehavior:
+    """
+    スタブのサーバーの振る舞い
+
+    Args:
+        latency (Latency): 応答までの待ち時間
+        error_rate (float): 503を返す割合
+        items (int): 一覧・推薦で返す件数
+        padding (int): 各項目の説明文に足す文字数（レスポンスの大きさの調整）
+    """
+    latency: Latency = field(default_factory=Latency)
+    error_rate: float = 0.0
+    items: int = 10
+    padding: int = 0
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._respond()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.body = self.rfile.read(length) if length else b''
+        self._respond()
+
+    def _respond(self):
+        stub = self.server.stub
+        time.sleep(stub.behavior.latency.sample())
+        if random.random() < stub.behavior.error_rate:
+            stub.count(error=True)
+            self._send(503, {'error': {'status': 503, 'message': 'stub error'}})
+            return
+        stub.count(error=False)
+        url = urlparse(self.path)
+        payload = self.build(url.path, parse_qs(url.query), stub.behavior)
+        if payload is None:
+            self._send(404, {'error': {'status': 404, 'message': f'unknown path {url.path}'}})
+        else:
+            self._send(200, payload)
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def build(self, path, query, behavior):
+        raise NotImplementedError
+
+
+def _spotify_track(index, padding=0):
+    return {
+        'id': f'stubtrack{index:06d}',
+        'name': f'Stub Track {index}' + 'x' * padding,
+        'preview_url': f'https://p.scdn.co/mp3-preview/stub{index}',
+        'artists': [{'id': f'stubartist{index % 50:04d}', 'name': f'Stub Artist {index % 50}'}],
+        'album': {
+            'id': f'stubalbum{index % 100:04d}',
+            'name': f'Stub Album {index % 100}',
+            'images': [{'url': f'https://i.scdn.co/image/stub{index}', 'height': 640, 'width': 640}],
+        },
+    }
+
+
+class SpotifyStubHandler(_StubHandler):
+    """Spotify Web API とトークン発行のうち、アプリが使うエンドポイントのスタブ"""
+
+    def build(self, path, query, behavior):
+        if path == '/api/token':
+            return {'access_token': 'stub-access-token', 'token_type': 'Bearer', 'expires_in': 3600}
+        if path == '/v1/me':
+            return {'id': 'stub-user', 'display_name': 'Stub User', 'images': []}
+        if path == '/v1/me/player/recently-played':
+            return {'items': [
+                {'track': _spotify_track(index, behavior.padding), 'played_at': '2025-01-01T00:00:00.000Z'}
+                for index in range(behavior.items)
+            ]}
+        if path == '/v1/me/top/artists':
+            return {'items': [
+                {'id': f'stubartist{index:04d}', 'name': f'Stub Artist {index}', 'genres': ['j-pop', 'rock'],
+                 'images': [], 'popularity': 50}
+                for index in range(behavior.items)
+            ]}
+        if path == '/v1/me/top/tracks':
+            return {'items': [_spotify_track(index, behavior.padding) for index in range(behavior.items)]}
+        if path == '/v1/search':
+            index = random.randrange(100000)
+            return {'tracks': {'items': [_spotify_track(index)]}}
+        return None
+
+
+class ChatCompletionStubHandler(_StubHandler):
+    """OpenAI互換のチャットAPI（DeepSeek・OpenAI）のスタブ。推薦のJSONを返す"""
+
+    def build(self, path, query, behavior):
+        content = json.dumps({'recommendations': [
+            {
+                'track_name': f'Stub Song {index}',
+                'artist_name': f'Stub Artist {index}',
+                'album_name': f'Stub Album {index}',
+                'explanation': '雨の日に合う落ち着いた曲です。' + 'あ' * behavior.padding,
+            }
+            for index in range(behavior.items)
+        ]}, ensure_ascii=False)
+        return {
+            'id': 'chatcmpl-stub',
+            'object': 'chat.completion',
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+        }
+
+
+class StubServer:
+    """スタブのHTTPサーバーを別スレッドで起動する（ポートは空いているものを使う）"""
+
+    def __init__(self, handler_class, behavior):
+        self.behavior = behavior
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def count(self, error):
+        with self._lock:
+            self.requests += 1
+            self.errors += int(error)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietWSGIRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class AppServer:
+    """DjangoのWSGIアプリケーションをスレッドごとにリクエストを処理するサーバーで起動する"""
+
+    def __init__(self, application):
+        self.httpd = _ThreadingWSGIServer(('127.0.0.1', 0), _QuietWSGIRequestHandler)
+        self.httpd.set_app(application)
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@dataclass
+class EndpointResult:
+    """エンドポイントごとの計測結果"""
+    timings: list = field(default_factory=list)
+    errors: int = 0
+
+    def summary(self, elapsed):
+        """件数・RPSはエラーを含み、レイテンシは成功したリクエストのみから求める"""
+        timings = self.timings or [0.0]
+        requests_count = len(self.timings) + self.errors
+        return {
+            'requests': requests_count,
+            'errors': self.errors,
+            'rps': requests_count / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(timings, 0.50),
+            'p95_ms': percentile(timings, 0.95),
+            'p99_ms': percentile(timings, 0.99),
+        }
+
+
+def generate_scenario(session, base_url, results, context='雨の日に聴きたい曲'):
+    """
+    1人のユーザーの1回分の操作: 推薦を生成し、一覧と生成した推薦の詳細を読む
+
+    Args:
+        session (requests.Session): ユーザーの認証ヘッダーを設定したセッション
+        results (dict): エンドポイント名をキーとする EndpointResult
+    """
+    response = _timed(results, 'POST /api/recommendations/generate/',
+                      session.post, f'{base_url}/api/recommendations/generate/', json={'context': context})
+    _timed(results, 'GET /api/recommendations/', session.get, f'{base_url}/api/recommendations/')
+    if response is not None and response.status_code == 200:
+        recommendation_id = response.json().get('id')
+        _timed(results, 'GET /api/recommendations/{id}/',
+               session.get, f'{base_url}/api/recommendations/{recommendation_id}/')
+
+
+def _timed(results, name, method, url, **kwargs):
+    result = results.setdefault(name, EndpointResult())
+    start = time.perf_counter()
+    try:
+        response = method(url, timeout=120, **kwargs)
+    except requests.RequestException:
+        result.errors += 1
+        return None
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if response.status_code >= 400:
+        result.errors += 1
+    else:
+        result.timings.append(elapsed_ms)
+    return response
+
+
+def run_load(base_url, tokens, duration=None, iterations=None, scenario=generate_scenario):
+    """
+    ユーザーごとに1スレッドで scenario を繰り返し実行する
+
+    Args:
+        base_url (str): アプリのURL
+        tokens (list): ユーザーごとのJWTアクセストークン（同時ユーザー数になる）
+        duration (float, optional): 実行する秒数
+        iterations (int, optional): ユーザーごとの繰り返し回数（duration と両方指定した場合は先に達した方で終了）
+
+    Returns:
+        tuple: (エンドポイント名をキーとする EndpointResult の辞書, 経過秒数)
+    """
+    per_user = [{} for _ in tokens]
+    barrier = threading.Barrier(len(tokens) + 1)
+
+    def simulate(token, results):
+        session = requests.Session()
+        session.headers['Authorization'] = f'Bearer {token}'
+        barrier.wait()
+        deadline = time.perf_counter() + duration if duration else None
+        count = 0
+        while (iterations is None or count < iterations) and (deadline is None or time.perf_counter() < deadline):
+            scenario(session, base_url, results)
+            count += 1
+        session.close()
+
+    threads = [threading.Thread(target=simulate, args=args) for args in zip(tokens, per_user)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    merged = {}
+    for results in per_user:
+        for name, result in results.items():
+            total = merged.setdefault(name, EndpointResult())
+            total.timings.extend(result.timings)
+            total.errors += result.errors
+    return merged, elapsed
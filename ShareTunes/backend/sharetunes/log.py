@@ -0,0 +1,212 @@
+import atexit
+import contextvars
+import json
+import logging
+import queue
+import random
+import re
+import sys
+import threading
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# リクエスト単位の情報（ミドルウェアで設定し、ログのレコードに付与する）
+_request_id = contextvars.ContextVar('log_request_id', default=None)
+_sampled = contextvars.ContextVar('log_sampled', default=True)
+
+# ログに残さない値のキー（辞書・クエリ文字列・key=value 形式で現れるもの）
+SECRET_KEYS = (
+    'authorization', 'access_token', 'refresh_token', 'spotify_access_token', 'spotify_refresh_token',
+    'token', 'code', 'password', 'client_secret', 'api_key', 'secret',
+)
+REDACTED = '[REDACTED]'
+
+_SECRET_KEY_PATTERN = '|'.join(sorted((re.escape(key) for key in SECRET_KEYS), key=len, reverse=True))
+_SECRET_PATTERNS = (
+    # Authorization ヘッダーの値（Bearer / Basic トークン）
+    re.compile(r'(?i)\b(Bearer|Basic)\s+[A-Za-z0-9\-._~+/]+=*'),
+    # 'key': 'value' / "key": "value"（辞書やJSONの表現）
+    re.compile(rf'''(?i)(['"](?:{_SECRET_KEY_PATTERN})['"]\s*:\s*)(['"])(.*?)\2'''),
+    # key=value（クエリ文字列・ログメッセージ）
+    re.compile(rf'(?i)\b((?:{_SECRET_KEY_PATTERN})=)([^\s&,]+)'),
+)
+
+# クライアントから受け取るリクエストIDとして受け付ける形式（ログ・レスポンスヘッダーにそのまま出力するため）
+REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# LogRecord が標準で持つ属性（これ以外を extra として構造化ログに含める）
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
+
+
+def set_request_context(request_id, sampled):
+    """リクエストの開始時に呼び、リクエストIDとサンプリングの可否を設定する"""
+    return _request_id.set(request_id), _sampled.set(sampled)
+
+
+def reset_request_context(tokens):
+    request_id_token, sampled_token = tokens
+    _request_id.reset(request_id_token)
+    _sampled.reset(sampled_token)
+
+
+def clean_request_id(value):
+    """
+    クライアントが X-Request-ID で渡したIDを検証する
+
+    英数字と . _ - からなる64文字以内のIDのみ引き継ぎ、それ以外（未指定を含む）は新しく生成する。
+    """
+    if value and REQUEST_ID_RE.match(value):
+        return value
+    return uuid.uuid4().hex
+
+
+def current_request_id():
+    """処理中のリクエストのID（リクエスト外ではNone）"""
+    return _request_id.get()
+
+
+def should_sample(rate):
+    """リクエストのDEBUG/INFOログを出力するかを決める"""
+    return rate >= 1 or random.random() < rate
+
+
+def redact(text):
+    """文字列中のトークン・パスワードなどを伏せ字にする"""
+    text = _SECRET_PATTERNS[0].sub(lambda match: f'{match.group(1)} {REDACTED}', text)
+    text = _SECRET_PATTERNS[1].sub(lambda match: f'{match.group(1)}{match.group(2)}{REDACTED}{match.group(2)}', text)
+    return _SECRET_PATTERNS[2].sub(lambda match: f'{match.group(1)}{REDACTED}', text)
+
+
+def redact_value(value):
+    """
+    extra に渡された値を伏せ字にする
+
+    辞書・リスト・タプルは入れ子の中まで確認し、秘密情報のキーの値は丸ごと伏せる。
+    呼び出し元のオブジェクトは変更せず、新しいオブジェクトを返す。
+    """
+    if isinstance(value, str):
+        return redact(value)
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if isinstance(key, str) and key.lower() in SECRET_KEYS else redact_value(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return type(value)(redact_value(item) for item in value)
+    return value
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    リクエストIDを付与し、サンプリング対象外のリクエストのDEBUG/INFOログを捨てる
+
+    WARNING以上は常に出力する。リクエスト外（管理コマンドなど）のログはすべて出力する。
+    """
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING and not _sampled.get():
+            return False
+        record.request_id = _request_id.get()
+        return True
+
+
+class RedactSecretsFilter(logging.Filter):
+    """メッセージと extra の値に含まれる秘密情報を伏せ字にする"""
+
+    def filter(self, record):
+        record.msg = redact(record.getMessage())
+        record.args = None
+        for key, value in vars(record).items():
+            if key in _RECORD_ATTRIBUTES:
+                continue
+            if key.lower() in SECRET_KEYS:
+                setattr(record, key, REDACTED)
+            else:
+                setattr(record, key, redact_value(value))
+        if record.exc_text:
+            record.exc_text = redact(record.exc_text)
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """1レコードを1行のJSONにする"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueListener(QueueListener):
+
+    def enqueue_sentinel(self):
+        # キューが一杯でも、スレッドが取り出すのを待ってから終了の合図を入れる（put_nowait だと Full で失敗する）
+        self.queue.put(self._sentinel)
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """
+    ログをキューに入れ、別スレッドで整形・伏せ字・書き込みを行うハンドラー
+
+    リクエストを処理するスレッドはメッセージの組み立てとキューへの追加だけを行うため、
+    標準出力への書き込みで待たされない。キューが一杯の場合は待たずに捨て、捨てた件数を数える。
+
+    Args:
+        stream: 書き込み先（省略時は標準エラー出力）
+        maxsize (int): キューに溜められるレコード数の上限
+    """
+
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize=maxsize))
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.target.addFilter(RedactSecretsFilter())
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self.listener = _QueueListener(self.queue, self.target, respect_handler_level=True)
+        self.listener.start()
+        self._stopped = False
+        atexit.register(self.stop)
+
+    def setFormatter(self, fmt):
+        # 整形はバックグラウンドのスレッドで行う
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # 引数のオブジェクトが後から変更されても出力が変わらないよう、メッセージだけはここで確定させる
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def stop(self):
+        """キューに残ったレコードを書き出してからスレッドを止める"""
+        if not self._stopped:
+            self._stopped = True
+            self.listener.stop()
+
+    def close(self):
+        self.stop()
+        super().close()
@@ -0,0 +1,208 @@
+import bisect
+import contextvars
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+# リクエスト内で計測した区間（ミドルウェアが Server-Timing ヘッダーにする）
+_timings = contextvars.ContextVar('request_timings', default=None)
+
+# 区間の所要時間（秒）のヒストグラムのバケット。外部APIの呼び出しが数十秒かかるため上限を広めに取る
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 90.0)
+
+_SERVER_TIMING_NAME_RE = re.compile(r'[^A-Za-z0-9_\-.]')
+_SERVER_TIMING_DESC_RE = re.compile(r'[^A-Za-z0-9_\-. ]')
+
+
+class Histogram:
+    """
+    ラベルの組み合わせごとの累積ヒストグラム（Prometheusのhistogramと同じ形式）
+
+    値はプロセス内に保持するため、gunicornのワーカーごとに別々に集計される。
+    """
+
+    def __init__(self, name, help_text, labels, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(label, '')) for label in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            series['counts'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                key: {'counts': list(series['counts']), 'sum': series['sum'], 'count': series['count']}
+                for key, series in self._series.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for key, series in sorted(self.snapshot().items()):
+            labels = [f'{label}="{_escape(value)}"' for label, value in zip(self.labels, key) if value]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series['counts']):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                bucket_labels = _format_labels(labels + ['le="%s"' % le])
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {series["sum"]:.6f}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {series["count"]}')
+        return lines
+
+
+class Counter:
+    """ラベルの組み合わせごとの累積カウンター（Prometheusのcounterと同じ形式）"""
+
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(label, '')) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for key, value in sorted(self.snapshot().items()):
+            labels = [f'{label}="{_escape(value)}"' for label, value in zip(self.labels, key) if value]
+            lines.append(f'{self.name}{_format_labels(labels)} {value}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+stage_duration = Histogram(
+    'sharetunes_stage_duration_seconds',
+    '推薦の生成などの処理の区間ごとの所要時間',
+    labels=('stage', 'provider', 'outcome'),
+)
+request_duration = Histogram(
+    'sharetunes_request_duration_seconds',
+    'APIリクエストの所要時間',
+    labels=('method', 'route', 'status'),
+)
+request_queries = Histogram(
+    'sharetunes_request_queries',
+    'APIリクエストごとのSQLクエリの件数',
+    labels=('method', 'route'),
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100, 200, 500),
+)
+request_query_duration = Histogram(
+    'sharetunes_request_query_duration_seconds',
+    'APIリクエストごとのSQLクエリの合計時間',
+    labels=('method', 'route'),
+)
+repeated_queries = Counter(
+    'sharetunes_repeated_queries_total',
+    '同じ形のクエリを繰り返し実行した（N+1の兆候がある）リクエストの件数',
+    labels=('method', 'route'),
+)
+
+METRICS = (stage_duration, request_duration, request_queries, request_query_duration, repeated_queries)
+
+
+@contextmanager
+def span(stage, provider=None):
+    """
+    処理の区間の所要時間を計測する
+
+    ヒストグラムに記録し、リクエストの処理中であれば Server-Timing ヘッダーにも含める。
+    例外で抜けた場合は outcome="error" として記録する。
+
+    Args:
+        stage (str): 区間の名前（例: 'llm', 'spotify_user_data'）
+        provider (str, optional): 外部APIのプロバイダー名（LLMのプロバイダーなど）
+    """
+    outcome = 'ok'
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        outcome = 'error'
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_duration.observe(elapsed, stage=stage, provider=provider or '', outcome=outcome)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((stage, provider, elapsed))
+
+
+def add_request_timing(name, elapsed, desc=None):
+    """span() 以外で計測した時間を、処理中のリクエストの Server-Timing に加える"""
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((name, desc, elapsed))
+
+
+def start_request_timings():
+    """リクエストの開始時に呼び、区間の計測結果を溜めるリストを設定する"""
+    timings = []
+    return timings, _timings.set(timings)
+
+
+def reset_request_timings(token):
+    _timings.reset(token)
+
+
+def server_timing_header(timings, total=None):
+    """
+    計測した区間を Server-Timing ヘッダーの値にする
+
+    Args:
+        timings (list): (区間名, プロバイダー（説明）, 秒) のタプルのリスト
+        total (float, optional): リクエスト全体の秒数
+    """
+    entries = []
+    for stage, provider, elapsed in timings:
+        entry = f'{_SERVER_TIMING_NAME_RE.sub("_", stage)};dur={elapsed * 1000:.1f}'
+        if provider:
+            entry += f';desc="{_SERVER_TIMING_DESC_RE.sub("_", provider)}"'
+        entries.append(entry)
+    if total is not None:
+        entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
+
+
+def render_metrics(extra_lines=()):
+    """すべてのメトリクスをPrometheusのテキスト形式にする"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    lines.extend(extra_lines)
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,6 @@
+"""
+推薦の生成と一覧・詳細APIのCPU処理のマイクロベンチマーク
+
+manage.py benchmark_pipeline から実行する。fixtures に実際のAPIレスポンスと同じ形のデータ、
+cases に計測する処理、baseline.json に比較の基準となる計測結果を置く。
+"""
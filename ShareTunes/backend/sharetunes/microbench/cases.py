@@ -0,0 +1,125 @@
+import random
+
+from django.contrib.auth.models import User
+from django.db.models import Prefetch
+
+from playlists.models import Playlist, PlaylistTrack
+from playlists.serializers import PlaylistDetailSerializer, PlaylistSerializer
+from playlists.views import with_track_count
+from recommendations.models import Recommendation, RecommendedTrack
+from recommendations.serializers import (
+    RecommendationDetailSerializer, RecommendationSerializer, RecommendationSummarySerializer,
+)
+from recommendations.services import RecommendationService
+from tracks.models import Track
+
+from . import fixtures
+
+# 一覧の1ページ分の件数（API_PAGE_SIZE の既定値）と、推薦・プレイリストあたりの楽曲数
+PAGE_SIZE = 20
+TRACKS_PER_RECOMMENDATION = 5
+TRACKS_PER_PLAYLIST = 50
+
+
+class OfflineRecommendationService(RecommendationService):
+    """Spotify APIを呼ばずに、固定の再生履歴からプロンプトを作る"""
+
+    def __init__(self, spotify_payloads):
+        self.user = None
+        self.user_profile = None
+        self.spotify_client = None
+        self.spotify_payloads = spotify_payloads
+
+    def get_spotify_user_data(self):
+        return {
+            'recent_tracks': self._extract_recent_tracks(self.spotify_payloads['recent_tracks']),
+            'top_artists': self._extract_top_artists(self.spotify_payloads['top_artists']),
+            'top_tracks': self._extract_top_tracks(self.spotify_payloads['top_tracks']),
+        }
+
+
+def pipeline_cases(seed=42):
+    """
+    推薦の生成で実行されるCPU処理（抽出・プロンプト生成・パース）のケース
+
+    Returns:
+        list: (名前, 引数なしの関数) のタプルのリスト
+    """
+    rng = random.Random(seed)
+    payloads = fixtures.spotify_payloads(seed)
+    service = OfflineRecommendationService(payloads)
+    response = fixtures.llm_response(rng)
+    return [
+        ('extract_recent_tracks', lambda: service._extract_recent_tracks(payloads['recent_tracks'])),
+        ('extract_top_artists', lambda: service._extract_top_artists(payloads['top_artists'])),
+        ('extract_top_tracks', lambda: service._extract_top_tracks(payloads['top_tracks'])),
+        ('generate_llm_prompt', lambda: service.generate_llm_prompt('雨の日に聴きたい曲')),
+        ('parse_llm_response', lambda: service.parse_llm_response(response)),
+    ]
+
+
+def serializer_cases(seed=42):
+    """
+    一覧・詳細APIのシリアライズのケース（DBが必要）
+
+    クエリは事前に1回だけ実行し、計測するのは読み込み済みのインスタンスのシリアライズのみ。
+    """
+    rng = random.Random(seed)
+    user = User.objects.create(username='microbench')
+    service = OfflineRecommendationService(fixtures.spotify_payloads(seed))
+    prompt = service.generate_llm_prompt('雨の日に聴きたい曲')
+
+    for index in range(PAGE_SIZE):
+        recommendation = Recommendation.objects.create(
+            user=user, context_description=f'雨の日 #{index}', prompt_text=prompt,
+            llm_response=fixtures.llm_response(rng),
+        )
+        RecommendedTrack.objects.bulk_create([
+            RecommendedTrack(
+                recommendation=recommendation, spotify_id=f'{index:04d}{position:02d}', name=track['track_name'],
+                artist=track['artist_name'], album=track['album_name'], explanation=track['explanation'],
+                image_url=f'https://i.scdn.co/image/{index:04d}{position:02d}',
+                preview_url=f'https://p.scdn.co/mp3-preview/{index:04d}{position:02d}', position=position,
+            )
+            for position, track in enumerate(fixtures.recommendation_tracks(rng, TRACKS_PER_RECOMMENDATION))
+        ])
+
+    tracks = Track.objects.bulk_create([
+        Track(spotify_id=f'microbench{index:04d}', name=f'楽曲{index}', artist=f'アーティスト{index % 30}',
+              album=f'アルバム{index % 40}', image_url=f'https://i.scdn.co/image/{index:04d}',
+              preview_url=f'https://p.scdn.co/mp3-preview/{index:04d}')
+        for index in range(TRACKS_PER_PLAYLIST)
+    ])
+    for index in range(PAGE_SIZE):
+        playlist = Playlist.objects.create(user=user, name=f'プレイリスト{index}', description='雨の日に聴く曲')
+        PlaylistTrack.objects.bulk_create([
+            PlaylistTrack(playlist=playlist, track=track, rank=(position + 1) << 16)
+            for position, track in enumerate(tracks)
+        ])
+
+    recommendations = Recommendation.objects.filter(user=user).order_by('-created_at', '-id')
+    recommendation_page = list(recommendations.prefetch_related('tracks'))
+    summary_page = list(
+        recommendations.prefetch_related(Prefetch(
+            'tracks', queryset=RecommendedTrack.objects.order_by('position'), to_attr='preview_tracks',
+        ))
+    )
+    for recommendation in summary_page:
+        recommendation.track_count = len(recommendation.preview_tracks)
+        recommendation.preview_tracks = recommendation.preview_tracks[:3]
+    detail = (recommendations.select_related('payload__prompt_template').prefetch_related('tracks').first())
+    playlist_page = list(with_track_count(Playlist.objects.filter(user=user)).order_by('-updated_at', '-id'))
+    playlist_detail = (Playlist.objects.select_related('user').prefetch_related(Prefetch(
+        'playlisttrack_set',
+        queryset=PlaylistTrack.objects.select_related('track').order_by('rank'),
+        to_attr='ordered_playlist_tracks',
+    )).get(pk=playlist_page[0].pk))
+
+    return [
+        ('serialize_recommendation_list', lambda: RecommendationSerializer(recommendation_page, many=True).data),
+        ('serialize_recommendation_summary',
+         lambda: RecommendationSummarySerializer(summary_page, many=True).data),
+        ('serialize_recommendation_detail', lambda: RecommendationDetailSerializer(detail).data),
+        ('serialize_playlist_list', lambda: PlaylistSerializer(playlist_page, many=True).data),
+        ('serialize_playlist_detail', lambda: PlaylistDetailSerializer(playlist_detail).data),
+    ]
@@ -0,0 +1,152 @@
+import json
+import random
+
+# Spotify APIのレスポンスに含まれる販売国の一覧（実際のレスポンスでは楽曲・アルバムごとに180か国前後が並ぶ）
+MARKETS = [f'{first}{second}' for first in 'ABCDEFGHIJKLMN' for second in 'ABCDEFGHIJKLM'][:180]
+
+GENRES = ['j-pop', 'j-rock', 'anime', 'city pop', 'shibuya-kei', 'japanese indie', 'vocaloid', 'idol',
+          'j-r&b', 'japanese singer-songwriter', 'visual kei', 'enka']
+
+EXPLANATION = ('最近よく聴いている{artist}と同じく、透明感のあるボーカルと雨の日に合う落ち着いたアレンジが特徴です。'
+               'お気に入りの{genre}の要素もあり、通勤中や夜のリラックスタイムにもおすすめです。')
+
+
+def _image_set(key):
+    return [
+        {'url': f'https://i.scdn.co/image/ab67616d0000b273{key}', 'height': 640, 'width': 640},
+        {'url': f'https://i.scdn.co/image/ab67616d00001e02{key}', 'height': 300, 'width': 300},
+        {'url': f'https://i.scdn.co/image/ab67616d00004851{key}', 'height': 64, 'width': 64},
+    ]
+
+
+def _artist_ref(rng, index):
+    artist_id = f'{index:04d}' + ''.join(rng.choices('abcdefghijklmnopqrstuvwxyz0123456789', k=18))
+    return {
+        'external_urls': {'spotify': f'https://open.spotify.com/artist/{artist_id}'},
+        'href': f'https://api.spotify.com/v1/artists/{artist_id}',
+        'id': artist_id,
+        'name': f'アーティスト{index}',
+        'type': 'artist',
+        'uri': f'spotify:artist:{artist_id}',
+    }
+
+
+def spotify_track(rng, index):
+    """Spotify Web API の完全なtrackオブジェクト（販売国・外部ID・アルバム情報を含む）"""
+    track_id = f'{index:06d}' + ''.join(rng.choices('abcdefghijklmnopqrstuvwxyz0123456789', k=16))
+    album_id = f'{index % 40:04d}' + ''.join(rng.choices('abcdefghijklmnopqrstuvwxyz0123456789', k=18))
+    artists = [_artist_ref(rng, (index + offset) % 30) for offset in range(rng.choice((1, 1, 1, 2)))]
+    return {
+        'album': {
+            'album_type': rng.choice(('album', 'single', 'compilation')),
+            'artists': artists[:1],
+            'available_markets': MARKETS,
+            'external_urls': {'spotify': f'https://open.spotify.com/album/{album_id}'},
+            'href': f'https://api.spotify.com/v1/albums/{album_id}',
+            'id': album_id,
+            'images': _image_set(album_id),
+            'name': f'アルバム{index % 40}',
+            'release_date': f'20{rng.randrange(10, 25)}-0{rng.randrange(1, 10)}-1{rng.randrange(0, 10)}',
+            'release_date_precision': 'day',
+            'total_tracks': rng.randrange(1, 16),
+            'type': 'album',
+            'uri': f'spotify:album:{album_id}',
+        },
+        'artists': artists,
+        'available_markets': MARKETS,
+        'disc_number': 1,
+        'duration_ms': rng.randrange(150000, 320000),
+        'explicit': False,
+        'external_ids': {'isrc': f'JPXX0{index:07d}'},
+        'external_urls': {'spotify': f'https://open.spotify.com/track/{track_id}'},
+        'href': f'https://api.spotify.com/v1/tracks/{track_id}',
+        'id': track_id,
+        'is_local': False,
+        'name': f'楽曲{index}',
+        'popularity': rng.randrange(20, 90),
+        'preview_url': f'https://p.scdn.co/mp3-preview/{track_id}',
+        'track_number': rng.randrange(1, 13),
+        'type': 'track',
+        'uri': f'spotify:track:{track_id}',
+    }
+
+
+def recently_played(rng, limit=20):
+    """current_user_recently_played(limit=20) のレスポンス"""
+    return {
+        'items': [
+            {
+                'track': spotify_track(rng, index),
+                'played_at': f'2025-04-{17 - index // 8:02d}T{23 - index % 8:02d}:12:45.123Z',
+                'context': {'type': 'playlist', 'uri': 'spotify:playlist:37i9dQZF1DX0XUsuxWHRQd'},
+            }
+            for index in range(limit)
+        ],
+        'next': 'https://api.spotify.com/v1/me/player/recently-played?before=1744931565123&limit=20',
+        'cursors': {'after': '1744931565123', 'before': '1744840000000'},
+        'limit': limit,
+        'href': f'https://api.spotify.com/v1/me/player/recently-played?limit={limit}',
+    }
+
+
+def top_artists(rng, limit=10):
+    """current_user_top_artists(limit=10) のレスポンス"""
+    items = []
+    for index in range(limit):
+        artist = _artist_ref(rng, index)
+        artist.update({
+            'followers': {'href': None, 'total': rng.randrange(1000, 5000000)},
+            'genres': rng.sample(GENRES, 4),
+            'images': _image_set(artist['id']),
+            'popularity': rng.randrange(30, 90),
+        })
+        items.append(artist)
+    return {'items': items, 'total': 50, 'limit': limit, 'offset': 0, 'next': None, 'previous': None,
+            'href': f'https://api.spotify.com/v1/me/top/artists?limit={limit}'}
+
+
+def top_tracks(rng, limit=10):
+    """current_user_top_tracks(limit=10) のレスポンス"""
+    return {'items': [spotify_track(rng, 100 + index) for index in range(limit)],
+            'total': 50, 'limit': limit, 'offset': 0, 'next': None, 'previous': None,
+            'href': f'https://api.spotify.com/v1/me/top/tracks?limit={limit}'}
+
+
+def recommendation_tracks(rng, count=5):
+    return [
+        {
+            'track_name': f'推薦曲{index}',
+            'artist_name': f'アーティスト{rng.randrange(30)}',
+            'album_name': f'アルバム{rng.randrange(40)}',
+            'explanation': EXPLANATION.format(artist=f'アーティスト{rng.randrange(30)}', genre=rng.choice(GENRES)),
+        }
+        for index in range(count)
+    ]
+
+
+def llm_response(rng, count=5):
+    """前置きの文章とコードブロックで囲まれたJSONを含む、OpenAI互換APIのレスポンス"""
+    content = (
+        'ユーザーの再生履歴とお気に入りのアーティストから、雨の日に合う楽曲を選びました。\n\n'
+        '```json\n'
+        + json.dumps({'recommendations': recommendation_tracks(rng, count)}, ensure_ascii=False, indent=2)
+        + '\n```\n\nいずれもユーザーの好みのジャンルに近い楽曲です。'
+    )
+    return {
+        'id': 'chatcmpl-benchmark',
+        'object': 'chat.completion',
+        'created': 1744931565,
+        'model': 'deepseek-chat',
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+        'usage': {'prompt_tokens': 1830, 'completion_tokens': 620, 'total_tokens': 2450},
+    }
+
+
+def spotify_payloads(seed=42):
+    """再生履歴・トップアーティスト・トップトラックのレスポンスの組"""
+    rng = random.Random(seed)
+    return {
+        'recent_tracks': recently_played(rng),
+        'top_artists': top_artists(rng),
+        'top_tracks': top_tracks(rng),
+    }
@@ -0,0 +1,217 @@
+import contextvars
+import logging
+import random
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .log import clean_request_id, current_request_id, reset_request_context, set_request_context, should_sample
+from .metrics import (
+    add_request_timing, repeated_queries, request_duration, request_queries, request_query_duration,
+    reset_request_timings, server_timing_header, start_request_timings,
+)
+from .profiling import ProfileSession, enforce_disk_limit, write_profile
+from .queries import record_queries
+
+logger = logging.getLogger(__name__)
+
+
+class RequestLoggingMiddleware:
+    """
+    リクエストごとにリクエストIDとログのサンプリングの可否を決める
+
+    リクエストIDは X-Request-ID ヘッダーを引き継ぎ（ないか形式が不正な場合は生成し）、レスポンスにも付ける。
+    DEBUG/INFOログは LOG_SAMPLE_RATE の割合のリクエストでのみ出力する。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_id = clean_request_id(request.headers.get('X-Request-ID'))
+        tokens = set_request_context(request_id, should_sample(settings.LOG_SAMPLE_RATE))
+        try:
+            response = self.get_response(request)
+        finally:
+            reset_request_context(tokens)
+        response['X-Request-ID'] = request_id
+        return response
+
+
+class ServerTimingMiddleware:
+    """
+    リクエストの処理中に span() で計測した区間を Server-Timing ヘッダーで返す
+
+    リクエスト全体の所要時間は、メソッド・URLパターン・ステータスごとにヒストグラムへ記録する。
+    内部の処理時間を公開しないよう、ヘッダーは SERVER_TIMING_ENABLED が有効な場合と
+    スタッフユーザーのリクエストにのみ付ける。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        timings, token = start_request_timings()
+        try:
+            response = self.get_response(request)
+        finally:
+            reset_request_timings(token)
+        elapsed = time.perf_counter() - start
+
+        request_duration.observe(elapsed, method=request.method, route=_route(request), status=response.status_code)
+        if settings.SERVER_TIMING_ENABLED or _is_staff(request):
+            response['Server-Timing'] = server_timing_header(timings, total=elapsed)
+        return response
+
+
+def _is_staff(request):
+    """
+    認証済みのスタッフユーザーのリクエストか
+
+    DRFのビューで認証したユーザー（JWT）も request.user に反映されるため、レスポンスの作成後に確認する。
+    """
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_authenticated and user.is_staff)
+
+
+def _route(request):
+    """メトリクスのラベルに使うURLパターン（解決できなかった場合は 'unmatched'）"""
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else 'unmatched'
+
+
+class QueryStatsMiddleware:
+    """
+    リクエストごとにSQLクエリの件数・合計時間を数え、同じ形のクエリの繰り返し（N+1）を検出する
+
+    件数と時間はURLパターンごとにヒストグラムへ記録し、Server-Timing にも db として含める。
+    件数・時間が QUERY_COUNT_WARNING / QUERY_TIME_WARNING_MS を超えた場合と、
+    同じ形のクエリを QUERY_REPEAT_THRESHOLD 回以上実行した場合は警告ログを出力する。
+
+    ストリーミングのレスポンス（エクスポートなど）は本文の送信中にもクエリを実行するため、
+    レスポンスを閉じるまで記録を続けてから集計する（WSGIのように、本文を同じスレッドで送る場合）。
+    Server-Timing はヘッダーの送信時点の値のため、desc に「before streaming」と付けて区別する。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_STATS_ENABLED:
+            return self.get_response(request)
+
+        stack = ExitStack()
+        recorder = stack.enter_context(record_queries())
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            stack.close()
+            raise
+
+        route = _route(request)
+        if not response.streaming:
+            stack.close()
+            add_request_timing('db', recorder.duration, desc=f'{recorder.count} queries')
+            self.observe(request.method, route, recorder)
+            return response
+
+        add_request_timing('db', recorder.duration, desc=f'{recorder.count} queries before streaming')
+        # 閉じるときもリクエストIDなどをログに残せるよう、今のコンテキストで集計する
+        context = contextvars.copy_context()
+
+        def finish():
+            stack.close()
+            context.run(self.observe, request.method, route, recorder)
+
+        response._resource_closers.append(finish)
+        return response
+
+    def observe(self, method, route, recorder):
+        """記録したクエリをヒストグラムに加え、多すぎる場合は警告ログを出力する"""
+        request_queries.observe(recorder.count, method=method, route=route)
+        request_query_duration.observe(recorder.duration, method=method, route=route)
+
+        repeated = recorder.repeated(settings.QUERY_REPEAT_THRESHOLD)
+        if repeated:
+            repeated_queries.inc(method=method, route=route)
+        if (repeated or recorder.count > settings.QUERY_COUNT_WARNING
+                or recorder.duration * 1000 > settings.QUERY_TIME_WARNING_MS):
+            logger.warning(
+                'SQLクエリが多いリクエスト: %s %s (%d件, %.1fms)', method, route,
+                recorder.count, recorder.duration * 1000,
+                extra={
+                    'route': route,
+                    'queries': recorder.count,
+                    'query_ms': round(recorder.duration * 1000, 1),
+                    'repeated_queries': [{'sql': shape, 'count': count} for shape, count in repeated[:5]],
+                },
+            )
+
+
+class ProfilingMiddleware:
+    """
+    指定したリクエストを cProfile で計測し、PROFILE_DIR にプロファイルと上位の要約を書き出す
+
+    対象になるのは、スタッフユーザーが PROFILE_HEADER（既定は X-Profile: 1）を付けたリクエストと、
+    PROFILE_SAMPLE_RATE の割合で選ばれたリクエスト（サンプリングはユーザーを問わない）。
+    PROFILING_ENABLED で有効にした場合のみ計測する。本番で有効にしたままにできるよう、
+    同時に計測するリクエスト数（PROFILE_MAX_CONCURRENT）とディスク使用量（PROFILE_MAX_BYTES）に上限を設け、
+    同時計測数が上限に達している場合は計測せず、ディスク使用量が上限を超えた場合は古いプロファイルから削除する。
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slots = threading.BoundedSemaphore(max(1, settings.PROFILE_MAX_CONCURRENT))
+
+    def __call__(self, request):
+        if not settings.PROFILING_ENABLED or not self.should_profile(request):
+            return self.get_response(request)
+        if not self.slots.acquire(blocking=False):
+            response = self.get_response(request)
+            response['X-Profile'] = 'skipped'
+            return response
+
+        try:
+            with ProfileSession() as session:
+                response = self.get_response(request)
+            elapsed = time.perf_counter() - session.started_at
+            # ファイル名はクライアントの値を使わずサーバーで生成する（リクエストIDは要約の先頭に記録する）
+            name = f"{timezone.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex}"
+            header = (f'{request.method} {request.get_full_path()} -> {response.status_code} '
+                      f'({elapsed * 1000:.1f}ms, {len(session.profilers)} threads, '
+                      f'request_id={current_request_id()})')
+            try:
+                write_profile(session, settings.PROFILE_DIR, name, header, top_n=settings.PROFILE_TOP_N)
+                # 書き出した後に、上限を超えた分を古いものから削除する（書き出したばかりのプロファイルは残す）
+                enforce_disk_limit(settings.PROFILE_DIR, settings.PROFILE_MAX_BYTES, keep=name)
+            except OSError as e:
+                logger.warning('プロファイルを書き出せませんでした: %s', e)
+            else:
+                logger.info('プロファイルを書き出しました: %s', name, extra={'profile': name})
+                response['X-Profile'] = name
+        finally:
+            self.slots.release()
+        return response
+
+    def should_profile(self, request):
+        if settings.PROFILE_SAMPLE_RATE > 0 and random.random() < settings.PROFILE_SAMPLE_RATE:
+            return True
+        return request.headers.get(settings.PROFILE_HEADER) == '1' and self.is_staff(request)
+
+    def is_staff(self, request):
+        """管理画面のセッション、またはAPIのJWTでスタッフユーザーか確認する（ヘッダーがある場合のみ呼ばれる）"""
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return user.is_staff
+        try:
+            authenticated = JWTAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return False
+        return authenticated is not None and authenticated[0].is_staff
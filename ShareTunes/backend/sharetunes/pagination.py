@@ -0,0 +1,145 @@
+import json
+from base64 import b64encode
+from datetime import date, datetime, time
+from urllib import parse
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+def _to_json_value(value):
+    """カーソルに入れる値（日時は精度を落とさずISO形式の文字列にする）"""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return value
+
+
+class KeysetPagination(CursorPagination):
+    """
+    カーソル（キーセット）方式のページネーション
+
+    OFFSETを使わず前ページ末尾の値を起点に絞り込むため、深いページでも取得コストが一定になる。
+    ページサイズは page_size クエリパラメータで変更可能（上限は API_MAX_PAGE_SIZE）。
+
+    DRFの CursorPagination は並び順の先頭のフィールドだけをカーソルにし、同じ値の行はOFFSETで
+    読み飛ばすが、ここでは並び順のすべてのフィールドの値の組をカーソルにして
+    (created_at, id) < (カーソルの値) のように絞り込む。そのため ordering の最後は一意な
+    フィールド（id）にし、各フィールドはNULLを含まないこと。
+    """
+    page_size = settings.API_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor.reverse if self.cursor else False
+        position = self.cursor.position if self.cursor else None
+
+        # 前のページは逆順に取得してから並べ直す
+        ordering = [self._invert(field) for field in self.ordering] if reverse else list(self.ordering)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._after(ordering, position))
+
+        # 1件多く取得し、続きのページがあるかを判定する
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        if self.page:
+            self.next_position = self._get_position_from_instance(self.page[-1], self.ordering)
+            self.previous_position = self._get_position_from_instance(self.page[0], self.ordering)
+        else:
+            self.next_position = self.previous_position = position
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.previous_position))
+
+    def encode_cursor(self, cursor):
+        tokens = {'p': json.dumps(cursor.position, separators=(',', ':'))}
+        if cursor.reverse:
+            tokens['r'] = '1'
+        encoded = b64encode(parse.urlencode(tokens, doseq=True).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is None:
+            return None
+        try:
+            position = json.loads(cursor.position)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(offset=0, reverse=cursor.reverse, position=position)
+
+    def _get_position_from_instance(self, instance, ordering):
+        """インスタンスの、並び順の各フィールドの値のリスト"""
+        return [_to_json_value(getattr(instance, field.lstrip('-'))) for field in ordering]
+
+    @staticmethod
+    def _invert(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def _after(ordering, position):
+        """
+        並び順で position より後ろの行の条件
+
+        (a, b) の降順なら a <= 値a AND (a < 値a OR (a = 値a AND b < 値b))。
+        先頭の a <= 値a はSQLiteがインデックスの範囲検索に使うための条件。
+        """
+        condition = Q()
+        equal = {}
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        first = ordering[0]
+        bound = Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": position[0]})
+        return bound & condition
+
+
+class CreatedAtKeysetPagination(KeysetPagination):
+    """作成日時の新しい順"""
+    ordering = ('-created_at', '-id')
+
+
+class UpdatedAtKeysetPagination(KeysetPagination):
+    """更新日時の新しい順"""
+    ordering = ('-updated_at', '-id')
+
+
+class PlayedAtKeysetPagination(KeysetPagination):
+    """再生日時の新しい順"""
+    ordering = ('-played_at', '-id')
+
+
+class NameKeysetPagination(KeysetPagination):
+    """名前順"""
+    ordering = ('name', 'id')
@@ -0,0 +1,126 @@
+import contextvars
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from functools import wraps
+
+# プロファイル中のリクエストのセッション（別スレッドで実行する処理もこのセッションに加える）
+_session = contextvars.ContextVar('profile_session', default=None)
+
+PROFILE_SUFFIXES = ('.prof', '.txt')
+
+
+class ProfileSession:
+    """
+    1リクエスト分のプロファイル
+
+    cProfile はスレッドごとに計測するため、リクエストのスレッドと、execute_with_timeout などで
+    処理を渡した別スレッドに1つずつプロファイラーを用意し、終了時にまとめる。
+    """
+
+    def __init__(self):
+        self.profilers = []
+        self._lock = threading.Lock()
+        self.started_at = time.perf_counter()
+        self.token = None
+
+    def new_profiler(self):
+        profiler = cProfile.Profile()
+        with self._lock:
+            self.profilers.append(profiler)
+        return profiler
+
+    def __enter__(self):
+        self.token = _session.set(self)
+        self.new_profiler().enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profilers[0].disable()
+        _session.reset(self.token)
+
+    def stats(self):
+        stats = pstats.Stats(self.profilers[0])
+        for profiler in self.profilers[1:]:
+            stats.add(profiler)
+        return stats
+
+
+def profile_thread(func):
+    """
+    別スレッドで実行する関数を、呼び出し元のリクエストのプロファイルに含めるようにする
+
+    呼び出し元のコンテキスト変数を引き継いで（contextvars.copy_context().run で）実行すること。
+    プロファイル中でなければ何もしない。
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        session = _session.get()
+        if session is None:
+            return func(*args, **kwargs)
+        profiler = session.new_profiler()
+        profiler.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+    return wrapper
+
+
+def write_profile(session, directory, name, header, top_n=30):
+    """
+    プロファイル（pstats形式の .prof）と、累積時間の上位 top_n 件の要約（.txt）を書き出す
+
+    Returns:
+        str: 書き出した .prof ファイルのパス
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{name}.prof')
+    stats = session.stats()
+    stats.dump_stats(path)
+
+    summary = io.StringIO()
+    summary.write(header + '\n\n')
+    stats = pstats.Stats(path, stream=summary)
+    stats.sort_stats('cumulative').print_stats(top_n)
+    with open(os.path.join(directory, f'{name}.txt'), 'w', encoding='utf-8') as summary_file:
+        summary_file.write(summary.getvalue())
+    return path
+
+
+def enforce_disk_limit(directory, max_bytes, keep=None):
+    """
+    プロファイルの合計サイズが max_bytes を超えないよう、古いものから削除する
+
+    Args:
+        directory (str): プロファイルの保存先
+        max_bytes (int): 合計サイズの上限
+        keep (str, optional): 削除しないプロファイルの名前（書き出したばかりのもの）。
+            合計サイズには含めるため、これだけで上限を超える場合は他のプロファイルがすべて削除される
+
+    Returns:
+        int: 削除したファイルの数
+    """
+    kept = {f'{keep}{suffix}' for suffix in PROFILE_SUFFIXES} if keep else set()
+    try:
+        entries = [entry for entry in os.scandir(directory)
+                   if entry.is_file() and entry.name.endswith(PROFILE_SUFFIXES)]
+    except FileNotFoundError:
+        return 0
+    total = sum(entry.stat().st_size for entry in entries)
+    entries = [entry for entry in entries if entry.name not in kept]
+    files = sorted(((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries))
+    removed = 0
+    for _, size, path in files:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
@@ -0,0 +1,66 @@
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from functools import lru_cache
+
+from django.db import connections
+
+# IN (%s, %s, ...) の要素数の違いは同じ形のクエリとして扱う
+_IN_LIST_RE = re.compile(r'\((?:%s, )+%s\)')
+# 数値のリテラル（LIMIT・OFFSETなど）
+_NUMBER_RE = re.compile(r'\b\d+\b')
+
+
+@lru_cache(maxsize=1024)
+def query_shape(sql):
+    """パラメーターと IN の要素数を除いたSQL（N+1の検出で同じクエリとみなす単位）"""
+    return _NUMBER_RE.sub('N', _IN_LIST_RE.sub('(...)', sql))
+
+
+class QueryRecorder:
+    """
+    connection.execute_wrapper に渡し、実行されたクエリの件数・時間・形を記録する
+
+    executemany は1件として数える。
+
+    Args:
+        keep_queries (bool): Trueの場合は実行したSQLと時間を queries に順に残す（テストでの表示用）
+    """
+
+    def __init__(self, keep_queries=False):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+        self.queries = [] if keep_queries else None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            self.shapes[query_shape(sql)] += 1
+            if self.queries is not None:
+                self.queries.append((sql, elapsed))
+
+    def repeated(self, threshold):
+        """
+        threshold 回以上実行された同じ形のクエリ（N+1の兆候）
+
+        Returns:
+            list: (クエリの形, 実行回数) のタプルのリスト（回数の多い順）
+        """
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+
+@contextmanager
+def record_queries(keep_queries=False):
+    """ブロック内で、このスレッドのすべてのDB接続で実行されたクエリを記録する"""
+    recorder = QueryRecorder(keep_queries)
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield recorder
@@ -0,0 +1,103 @@
+import re
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from django.apps import apps
+from django.db import connection
+
+# SQLiteのEXPLAIN QUERY PLANで、条件で絞り込まずにテーブル（またはインデックス全体）を読む手順
+# （定数の行と、FTSなどの仮想テーブルの検索は除く）
+FULL_SCAN_RE = re.compile(r'^SCAN (?!CONSTANT ROW)(\S+)(?=\s|$)(?! VIRTUAL TABLE)(?: USING (?:COVERING )?INDEX (\S+))?')
+# サブクエリの結果（一時的な表）を作る手順。その表を読む SCAN はテーブルの走査ではない
+SUBQUERY_RE = re.compile(r'^(?:CO-ROUTINE|MATERIALIZE) (\S+)')
+# LIMIT で件数を限ったクエリ（インデックスの順に先頭から読む場合は LIMIT の件数だけ読んで止まる）
+LIMIT_RE = re.compile(r'\bLIMIT \d+(?: OFFSET \d+)?$')
+
+# 実行計画を確認する文（SAVEPOINT・INSERTなどは対象外）
+EXPLAINABLE_RE = re.compile(r'^\s*(?:SELECT|UPDATE|DELETE)\b', re.IGNORECASE)
+
+
+@dataclass
+class QueryPlan:
+    """クエリの実行計画"""
+    sql: str
+    params: tuple
+    steps: list
+
+    @property
+    def full_scans(self):
+        """
+        全件を読むテーブル
+
+        次の走査は読む行が限られるため除く。
+        - 部分インデックス（条件付きのインデックス）の走査（条件に合う行だけを読む）
+        - サブクエリの結果の走査
+        - 一時的なソートを伴わない、LIMIT 付きのインデックス順の走査（先頭の LIMIT 件だけを読む）
+        """
+        allowed = partial_index_names()
+        subqueries = {match.group(1) for match in map(SUBQUERY_RE.match, self.steps) if match}
+        limited = bool(LIMIT_RE.search(self.sql)) and not self.uses_temp_sort
+        scans = []
+        for match in map(FULL_SCAN_RE.match, self.steps):
+            if not match or match.group(1) in subqueries or match.group(1).startswith('(subquery'):
+                continue
+            index = match.group(2)
+            if index in allowed or (index and limited):
+                continue
+            scans.append(match.group(1))
+        return scans
+
+    @property
+    def uses_temp_sort(self):
+        return any('USE TEMP B-TREE' in step for step in self.steps)
+
+    def __str__(self):
+        steps = '\n'.join(f'    {step}' for step in self.steps)
+        return f'{self.sql}\n    params={self.params!r}\n{steps}'
+
+
+def partial_index_names():
+    return {
+        index.name
+        for model in apps.get_models()
+        for index in model._meta.indexes
+        if index.condition is not None
+    }
+
+
+def explain(sql, params=()):
+    """SQLにEXPLAIN QUERY PLANを実行する（SQLite専用）"""
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        steps = [row[-1] for row in cursor.fetchall()]
+    return QueryPlan(sql=sql, params=tuple(params or ()), steps=steps)
+
+
+@contextmanager
+def capture_query_plans():
+    """
+    ブロック内で実行されたSELECT・UPDATE・DELETEの実行計画を集める（テスト用）
+
+    ブロックを抜けた後に、実行されたときと同じSQLとパラメーターでEXPLAIN QUERY PLANを実行し、
+    yield したリストに QueryPlan を追加する。executemany は最初のパラメーターで確認する。
+
+    Example:
+        with capture_query_plans() as plans:
+            self.client.get('/api/playlists/')
+        self.assertFalse([plan for plan in plans if plan.full_scans])
+    """
+    executed = []
+
+    def record(execute, sql, params, many, context):
+        if EXPLAINABLE_RE.match(sql):
+            executed.append((sql, (params[0] if params else ()) if many else params))
+        return execute(sql, params, many, context)
+
+    plans = []
+    with connection.execute_wrapper(record):
+        yield plans
+    seen = set()
+    for sql, params in executed:
+        if sql not in seen:
+            seen.add(sql)
+            plans.append(explain(sql, params))
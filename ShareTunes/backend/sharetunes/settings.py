@@ -39,6 +39,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'sharetunes.middleware.RequestLoggingMiddleware',  # リクエストIDとログのサンプリング
+    'sharetunes.middleware.ServerTimingMiddleware',  # 処理の区間ごとの所要時間（Server-Timingヘッダー）
+    'sharetunes.middleware.QueryStatsMiddleware',  # リクエストごとのSQLクエリの件数・時間とN+1の検出
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # CORS
@@ -47,6 +50,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'sharetunes.middleware.ProfilingMiddleware',  # 指定したリクエストのプロファイル（PROFILE_*）
 ]
 
 # CORS設定 - 開発環境では制限を緩和
@@ -98,14 +102,56 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'sharetunes.wsgi.application'
 
+# SQLiteのチューニング（接続ごとに設定するPRAGMA）。SQLITE_TUNING=false でSQLiteの既定の設定に戻す
+SQLITE_TUNING = os.getenv('SQLITE_TUNING', 'True').lower() == 'true'
+SQLITE_PRAGMAS = {
+    # WALでは読み取りが書き込みを待たず、コミットもジャーナルの書き換えなしで済む
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'wal'),
+    # 書き込みロックの解放を待つミリ秒数（超えると "database is locked"）
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000')),
+    # WALではNORMALでもDBは壊れない（電源断時に直前のコミットが失われうるのみ）
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'normal'),
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+    # 負の値はKiB単位（64MiB）
+    'cache_size': int(os.getenv('SQLITE_CACHE_SIZE', '-65536')),
+    'temp_store': os.getenv('SQLITE_TEMP_STORE', 'memory'),
+}
+
 # Database
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'sharetunes.db_backends.sqlite',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # 接続を使い回す秒数（0でリクエストごとに接続し直す）
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'OPTIONS': {
+            'pragmas': SQLITE_PRAGMAS if SQLITE_TUNING else {},
+            # 書き込むトランザクションは最初に書き込みロックを取り、ロックの昇格による失敗を避ける
+            'transaction_mode': os.getenv('SQLITE_TRANSACTION_MODE', 'IMMEDIATE') if SQLITE_TUNING else 'DEFERRED',
+        },
+    }
+}
+
+# キャッシュ設定（公開プレイリストのフィードなど）
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'sharetunes'),
     }
 }
 
+# gunicornのワーカー数（gunicornも WEB_CONCURRENCY をワーカー数の既定値として読む）
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', '1'))
+# レスポンスのキャッシュ（推薦一覧・公開プレイリストのフィード）を使うか
+# LocMemCacheはプロセスごとのため、ワーカーが複数あると破棄（バージョンの更新）が他のワーカーに届かず、
+# 各キャッシュのタイムアウト（RECOMMENDATION_LIST_CACHE_TIMEOUT・PUBLIC_PLAYLIST_FEED_CACHE_TIMEOUT）まで
+# 古いページが返る。そのため既定では、LocMemCacheかつ複数ワーカーの場合はキャッシュせずに毎回組み立てる。
+# 複数ワーカーでキャッシュする場合はRedis・Memcachedなどの共有キャッシュを CACHE_BACKEND に指定する
+RESPONSE_CACHE_ENABLED = os.getenv(
+    'RESPONSE_CACHE_ENABLED',
+    str(not (CACHES['default']['BACKEND'].endswith('LocMemCache') and WEB_CONCURRENCY > 1)),
+).lower() == 'true'
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -134,7 +180,16 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 # メディアファイル設定
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, '')  # プロジェクトのルートディレクトリ内にメディアファイルを保存
+# 既定はプロジェクトのルートディレクトリ（アップロード済みの profile_pictures/ をそのまま参照する）。
+# 別の場所に置く場合は、profile_pictures/ を移動してから MEDIA_ROOT を指定する
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', os.path.join(BASE_DIR, ''))
+
+# プロフィール画像のアップロードの上限（ファイルサイズと画素数）
+PROFILE_IMAGE_MAX_BYTES = int(os.getenv('PROFILE_IMAGE_MAX_MB', '5')) * 1024 * 1024
+PROFILE_IMAGE_MAX_PIXELS = int(os.getenv('PROFILE_IMAGE_MAX_PIXELS', str(4096 * 4096)))
+# 縮小画像のサイズ（正方形の一辺のピクセル数）。WebPとJPEGの両方をバックグラウンドで生成する
+PROFILE_THUMBNAIL_SIZES = {'small': 64, 'medium': 160, 'large': 400}
+PROFILE_THUMBNAIL_WORKERS = int(os.getenv('PROFILE_THUMBNAIL_WORKERS', '1'))
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -149,6 +204,101 @@ REST_FRAMEWORK = {
     ],
 }
 
+# 一覧APIの1ページあたりの件数（page_sizeクエリパラメータで変更可能）と上限
+API_PAGE_SIZE = int(os.getenv('API_PAGE_SIZE', '20'))
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', '100'))
+
+# 公開プレイリストのフィードをキャッシュする秒数（プレイリストの更新時にも破棄される。RESPONSE_CACHE_ENABLED を参照）
+PUBLIC_PLAYLIST_FEED_CACHE_TIMEOUT = int(os.getenv('PUBLIC_PLAYLIST_FEED_CACHE_TIMEOUT', '60'))
+
+# ユーザーごとの推薦一覧ページをキャッシュする秒数（推薦の生成・フィードバックの変更時にも破棄される。RESPONSE_CACHE_ENABLED を参照）
+RECOMMENDATION_LIST_CACHE_TIMEOUT = int(os.getenv('RECOMMENDATION_LIST_CACHE_TIMEOUT', '300'))
+
+# 推薦の保持期間（日数）と、期間を過ぎた推薦のアーカイブ（月ごとのgzip圧縮JSONL）の保存先
+RECOMMENDATION_RETENTION_DAYS = int(os.getenv('RECOMMENDATION_RETENTION_DAYS', '180'))
+RECOMMENDATION_ARCHIVE_DIR = os.getenv('RECOMMENDATION_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archives', 'recommendations'))
+
+# ログ設定
+# ログはキューに入れ、バックグラウンドのスレッドで伏せ字・整形・書き込みを行う（sharetunes.log）
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'DEBUG' if DEBUG else 'INFO')
+# JSON（1行1レコード）またはテキスト
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text' if DEBUG else 'json')
+# DEBUG/INFOログを出力するリクエストの割合（WARNING以上は常に出力）
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '1.0'))
+# ロガーごとのレベル（例: LOG_LEVELS=recommendations=DEBUG,users=WARNING）
+LOG_LEVELS = dict(
+    item.split('=', 1) for item in os.getenv('LOG_LEVELS', '').split(',') if '=' in item
+)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_context': {'()': 'sharetunes.log.RequestContextFilter'},
+    },
+    'formatters': {
+        'json': {'()': 'sharetunes.log.JSONFormatter'},
+        'text': {'format': '%(asctime)s %(levelname)s [%(name)s] %(request_id)s %(message)s'},
+    },
+    'handlers': {
+        'background': {
+            '()': 'sharetunes.log.BackgroundQueueHandler',
+            'formatter': LOG_FORMAT,
+            'filters': ['request_context'],
+        },
+    },
+    'root': {
+        'handlers': ['background'],
+        'level': LOG_LEVEL,
+    },
+    'loggers': {
+        # Djangoの既定のconsoleハンドラーではなく、同じバックグラウンドのハンドラーへ出力する
+        'django': {
+            'handlers': ['background'],
+            'level': LOG_LEVELS.get('django', 'INFO').upper(),
+            'propagate': False,
+        },
+        # Pillowはプラグインの読み込みや画像のチャンクごとにDEBUGログを出すため
+        'PIL': {
+            'level': LOG_LEVELS.get('PIL', 'INFO').upper(),
+        },
+        **{
+            name: {'level': level.upper()}
+            for name, level in LOG_LEVELS.items()
+            if name not in ('django', 'PIL')
+        },
+    },
+}
+
+# /api/metrics/ へのアクセスに必要なトークン（Authorization: Bearer <token>）。
+# 空の場合、DEBUG時は制限せず、それ以外は拒否する（403）
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# すべてのリクエストに Server-Timing ヘッダー（処理の区間ごとの所要時間）を返すか（既定はDEBUG時のみ）。
+# 無効の場合も、スタッフユーザーのリクエストには返す
+SERVER_TIMING_ENABLED = os.getenv('SERVER_TIMING_ENABLED', str(DEBUG)).lower() == 'true'
+
+# リクエストごとのSQLクエリの集計。件数・合計時間がこれを超えるか、
+# 同じ形のクエリを QUERY_REPEAT_THRESHOLD 回以上実行した（N+1の兆候がある）リクエストは警告ログを出力する
+# すべてのクエリの実行をラップし、SQLの正規化も行うため、既定はDEBUG時のみ（本番では必要なときに有効にする）
+QUERY_STATS_ENABLED = os.getenv('QUERY_STATS_ENABLED', str(DEBUG)).lower() == 'true'
+QUERY_COUNT_WARNING = int(os.getenv('QUERY_COUNT_WARNING', '30'))
+QUERY_TIME_WARNING_MS = float(os.getenv('QUERY_TIME_WARNING_MS', '200'))
+QUERY_REPEAT_THRESHOLD = int(os.getenv('QUERY_REPEAT_THRESHOLD', '5'))
+
+# リクエスト単位のプロファイル（スタッフユーザーが X-Profile: 1 を付けたリクエストと、サンプリングしたリクエスト）
+# 既定は無効。PROFILE_SAMPLE_RATE を0より大きくすると、スタッフに限らずすべてのユーザーのリクエストが
+# その割合で計測され、URL（クエリ文字列を含む）が要約に残る
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False').lower() == 'true'
+PROFILE_HEADER = os.getenv('PROFILE_HEADER', 'X-Profile')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', str(BASE_DIR / 'profiles'))
+# 同時に計測するリクエスト数と、プロファイルの合計サイズの上限（超えた分は古いものから削除）
+PROFILE_MAX_CONCURRENT = int(os.getenv('PROFILE_MAX_CONCURRENT', '1'))
+PROFILE_MAX_BYTES = int(os.getenv('PROFILE_MAX_MB', '100')) * 1024 * 1024
+# 要約（.txt）に出力する関数の数（累積時間の上位）
+PROFILE_TOP_N = int(os.getenv('PROFILE_TOP_N', '30'))
+
 # JWT設定
 from datetime import timedelta
 SIMPLE_JWT = {
@@ -161,6 +311,9 @@ SIMPLE_JWT = {
 SPOTIFY_CLIENT_ID = os.getenv('SPOTIFY_CLIENT_ID', '')
 SPOTIFY_CLIENT_SECRET = os.getenv('SPOTIFY_CLIENT_SECRET', '')
 SPOTIFY_REDIRECT_URI = os.getenv('SPOTIFY_REDIRECT_URI', 'http://localhost:3000/auth/callback')
+# Web APIとトークン発行のURL（負荷試験ではスタブのサーバーに向ける）
+SPOTIFY_API_URL = os.getenv('SPOTIFY_API_URL', 'https://api.spotify.com/v1/').rstrip('/') + '/'
+SPOTIFY_ACCOUNTS_URL = os.getenv('SPOTIFY_ACCOUNTS_URL', 'https://accounts.spotify.com')
 
 # 後方互換性のためのレガシーLLM API設定
 LEGACY_LLM_API_KEY = os.getenv('LLM_API_KEY', '')
@@ -0,0 +1,32 @@
+from contextlib import contextmanager
+
+from .queries import record_queries
+
+
+@contextmanager
+def assert_max_queries(limit, max_repeats=None):
+    """
+    ブロック内のSQLクエリの件数が limit 以下であることを確認する（エンドポイントのテスト用）
+
+    assertNumQueries と違い上限のみを確認するため、クエリの増減のたびにテストを直さずに済む。
+
+    Args:
+        limit (int): クエリの件数の上限
+        max_repeats (int, optional): 同じ形のクエリの実行回数の上限（N+1の検出）
+
+    Example:
+        with assert_max_queries(5, max_repeats=1):
+            self.client.get('/api/playlists/')
+    """
+    with record_queries(keep_queries=True) as recorder:
+        yield recorder
+
+    problems = []
+    if recorder.count > limit:
+        problems.append(f'クエリが{recorder.count}件実行されました（上限 {limit}件）')
+    if max_repeats is not None:
+        for shape, count in recorder.repeated(max_repeats + 1):
+            problems.append(f'同じ形のクエリが{count}回実行されました（上限 {max_repeats}回）: {shape}')
+    if problems:
+        executed = '\n'.join(f'{index}. {sql}' for index, (sql, _) in enumerate(recorder.queries, start=1))
+        raise AssertionError('\n'.join(problems) + f'\n\n実行されたクエリ:\n{executed}')
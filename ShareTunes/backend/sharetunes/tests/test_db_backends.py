@@ -0,0 +1,85 @@
+import copy
+import os
+import sqlite3
+import tempfile
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections, transaction
+from django.test import SimpleTestCase
+
+from sharetunes.db_backends.sqlite.base import DatabaseWrapper
+
+PRAGMAS = {
+    'journal_mode': 'wal',
+    'busy_timeout': 1234,
+    'synchronous': 'normal',
+    'cache_size': -2048,
+    'temp_store': 'memory',
+}
+
+
+class SQLiteBackendTests(SimpleTestCase):
+    """接続ごとにPRAGMAとトランザクションの種類を設定するSQLiteバックエンド"""
+
+    alias = 'sqlite-backend-test'
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'backend.sqlite3')
+
+    def make_connection(self, **options):
+        # 既定値を補完済みの default の設定をもとに、一時ファイルのDBへの接続を作る
+        settings_dict = copy.deepcopy(connections['default'].settings_dict)
+        settings_dict.update(NAME=self.path, CONN_MAX_AGE=0, OPTIONS=options)
+        connection = DatabaseWrapper(settings_dict, alias=self.alias)
+        self.addCleanup(connection.close)
+        return connection
+
+    def pragma(self, connection, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_are_applied_on_connect(self):
+        connection = self.make_connection(pragmas=PRAGMAS)
+
+        self.assertEqual(self.pragma(connection, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(connection, 'busy_timeout'), 1234)
+        self.assertEqual(self.pragma(connection, 'synchronous'), 1)
+        self.assertEqual(self.pragma(connection, 'cache_size'), -2048)
+        self.assertEqual(self.pragma(connection, 'temp_store'), 2)
+
+        # 接続し直しても設定される
+        connection.close()
+        self.assertEqual(self.pragma(connection, 'busy_timeout'), 1234)
+
+    def test_atomic_begins_immediate_transaction(self):
+        connection = self.make_connection(pragmas={'journal_mode': 'wal'}, transaction_mode='immediate')
+        connection.force_debug_cursor = True
+        connections[self.alias] = connection
+        self.addCleanup(connections.__delitem__, self.alias)
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TABLE item (id INTEGER PRIMARY KEY)')
+
+        other = sqlite3.connect(self.path, timeout=0, isolation_level=None)
+        self.addCleanup(other.close)
+        with transaction.atomic(using=self.alias):
+            # 読み書きする前から書き込みロックを持っているため、他の接続は書き込みを始められない
+            with self.assertRaisesMessage(sqlite3.OperationalError, 'database is locked'):
+                other.execute('BEGIN IMMEDIATE')
+        self.assertIn('BEGIN IMMEDIATE', [query['sql'] for query in connection.queries])
+
+        other.execute('BEGIN IMMEDIATE')
+        other.execute('ROLLBACK')
+
+    def test_deferred_by_default(self):
+        connection = self.make_connection()
+        self.assertEqual(self.pragma(connection, 'journal_mode'), 'delete')
+        self.assertEqual(connection.transaction_mode, 'DEFERRED')
+
+    def test_invalid_options_are_rejected(self):
+        for options in ({'pragmas': {'user_version': 1}}, {'pragmas': {'cache_size': '1; DROP TABLE x'}},
+                        {'transaction_mode': 'EXCLUSIVELY'}):
+            with self.subTest(options=options), self.assertRaises(ImproperlyConfigured):
+                self.make_connection(**options).ensure_connection()
@@ -0,0 +1,124 @@
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from recommendations.models import Recommendation, RecommendedTrack
+from sharetunes.exports import FLAT_RECOMMENDATION_FIELDS, HISTORY_FIELDS, _buffered, export_chunks
+from tracks.models import Track, UserTrackHistory
+
+
+class BufferedTests(SimpleTestCase):
+    """文字列のチャンクへのまとめ方"""
+
+    def test_flushes_by_encoded_bytes(self):
+        pieces = ['あ' * 10] * 4
+
+        chunks = list(_buffered(pieces, flush_size=25))
+
+        # 10文字でもUTF-8では30バイトのため、1つずつ出力される
+        self.assertEqual([len(chunk) for chunk in chunks], [30, 30, 30, 30])
+        self.assertEqual(b''.join(chunks).decode('utf-8'), ''.join(pieces))
+
+    def test_remaining_pieces_are_flushed_at_end(self):
+        chunks = list(_buffered(['a', 'b', 'c'], flush_size=2))
+        self.assertEqual(chunks, [b'ab', b'c'])
+        self.assertEqual(list(_buffered([], flush_size=2)), [])
+
+
+class ExportTests(APITestCase):
+    """再生履歴・推薦履歴のエクスポート"""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.user = User.objects.create(username='export-owner')
+        other = User.objects.create(username='export-other')
+        tracks = Track.objects.bulk_create([
+            Track(spotify_id=f'export{index}', name=f'夜に駆ける{index}', artist='YOASOBI', album='THE BOOK')
+            for index in range(3)
+        ])
+        UserTrackHistory.objects.bulk_create([
+            UserTrackHistory(user=cls.user, track=track, played_at=now - timedelta(minutes=index))
+            for index, track in enumerate(tracks)
+        ] + [UserTrackHistory(user=other, track=tracks[0], played_at=now)])
+        cls.recommendation = Recommendation.objects.create(user=cls.user, context_description='雨の日')
+        RecommendedTrack.objects.bulk_create([
+            RecommendedTrack(recommendation=cls.recommendation, spotify_id=f'export{position}',
+                             name=f'推薦曲{position}', artist='歌手', explanation='しっとり', position=position)
+            for position in range(2)
+        ])
+        cls.empty_recommendation = Recommendation.objects.create(user=cls.user, context_description='晴れの日')
+        Recommendation.objects.create(user=other, context_description='他のユーザー')
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def download(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_history_ndjson(self):
+        response, body = self.download('/api/tracks/history/export/')
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertIn('filename="history.ndjson"', response['Content-Disposition'])
+        records = [json.loads(line) for line in body.decode('utf-8').splitlines()]
+        self.assertEqual([record['name'] for record in records], ['夜に駆ける0', '夜に駆ける1', '夜に駆ける2'])
+        self.assertEqual(set(records[0]), set(HISTORY_FIELDS))
+        self.assertEqual({record['user_id'] for record in records}, {self.user.pk})
+
+    def test_recommendations_csv_has_one_row_per_track(self):
+        response, body = self.download('/api/recommendations/export/', output='csv')
+
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(io.StringIO(body.decode('utf-8'))))
+        self.assertEqual(tuple(rows[0]), FLAT_RECOMMENDATION_FIELDS)
+        self.assertEqual([(int(row['recommendation_id']), row['name']) for row in rows], [
+            (self.recommendation.pk, '推薦曲0'),
+            (self.recommendation.pk, '推薦曲1'),
+            (self.empty_recommendation.pk, ''),
+        ])
+
+    def test_gzip(self):
+        _, plain = self.download('/api/recommendations/export/')
+        response, compressed = self.download('/api/recommendations/export/', gzip='1')
+
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('filename="recommendations.ndjson.gz"', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(compressed), plain)
+        self.assertEqual(len(plain.splitlines()), 2)
+
+    def test_unknown_format_is_rejected(self):
+        self.assertEqual(self.client.get('/api/tracks/history/export/', {'output': 'xml'}).status_code, 400)
+        with self.assertRaises(ValueError):
+            export_chunks('history', 'xml')
+        with self.assertRaises(ValueError):
+            export_chunks('playlists')
+
+    def test_export_listening_data_command(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'history.csv.gz')
+        stderr = io.StringIO()
+
+        call_command('export_listening_data', 'history', '--output', path, '--format', 'csv', '--gzip',
+                     '--user', str(self.user.pk), stderr=stderr)
+
+        with gzip.open(path, 'rt', encoding='utf-8') as export_file:
+            rows = list(csv.DictReader(export_file))
+        self.assertEqual([row['spotify_id'] for row in rows], ['export0', 'export1', 'export2'])
+        self.assertIn(f'{os.path.getsize(path)}バイトを書き出しました', stderr.getvalue())
+
+        with self.assertRaises(CommandError):
+            call_command('export_listening_data', 'history', '--output', path, '--user', '0')
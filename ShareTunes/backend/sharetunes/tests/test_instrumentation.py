@@ -0,0 +1,90 @@
+from django.contrib.auth.models import User
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from recommendations.models import Recommendation, RecommendedTrack
+from sharetunes.metrics import request_queries
+from sharetunes.queries import record_queries
+
+
+class MetricsAccessTests(APITestCase):
+    """/api/metrics/ へのアクセス制限"""
+
+    @override_settings(METRICS_TOKEN='', DEBUG=False)
+    def test_denied_without_token_in_production(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='', DEBUG=True)
+    def test_open_without_token_in_debug(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='secret', DEBUG=False)
+    def test_token_required(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 401)
+        self.assertEqual(self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        response = self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'sharetunes_list_cache_requests_total', response.content)
+
+
+class ServerTimingHeaderTests(APITestCase):
+    """Server-Timing ヘッダーを返す条件"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='timing-user')
+        cls.staff = User.objects.create(username='timing-staff', is_staff=True)
+
+    @override_settings(SERVER_TIMING_ENABLED=False)
+    def test_hidden_from_regular_users(self):
+        self.client.force_authenticate(self.user)
+        self.assertNotIn('Server-Timing', self.client.get('/api/playlists/'))
+        self.client.force_authenticate(None)
+        self.assertNotIn('Server-Timing', self.client.get('/api/health/'))
+
+    @override_settings(SERVER_TIMING_ENABLED=False)
+    def test_returned_to_staff(self):
+        self.client.force_authenticate(self.staff)
+        self.assertIn('total;dur=', self.client.get('/api/playlists/')['Server-Timing'])
+
+    @override_settings(SERVER_TIMING_ENABLED=True)
+    def test_returned_to_everyone_when_enabled(self):
+        self.assertIn('total;dur=', self.client.get('/api/health/')['Server-Timing'])
+
+
+@override_settings(QUERY_STATS_ENABLED=True)
+class QueryStatsMiddlewareTests(APITestCase):
+    """リクエストごとのSQLクエリの集計"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='query-stats-user')
+        for index in range(3):
+            recommendation = Recommendation.objects.create(user=cls.user, context_description=f'推薦{index}')
+            RecommendedTrack.objects.create(recommendation=recommendation, spotify_id=f'stats{index}',
+                                            name=f'推薦曲{index}', artist='アーティスト', explanation='', position=0)
+
+    def setUp(self):
+        request_queries.reset()
+        self.client.force_authenticate(self.user)
+
+    def observed(self):
+        """ヒストグラムに記録された (リクエスト数, クエリ件数の合計)"""
+        series = list(request_queries.snapshot().values())
+        return sum(item['count'] for item in series), sum(item['sum'] for item in series)
+
+    def test_regular_response(self):
+        with record_queries() as recorder:
+            response = self.client.get('/api/playlists/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.observed(), (1, recorder.count))
+
+    def test_streamed_response_counts_queries_until_closed(self):
+        with record_queries() as recorder:
+            response = self.client.get('/api/recommendations/export/')
+            self.assertEqual(self.observed(), (0, 0))
+            body = b''.join(response.streaming_content)
+        self.assertEqual(body.count(b'\n'), 3)
+        # ストリーミング中のクエリ（推薦と楽曲の読み出し）も含めて、閉じたときに1回だけ記録される
+        self.assertGreater(recorder.count, 1)
+        self.assertEqual(self.observed(), (1, recorder.count))
@@ -0,0 +1,166 @@
+import io
+import json
+import logging
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+from rest_framework.test import APITestCase
+
+from sharetunes.log import (
+    REDACTED, BackgroundQueueHandler, JSONFormatter, RedactSecretsFilter, RequestContextFilter, redact,
+    reset_request_context, set_request_context, should_sample,
+)
+
+
+def make_record(msg='message', level=logging.INFO, args=(), **extra):
+    record = logging.LogRecord('sharetunes.test', level, __file__, 0, msg, args, None)
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+
+class RedactTests(SimpleTestCase):
+    """秘密情報の伏せ字"""
+
+    def test_redact_text(self):
+        self.assertEqual(redact('Authorization: Bearer abc.def-123'), f'Authorization: Bearer {REDACTED}')
+        self.assertEqual(redact('GET /callback?code=xyz&state=1'), f'GET /callback?code={REDACTED}&state=1')
+        self.assertEqual(redact("{'refresh_token': 'abc', 'name': 'taro'}"),
+                         f"{{'refresh_token': '{REDACTED}', 'name': 'taro'}}")
+        self.assertEqual(redact('楽曲を10件取得しました'), '楽曲を10件取得しました')
+
+    def test_filter_redacts_message_and_extras(self):
+        payload = {'user': 'taro', 'token': 'abc', 'tracks': [{'id': 1, 'access_token': 'def'}, 'password=ghi']}
+        record = make_record('refresh: %s', args=('refresh_token=secret',), password='pw',
+                             url='/api?api_key=key', payload=payload, ids=('id1', 'secret=xyz'), count=3)
+
+        self.assertTrue(RedactSecretsFilter().filter(record))
+
+        self.assertEqual(record.getMessage(), f'refresh: refresh_token={REDACTED}')
+        self.assertEqual(record.password, REDACTED)
+        self.assertEqual(record.url, f'/api?api_key={REDACTED}')
+        self.assertEqual(record.payload, {
+            'user': 'taro', 'token': REDACTED, 'tracks': [{'id': 1, 'access_token': REDACTED}, f'password={REDACTED}'],
+        })
+        self.assertEqual(record.ids, ('id1', f'secret={REDACTED}'))
+        self.assertEqual(record.count, 3)
+        # 呼び出し元が渡した辞書は書き換えない
+        self.assertEqual(payload['token'], 'abc')
+        self.assertEqual(payload['tracks'][0]['access_token'], 'def')
+
+    def test_json_output_contains_no_secrets(self):
+        record = make_record('ログイン', extra_data={'nested': {'spotify_refresh_token': 'very-secret'}})
+        RedactSecretsFilter().filter(record)
+        entry = json.loads(JSONFormatter().format(record))
+        self.assertEqual(entry['extra_data'], {'nested': {'spotify_refresh_token': REDACTED}})
+        self.assertNotIn('very-secret', json.dumps(entry))
+
+
+class RequestContextFilterTests(SimpleTestCase):
+    """リクエストIDの付与とサンプリング"""
+
+    def filtered(self, record, request_id, sampled):
+        tokens = set_request_context(request_id, sampled)
+        try:
+            return RequestContextFilter().filter(record)
+        finally:
+            reset_request_context(tokens)
+
+    def test_sampled_request_keeps_all_levels(self):
+        record = make_record(level=logging.DEBUG)
+        self.assertTrue(self.filtered(record, 'req-1', True))
+        self.assertEqual(record.request_id, 'req-1')
+
+    def test_unsampled_request_drops_debug_and_info(self):
+        self.assertFalse(self.filtered(make_record(level=logging.DEBUG), 'req-2', False))
+        self.assertFalse(self.filtered(make_record(level=logging.INFO), 'req-2', False))
+        record = make_record(level=logging.WARNING)
+        self.assertTrue(self.filtered(record, 'req-2', False))
+        self.assertEqual(record.request_id, 'req-2')
+
+    def test_outside_request_keeps_all_levels(self):
+        record = make_record(level=logging.DEBUG)
+        self.assertTrue(RequestContextFilter().filter(record))
+        self.assertIsNone(record.request_id)
+
+    def test_should_sample(self):
+        self.assertTrue(should_sample(1))
+        self.assertFalse(should_sample(0))
+        with mock.patch('sharetunes.log.random.random', return_value=0.3):
+            self.assertTrue(should_sample(0.5))
+            self.assertFalse(should_sample(0.2))
+
+
+class BackgroundQueueHandlerTests(SimpleTestCase):
+    """バックグラウンドのスレッドで書き込むハンドラー"""
+
+    def make_logger(self, handler):
+        logger = logging.getLogger(f'sharetunes.test.{id(handler)}')
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        return logger
+
+    def test_stop_flushes_queued_records(self):
+        stream = io.StringIO()
+        handler = BackgroundQueueHandler(stream=stream)
+        handler.setFormatter(JSONFormatter())
+        logger = self.make_logger(handler)
+
+        payload = {'token': 'abc'}
+        for index in range(100):
+            logger.info('record %d code=%s', index, 'xyz', extra={'payload': payload})
+        payload['token'] = 'changed'
+        handler.stop()
+        handler.stop()
+
+        entries = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([entry['message'] for entry in entries],
+                         [f'record {index} code={REDACTED}' for index in range(100)])
+        self.assertEqual(entries[0]['payload'], {'token': REDACTED})
+        self.assertFalse(handler.listener._thread)
+
+    def test_full_queue_drops_records_without_blocking(self):
+        stream = io.StringIO()
+        handler = BackgroundQueueHandler(stream=stream, maxsize=1)
+        logger = self.make_logger(handler)
+        started, release = threading.Event(), threading.Event()
+        emit = handler.target.emit
+
+        def blocking_emit(record):
+            started.set()
+            release.wait(5)
+            emit(record)
+
+        handler.target.emit = blocking_emit
+        logger.warning('record 0')
+        self.assertTrue(started.wait(5))
+        # 書き込み中のスレッドが取り出せない間は、1件だけキューに入り残りは捨てられる
+        for index in range(1, 4):
+            logger.warning('record %d', index)
+        self.assertEqual(handler.dropped, 2)
+
+        # キューが一杯のまま止めても、書き込みの完了を待って終了する
+        threading.Timer(0.05, release.set).start()
+        handler.stop()
+        self.assertEqual(stream.getvalue().splitlines(), ['record 0', 'record 1'])
+
+
+class RequestIdTests(APITestCase):
+    """X-Request-ID の引き継ぎ"""
+
+    def request_id(self, value):
+        return self.client.get('/api/health/', HTTP_X_REQUEST_ID=value)['X-Request-ID']
+
+    def test_valid_request_id_is_kept(self):
+        self.assertEqual(self.request_id('abc-123_DEF.4'), 'abc-123_DEF.4')
+        self.assertEqual(self.request_id('a' * 64), 'a' * 64)
+
+    def test_invalid_request_id_is_replaced(self):
+        for value in ('', 'a' * 65, 'id with spaces', 'id\r\nX-Injected: 1', '<script>', '"quoted"'):
+            with self.subTest(value=value):
+                request_id = self.request_id(value)
+                self.assertNotEqual(request_id, value)
+                self.assertRegex(request_id, r'^[0-9a-f]{32}$')
@@ -0,0 +1,88 @@
+import os
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, override_settings
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from sharetunes.profiling import enforce_disk_limit
+
+
+def directory_size(directory):
+    return sum(entry.stat().st_size for entry in os.scandir(directory))
+
+
+class EnforceDiskLimitTests(SimpleTestCase):
+    """プロファイルの保存先のサイズの上限"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, size, age):
+        for suffix in ('.prof', '.txt'):
+            path = os.path.join(self.directory.name, f'{name}{suffix}')
+            with open(path, 'wb') as profile_file:
+                profile_file.write(b'x' * size)
+            mtime = time.time() - age
+            os.utime(path, (mtime, mtime))
+
+    def test_removes_oldest_and_keeps_new_profile(self):
+        self.write('old', 100, age=30)
+        self.write('middle', 100, age=20)
+        self.write('new', 100, age=0)
+
+        enforce_disk_limit(self.directory.name, 450, keep='new')
+
+        self.assertEqual(sorted(os.listdir(self.directory.name)),
+                         ['middle.prof', 'middle.txt', 'new.prof', 'new.txt'])
+        self.assertLessEqual(directory_size(self.directory.name), 450)
+
+    def test_kept_profile_is_not_removed_even_if_over_limit(self):
+        self.write('old', 100, age=30)
+        self.write('new', 500, age=0)
+
+        enforce_disk_limit(self.directory.name, 450, keep='new')
+
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ['new.prof', 'new.txt'])
+
+
+class ProfilingMiddlewareTests(APITestCase):
+    """スタッフユーザーが X-Profile: 1 を付けたリクエストのプロファイル"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create(username='profile-staff', is_staff=True)
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        # プロファイルの対象かはビューの前に判定するため、JWTで認証する
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.staff).access_token}')
+
+    def test_not_profiled_when_disabled(self):
+        with override_settings(PROFILING_ENABLED=False, PROFILE_DIR=self.directory.name):
+            response = self.client.get('/api/playlists/', HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile', response)
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_directory_stays_within_limit_after_writing(self):
+        with override_settings(PROFILING_ENABLED=True, PROFILE_SAMPLE_RATE=0,
+                               PROFILE_DIR=self.directory.name, PROFILE_MAX_BYTES=1):
+            names = [self.client.get('/api/playlists/', HTTP_X_PROFILE='1')['X-Profile'] for _ in range(2)]
+
+        # 上限を超える分は削除され、最後に書き出したプロファイルだけが残る
+        self.assertEqual(sorted(os.listdir(self.directory.name)), [f'{names[-1]}.prof', f'{names[-1]}.txt'])
+
+    def test_file_name_is_generated_by_server(self):
+        with override_settings(PROFILING_ENABLED=True, PROFILE_SAMPLE_RATE=0, PROFILE_DIR=self.directory.name):
+            response = self.client.get('/api/playlists/', HTTP_X_PROFILE='1', HTTP_X_REQUEST_ID='..')
+
+        # クライアントが指定したリクエストIDはファイル名に使わず、要約にのみ記録する
+        name = response['X-Profile']
+        self.assertRegex(name, r'^\d{8}-\d{6}-[0-9a-f]{32}$')
+        self.assertEqual(sorted(os.listdir(self.directory.name)), [f'{name}.prof', f'{name}.txt'])
+        with open(os.path.join(self.directory.name, f'{name}.txt'), encoding='utf-8') as summary:
+            self.assertIn('request_id=..)', summary.readline())
@@ -0,0 +1,160 @@
+from datetime import timedelta
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, APITestCase, force_authenticate
+
+from feedbacks.models import Feedback
+from feedbacks.views import FeedbackViewSet
+from playlists.models import Playlist, PlaylistTrack
+from playlists.services import RANK_GAP, add_tracks_to_playlist, get_position, rebalance_playlist
+from playlists.views import PlaylistViewSet
+from recommendations.models import Recommendation, RecommendedTrack
+from recommendations.views import RecommendationViewSet
+from sharetunes.query_plans import capture_query_plans
+from tracks.models import Track, UserTrackHistory
+from tracks.views import TrackViewSet
+from users.models import UserProfile
+
+
+@skipUnless(connection.vendor == 'sqlite', '実行計画の確認はSQLiteのみ対応しています')
+class QueryPlanTests(APITestCase):
+    """
+    APIとサービスが実行するクエリの実行計画（EXPLAIN QUERY PLAN）
+
+    クエリはビューの get_queryset() とページネーション、サービスの関数から実際に組み立てて実行し、
+    インデックスを使わずにテーブル全体を読む手順（SCAN <テーブル>）がないことを確認する。
+    """
+
+    ROWS = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.user = User.objects.create(username='query-plan-user')
+        UserProfile.objects.create(user=cls.user, spotify_id='spotify-user', spotify_refresh_token='refresh')
+        cls.tracks = Track.objects.bulk_create([
+            Track(spotify_id=f'plan{index}', name=f'楽曲{index}', artist='アーティスト')
+            for index in range(cls.ROWS * 2)
+        ])
+        UserTrackHistory.objects.bulk_create([
+            UserTrackHistory(user=cls.user, track=track, played_at=now - timedelta(minutes=index))
+            for index, track in enumerate(cls.tracks)
+        ])
+        for index in range(cls.ROWS):
+            recommendation = Recommendation.objects.create(user=cls.user, context_description=f'推薦{index}')
+            recommended_tracks = RecommendedTrack.objects.bulk_create([
+                RecommendedTrack(recommendation=recommendation, spotify_id=f'plan{position}', name=f'推薦曲{position}',
+                                 artist='アーティスト', explanation='', position=position)
+                for position in range(cls.ROWS)
+            ])
+            Feedback.objects.create(user=cls.user, track=recommended_tracks[0], feedback_type='like')
+        cls.recommendation = recommendation
+        for index in range(cls.ROWS):
+            playlist = Playlist.objects.create(user=cls.user, name=f'プレイリスト{index}', is_public=True)
+            PlaylistTrack.objects.bulk_create([
+                PlaylistTrack(playlist=playlist, track=track, rank=(position + 1) * RANK_GAP)
+                for position, track in enumerate(cls.tracks[:cls.ROWS])
+            ])
+        cls.playlist = playlist
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.client.force_authenticate(self.user)
+
+    def assertUsesIndexes(self, func):
+        """func の中で実行されたクエリに、インデックスを使わない全件走査がないことを確認する"""
+        with capture_query_plans() as plans:
+            result = func()
+        self.assertTrue(plans, 'クエリが実行されていません')
+        full_scans = [plan for plan in plans if plan.full_scans]
+        self.assertFalse(full_scans, 'インデックスを使わずに全件走査しています:\n'
+                         + '\n\n'.join(str(plan) for plan in full_scans))
+        return result
+
+    def make_view(self, viewset, action, path='/', **kwargs):
+        """リクエストを受けた状態のビューセット（get_queryset() などを直接呼ぶため）"""
+        request = self.factory.get(path)
+        force_authenticate(request, user=self.user)
+        view = viewset(action_map={'get': action}, args=(), kwargs=kwargs, format_kwarg=None)
+        view.request = view.initialize_request(request)
+        view.headers = view.default_response_headers
+        return view
+
+    def assertPagesUseIndexes(self, viewset, action, path='/'):
+        """一覧の1ページ目と、カーソルで指定した2ページ目の取得を確認する"""
+        separator = '&' if '?' in path else '?'
+        view = self.make_view(viewset, action, f'{path}{separator}page_size=1')
+        page = self.assertUsesIndexes(lambda: view.paginate_queryset(view.get_queryset()))
+        self.assertEqual(len(page), 1)
+
+        next_link = view.paginator.get_next_link()
+        self.assertIsNotNone(next_link)
+        view = self.make_view(viewset, action, next_link)
+        self.assertEqual(len(self.assertUsesIndexes(lambda: view.paginate_queryset(view.get_queryset()))), 1)
+
+    def assertObjectUsesIndexes(self, viewset, action, pk):
+        view = self.make_view(viewset, action, pk=pk)
+        self.assertUsesIndexes(lambda: view.get_serializer(view.get_object()).data)
+
+    # 推薦
+
+    def test_recommendation_list(self):
+        self.assertPagesUseIndexes(RecommendationViewSet, 'list')
+        self.assertPagesUseIndexes(RecommendationViewSet, 'list', '/?summary=1')
+
+    def test_recommendation_detail(self):
+        self.assertObjectUsesIndexes(RecommendationViewSet, 'retrieve', self.recommendation.pk)
+
+    def test_recommendation_endpoints(self):
+        # ETagの計算など、get_queryset() 以外のクエリも含めて確認する
+        self.assertUsesIndexes(lambda: self.client.get('/api/recommendations/'))
+        self.assertUsesIndexes(lambda: self.client.get(f'/api/recommendations/{self.recommendation.pk}/'))
+
+    # 楽曲・再生履歴
+
+    def test_track_list(self):
+        self.assertPagesUseIndexes(TrackViewSet, 'list')
+
+    def test_track_history(self):
+        response = self.assertUsesIndexes(lambda: self.client.get('/api/tracks/history/?page_size=1'))
+        self.assertUsesIndexes(lambda: self.client.get(response.data['next']))
+
+    # フィードバック
+
+    def test_feedback_list(self):
+        self.assertPagesUseIndexes(FeedbackViewSet, 'list')
+
+    # プレイリスト
+
+    def test_playlist_list(self):
+        self.assertPagesUseIndexes(PlaylistViewSet, 'list')
+        self.assertPagesUseIndexes(PlaylistViewSet, 'public')
+
+    def test_playlist_detail(self):
+        self.assertObjectUsesIndexes(PlaylistViewSet, 'retrieve', self.playlist.pk)
+
+    def test_playlist_services(self):
+        playlist_tracks, _ = self.assertUsesIndexes(
+            lambda: add_tracks_to_playlist(self.playlist, self.tracks[-2:], position=1))
+        self.assertEqual(self.assertUsesIndexes(lambda: get_position(playlist_tracks[0])), 1)
+        self.assertUsesIndexes(lambda: rebalance_playlist(self.playlist))
+
+    def test_playlist_track_endpoints(self):
+        base = f'/api/playlists/{self.playlist.pk}'
+        track_ids = list(PlaylistTrack.objects.filter(playlist=self.playlist)
+                         .order_by('rank').values_list('track_id', flat=True))
+        self.assertUsesIndexes(lambda: self.client.post(f'{base}/add_track/', {'track': self.tracks[-1].pk},
+                                                        format='json'))
+        self.assertUsesIndexes(lambda: self.client.put(f'{base}/reorder_tracks/',
+                                                       {'tracks': track_ids[::-1] + [self.tracks[-1].pk]},
+                                                       format='json'))
+        self.assertUsesIndexes(lambda: self.client.delete(f'{base}/remove_track/', {'track': track_ids[0]},
+                                                          format='json'))
+
+    # ユーザー
+
+    def test_user_profile(self):
+        self.assertUsesIndexes(lambda: self.client.get('/api/auth/profile/'))
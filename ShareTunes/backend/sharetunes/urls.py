@@ -1,19 +1,51 @@
+import hmac
+import logging
+
 from django.contrib import admin
 from django.urls import path, include
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from django.conf import settings
 from django.conf.urls.static import static
 
+from recommendations.cache import list_cache_stats
+from sharetunes.log import BackgroundQueueHandler
+from sharetunes.metrics import render_metrics
+
 # 単純なヘルスチェックエンドポイント - JsonResponseを使う単純な実装
 def health_check(request):
     return JsonResponse({'status': 'ok', 'message': 'API server is running'})
 
+# Prometheus形式のメトリクス（gunicornのワーカーごとの値）
+def metrics(request):
+    token = settings.METRICS_TOKEN
+    if not token:
+        # トークンを設定していない本番環境では公開しない
+        if not settings.DEBUG:
+            return HttpResponse(status=403)
+    elif not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+
+    cache = list_cache_stats.snapshot()
+    dropped = sum(handler.dropped for handler in logging.getLogger().handlers
+                  if isinstance(handler, BackgroundQueueHandler))
+    extra_lines = [
+        '# HELP sharetunes_list_cache_requests_total 推薦一覧のレスポンスキャッシュの参照回数',
+        '# TYPE sharetunes_list_cache_requests_total counter',
+        f'sharetunes_list_cache_requests_total{{result="hit"}} {cache["hits"]}',
+        f'sharetunes_list_cache_requests_total{{result="miss"}} {cache["misses"]}',
+        '# HELP sharetunes_log_records_dropped_total キューが一杯で捨てたログの件数',
+        '# TYPE sharetunes_log_records_dropped_total counter',
+        f'sharetunes_log_records_dropped_total {dropped}',
+    ]
+    return HttpResponse(render_metrics(extra_lines), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     # ヘルスチェックエンドポイント
     path('api/health/', health_check, name='health_check'),
+    path('api/metrics/', metrics, name='metrics'),
     # API エンドポイント
     path('api/auth/', include('users.urls')),
     path('api/recommendations/', include('recommendations.urls')),
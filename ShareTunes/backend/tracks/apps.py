@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class TracksConfig(AppConfig):
+    name = 'tracks'
+
+    def ready(self):
+        # 楽曲の保存・削除を検索インデックスへ反映する
+        from . import signals  # noqa: F401
@@ -0,0 +1,107 @@
+import time
+from datetime import timedelta
+from urllib.parse import parse_qs, urlparse
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.pagination import Cursor
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from recommendations.models import Recommendation
+from recommendations.views import RecommendationViewSet
+from sharetunes.benchmarking import benchmark_database, measure, summarize
+from sharetunes.pagination import CreatedAtKeysetPagination, KeysetPagination, PlayedAtKeysetPagination
+from tracks.models import Track, UserTrackHistory
+from tracks.views import user_track_history
+
+
+class Command(BaseCommand):
+    help = '再生履歴・推薦一覧のキーセットページネーションを深さ別に計測する（テストDBを使用）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000,
+                            help='ユーザーあたりの再生履歴・推薦件数（デフォルト: 100,000）')
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='各深さでの計測回数')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        with benchmark_database():
+            user = self.populate(rows)
+            factory = APIRequestFactory()
+            endpoints = [
+                ('再生履歴', '/api/tracks/history/', user_track_history,
+                 UserTrackHistory.objects.filter(user=user), PlayedAtKeysetPagination.ordering),
+                ('推薦一覧', '/api/recommendations/', RecommendationViewSet.as_view({'get': 'list'}),
+                 Recommendation.objects.filter(user=user), CreatedAtKeysetPagination.ordering),
+            ]
+            for label, path, view, queryset, ordering in endpoints:
+                queryset = queryset.order_by(*ordering)
+                self.stdout.write(f'--- {label} ({rows}件) ---')
+                for depth in (0, rows // 10, rows // 2, rows - options['page_size']):
+                    url = self.cursor_url(path, queryset, ordering, depth, options['page_size'])
+
+                    def fetch():
+                        request = factory.get(url, HTTP_HOST='localhost')
+                        force_authenticate(request, user=user)
+                        response = view(request)
+                        assert response.status_code == 200, response.status_code
+                        return response
+
+                    timings = measure(fetch, repeat=options['repeat'])
+                    self.stdout.write(f'  深さ {depth:>7}件目: {summarize(timings)}')
+
+                # 比較用: OFFSETによる同じ深さのページ取得
+                depth = rows - options['page_size']
+                timings = measure(
+                    lambda: list(queryset[depth:depth + options['page_size']]),
+                    repeat=options['repeat']
+                )
+                self.stdout.write(f'  (比較) OFFSET {depth}件目: {summarize(timings)}')
+
+    def populate(self, rows):
+        self.stdout.write(f'{rows}件の再生履歴と推薦を生成しています...')
+        start = time.time()
+        user = User.objects.create(username='benchmark')
+        # フィルタの選択性を確認するため、別ユーザーのデータも混在させる
+        other = User.objects.create(username='benchmark-other')
+
+        tracks = Track.objects.bulk_create(
+            [Track(spotify_id=f'bench{i}', name=f'Track {i:05d}', artist='Artist') for i in range(1000)]
+        )
+        now = timezone.now()
+        for owner in (user, other):
+            UserTrackHistory.objects.bulk_create(
+                (
+                    UserTrackHistory(user=owner, track=tracks[i % len(tracks)], played_at=now - timedelta(seconds=i))
+                    for i in range(rows)
+                ),
+                batch_size=5000,
+            )
+            recommendations = Recommendation.objects.bulk_create(
+                (
+                    Recommendation(user=owner, prompt_text='', llm_response='', context_description=f'#{i}')
+                    for i in range(rows)
+                ),
+                batch_size=5000,
+            )
+            # auto_now_add は一括作成で同一時刻になるため、作成日時をずらして実データに近づける
+            for recommendation in recommendations:
+                recommendation.created_at = now - timedelta(seconds=recommendation.id)
+            Recommendation.objects.bulk_update(recommendations, ['created_at'], batch_size=5000)
+
+        self.stdout.write(f'生成完了（所要時間: {time.time() - start:.1f}秒）')
+        return user
+
+    def cursor_url(self, path, queryset, ordering, depth, page_size):
+        """指定した深さのページを指すカーソル付きURLを作る"""
+        query = f'?page_size={page_size}'
+        if depth == 0:
+            return path + query
+        paginator = KeysetPagination()
+        paginator.base_url = 'http://testserver' + path
+        position = paginator._get_position_from_instance(queryset[depth - 1], ordering)
+        encoded = parse_qs(urlparse(paginator.encode_cursor(Cursor(offset=0, reverse=False, position=position))).query)
+        return f"{path}{query}&cursor={encoded['cursor'][0]}"
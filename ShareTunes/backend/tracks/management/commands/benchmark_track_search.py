@@ -0,0 +1,130 @@
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from sharetunes.benchmarking import summarize
+from tracks.search import (
+    PREFIX_TABLE, SEARCH_SCHEMA_SQL, SEARCH_TABLE, build_search_query, normalize_search_text,
+)
+
+# 合成カタログ生成用の音節（全角/半角・カタカナ/ひらがなの揺れを含める）
+SYLLABLES = (
+    [a + b for a in 'kstnhmrgbpy' for b in 'aeiou']
+    + list('あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわん')
+    + list('アイウエオカキクケコサシスセソタチツテトナニヌネノハヒフヘホマミムメモヤユヨラリルレロワン')
+    + list('夜夢夏空星心雨街桜海光風花月愛青')
+    + ['ｶ', 'ｻ', 'ﾅ', 'ﾗ', 'Ａ', 'Ｂ', 'ＬＯ', 'ＶＥ']
+)
+
+
+class Command(BaseCommand):
+    help = '合成カタログで楽曲検索（LIKE部分一致とFTS5インデックス）のレイテンシを比較する'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tracks', type=int, default=1_000_000,
+                            help='合成する楽曲数（デフォルト: 1,000,000）')
+        parser.add_argument('--queries', type=int, default=300,
+                            help='計測するクエリ数')
+        parser.add_argument('--limit', type=int, default=50,
+                            help='1クエリあたりの取得件数')
+        parser.add_argument('--db', default=None,
+                            help='ベンチマーク用SQLiteファイル（省略時は一時ファイル）')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        path = options['db'] or os.path.join(tempfile.mkdtemp(prefix='track-search-bench-'), 'bench.sqlite3')
+        db = sqlite3.connect(path)
+
+        if not db.execute("SELECT name FROM sqlite_master WHERE name = 'tracks_track'").fetchone():
+            self.build_catalog(db, rng, options['tracks'])
+
+        queries = self.sample_queries(db, rng, options['queries'])
+        limit = options['limit']
+
+        like_timings = []
+        fts_timings = []
+        for query in queries:
+            pattern = f'%{query}%'
+            start = time.perf_counter()
+            db.execute(
+                "SELECT id FROM tracks_track WHERE name LIKE ? OR artist LIKE ? ORDER BY name LIMIT ?",
+                (pattern, pattern, limit)
+            ).fetchall()
+            like_timings.append((time.perf_counter() - start) * 1000)
+
+            sql, params = build_search_query([(query, None)], limit=limit)
+            start = time.perf_counter()
+            db.execute(sql.replace('%s', '?'), params).fetchall()
+            fts_timings.append((time.perf_counter() - start) * 1000)
+
+        db.close()
+        self.stdout.write(f'DB: {path}')
+        self.report('LIKE %q% (icontains相当)', like_timings)
+        self.report('FTS5 trigram インデックス', fts_timings)
+
+    def build_catalog(self, db, rng, count):
+        self.stdout.write(f'{count}件の合成カタログを生成しています...')
+        start = time.time()
+        db.execute('PRAGMA journal_mode=OFF')
+        db.execute('PRAGMA synchronous=OFF')
+        db.execute(
+            'CREATE TABLE tracks_track (id INTEGER PRIMARY KEY, name TEXT NOT NULL, '
+            'artist TEXT NOT NULL, album TEXT)'
+        )
+        for sql in SEARCH_SCHEMA_SQL:
+            db.execute(sql)
+
+        def word():
+            return ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+        def words(low, high):
+            return ' '.join(word() for _ in range(rng.randint(low, high)))
+
+        batch_size = 10_000
+        for offset in range(0, count, batch_size):
+            rows = [
+                (offset + i + 1, words(1, 4), words(1, 2), words(1, 3))
+                for i in range(min(batch_size, count - offset))
+            ]
+            db.executemany('INSERT INTO tracks_track VALUES (?, ?, ?, ?)', rows)
+            normalized_rows = [(row[0], *(normalize_search_text(value) for value in row[1:])) for row in rows]
+            db.executemany(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, name, artist, album) VALUES (?, ?, ?, ?)',
+                normalized_rows
+            )
+            db.executemany(
+                f'INSERT INTO {PREFIX_TABLE} (key, field, track_id) VALUES (?, ?, ?)',
+                [
+                    (key, field, row[0])
+                    for row in normalized_rows
+                    for field, key in (('name', row[1]), ('artist', row[2]))
+                ]
+            )
+            db.commit()
+        db.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')")
+        db.commit()
+        self.stdout.write(f'生成完了（所要時間: {time.time() - start:.1f}秒）')
+
+    def sample_queries(self, db, rng, count):
+        """カタログ内の曲名から前方一致（オートコンプリート）と部分一致のクエリを作る"""
+        max_id = db.execute('SELECT max(id) FROM tracks_track').fetchone()[0]
+        queries = []
+        while len(queries) < count:
+            row = db.execute('SELECT name FROM tracks_track WHERE id = ?', (rng.randint(1, max_id),)).fetchone()
+            if not row:
+                continue
+            name = row[0]
+            if rng.random() < 0.5:
+                queries.append(name[:rng.randint(1, min(len(name), 8))])
+            else:
+                start = rng.randint(0, max(0, len(name) - 3))
+                queries.append(name[start:start + rng.randint(3, 8)])
+        return [query for query in queries if query.strip()]
+
+    def report(self, label, timings):
+        self.stdout.write(f'{label}: {summarize(timings)}')
@@ -0,0 +1,46 @@
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from sharetunes.exports import EXPORT_FORMATS, export_chunks
+
+
+class Command(BaseCommand):
+    help = '再生履歴・推薦履歴をNDJSON/CSVで逐次書き出す（件数によらずメモリ使用量は一定）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['history', 'recommendations'],
+                            help='エクスポート対象')
+        parser.add_argument('--output', '-o', default='-',
+                            help='出力先ファイル（省略時は標準出力）')
+        parser.add_argument('--format', dest='export_format', choices=EXPORT_FORMATS, default='ndjson')
+        parser.add_argument('--gzip', action='store_true', help='gzip圧縮して出力する')
+        parser.add_argument('--user', type=int, default=None,
+                            help='対象ユーザーID（省略時は全ユーザー）')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user'] is not None:
+            try:
+                user = User.objects.get(pk=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"ユーザーID {options['user']} が見つかりません")
+
+        chunks = export_chunks(options['kind'], options['export_format'], user=user, compress=options['gzip'])
+
+        start_time = time.time()
+        written = 0
+        output = sys.stdout.buffer if options['output'] == '-' else open(options['output'], 'wb')
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+
+        self.stderr.write(self.style.SUCCESS(
+            f'{written}バイトを書き出しました（所要時間: {time.time() - start_time:.2f}秒）'
+        ))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tracks.models import Track
+from tracks.search import is_search_index_available, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = '楽曲検索用のFTS5インデックスを作り直す'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='1回に登録する件数')
+
+    def handle(self, *args, **options):
+        if not is_search_index_available():
+            raise CommandError('検索インデックスはSQLiteでのみ利用できます')
+
+        start_time = time.time()
+        indexed = rebuild_search_index(Track.objects.all(), batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{indexed}件の楽曲を登録しました（所要時間: {time.time() - start_time:.2f}秒）'
+        ))
@@ -0,0 +1,60 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from tracks.services import SPOTIFY_TRACKS_BATCH_SIZE, TrackRehydrationService
+
+
+class Command(BaseCommand):
+    help = '保存済み楽曲のプレビューURL・画像URLをSpotifyから一括で再取得する'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-hours', type=float, default=24,
+                            help='この時間より前に更新された楽曲を対象とする（デフォルト: 24）')
+        parser.add_argument('--recommended-days', type=float, default=None,
+                            help='指定日数以内の推薦に含まれる楽曲も対象とする')
+        parser.add_argument('--limit', type=int, default=None,
+                            help='1回の実行で処理する最大件数')
+        parser.add_argument('--batch-size', type=int, default=SPOTIFY_TRACKS_BATCH_SIZE,
+                            help=f'1リクエストあたりのID数（最大{SPOTIFY_TRACKS_BATCH_SIZE}）')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='並行リクエスト数')
+        parser.add_argument('--max-rps', type=float, default=10,
+                            help='Spotify APIへの最大リクエスト数/秒')
+
+    def handle(self, *args, **options):
+        service = TrackRehydrationService(
+            batch_size=options['batch_size'],
+            max_workers=options['workers'],
+            max_requests_per_second=options['max_rps'],
+        )
+        if not service.spotify_client:
+            raise CommandError('SPOTIFY_CLIENT_ID / SPOTIFY_CLIENT_SECRET が設定されていません')
+
+        recommended_since = None
+        if options['recommended_days'] is not None:
+            recommended_since = timezone.now() - timedelta(days=options['recommended_days'])
+
+        spotify_ids = service.collect_spotify_ids(
+            stale_after=timedelta(hours=options['stale_hours']),
+            recommended_since=recommended_since,
+            limit=options['limit'],
+        )
+        if not spotify_ids:
+            self.stdout.write('再取得対象の楽曲はありません')
+            return
+
+        self.stdout.write(f'{len(spotify_ids)}件の楽曲を再取得します')
+        start_time = time.time()
+        stats = service.rehydrate(spotify_ids)
+        elapsed = time.time() - start_time
+
+        self.stdout.write(self.style.SUCCESS(
+            f"完了: 取得 {stats['fetched']}/{stats['requested']}件, "
+            f"Track更新 {stats['tracks_updated']}件, "
+            f"RecommendedTrack更新 {stats['recommended_tracks_updated']}件, "
+            f"失敗バッチ {stats['failed_batches']}件 "
+            f"（所要時間: {elapsed:.2f}秒）"
+        ))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tracks.services import RecentlyPlayedSyncService
+
+
+class Command(BaseCommand):
+    help = 'Spotifyの最近再生した曲をユーザーごとの再生履歴へ増分同期する'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8,
+                            help='並行して同期するユーザー数')
+        parser.add_argument('--max-rps', type=float, default=20,
+                            help='Spotify APIへの最大リクエスト数/秒')
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='同期対象のユーザーID（複数指定可）')
+        parser.add_argument('--progress-every', type=int, default=500,
+                            help='進捗を表示するユーザー数の間隔')
+
+    def handle(self, *args, **options):
+        service = RecentlyPlayedSyncService(
+            max_workers=options['workers'],
+            max_requests_per_second=options['max_rps'],
+        )
+        profiles = service.iter_profiles(options['user_ids'])
+        progress_every = options['progress_every']
+        start_time = time.time()
+
+        def report_progress(stats):
+            if progress_every and stats['users'] % progress_every == 0:
+                elapsed = time.time() - start_time
+                self.stdout.write(
+                    f"{stats['users']}ユーザー処理済み, {stats['plays']}件 "
+                    f"({stats['plays'] / elapsed if elapsed else 0:.1f} rows/sec)"
+                )
+
+        stats = service.sync(profiles, on_user=report_progress)
+        elapsed = time.time() - start_time
+        rows_per_sec = stats['plays'] / elapsed if elapsed else 0
+
+        self.stdout.write(self.style.SUCCESS(
+            f"完了: {stats['users']}ユーザー（失敗 {stats['failed_users']}）, "
+            f"再生履歴 {stats['plays']}件, {rows_per_sec:.1f} rows/sec "
+            f"（所要時間: {elapsed:.2f}秒）"
+        ))
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-19 10:59
+
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tracks', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='usertrackhistory',
+            unique_together={('user', 'track', 'played_at')},
+        ),
+    ]
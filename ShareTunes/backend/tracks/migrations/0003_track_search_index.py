@@ -0,0 +1,31 @@
+from django.db import migrations
+
+from tracks.search import DROP_SEARCH_SCHEMA_SQL, SEARCH_SCHEMA_SQL, rebuild_search_index
+
+
+def create_search_index(apps, schema_editor):
+    # FTS5はSQLite専用のため、他のDBではicontainsによる検索にフォールバックする
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in SEARCH_SCHEMA_SQL:
+        schema_editor.execute(sql)
+    Track = apps.get_model('tracks', 'Track')
+    rebuild_search_index(Track.objects.all())
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_SEARCH_SCHEMA_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracks', '0002_alter_usertrackhistory_unique_together'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracks', '0003_track_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='track',
+            index=models.Index(fields=['name', 'id'], name='track_name'),
+        ),
+        migrations.AddIndex(
+            model_name='usertrackhistory',
+            index=models.Index(fields=['user', '-played_at', '-id'], name='history_user_played'),
+        ),
+    ]
@@ -16,6 +16,10 @@ class Track(models.Model):
         verbose_name = '楽曲'
         verbose_name_plural = '楽曲'
         ordering = ['name']
+        indexes = [
+            # 名前順の一覧（キーセットページネーション）用
+            models.Index(fields=['name', 'id'], name='track_name'),
+        ]
 
     def __str__(self):
         return f"{self.name} by {self.artist}"
@@ -31,6 +35,12 @@ class UserTrackHistory(models.Model):
         verbose_name = '楽曲再生履歴'
         verbose_name_plural = '楽曲再生履歴'
         ordering = ['-played_at']
+        # 同じ再生を重複して保存しない
+        unique_together = ('user', 'track', 'played_at')
+        indexes = [
+            # ユーザーごとの新しい順の再生履歴（キーセットページネーション）用
+            models.Index(fields=['user', '-played_at', '-id'], name='history_user_played'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.track.name} ({self.played_at})"
\ No newline at end of file
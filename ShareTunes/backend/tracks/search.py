@@ -0,0 +1,281 @@
+import re
+import unicodedata
+
+from django.db import connection
+
+# 楽曲検索用のFTS5仮想テーブル（rowid は tracks_track.id と一致させる）
+SEARCH_TABLE = 'tracks_track_fts'
+
+# 短い入力のオートコンプリート用に、正規化した曲名・アーティスト名を前方一致で引く索引テーブル
+PREFIX_TABLE = 'tracks_track_search_prefix'
+
+# trigramトークナイザーは語の区切りがない日本語でも部分一致で検索できる
+SEARCH_SCHEMA_SQL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+    "USING fts5(name, artist, album, tokenize='trigram')",
+    f"CREATE TABLE IF NOT EXISTS {PREFIX_TABLE} "
+    "(key TEXT NOT NULL, field TEXT NOT NULL, track_id INTEGER NOT NULL)",
+    f"CREATE INDEX IF NOT EXISTS {PREFIX_TABLE}_key ON {PREFIX_TABLE} (key)",
+    f"CREATE INDEX IF NOT EXISTS {PREFIX_TABLE}_track_id ON {PREFIX_TABLE} (track_id)",
+]
+DROP_SEARCH_SCHEMA_SQL = [
+    f"DROP TABLE IF EXISTS {SEARCH_TABLE}",
+    f"DROP TABLE IF EXISTS {PREFIX_TABLE}",
+]
+
+# 検索対象のカラムとbm25の重み（曲名 > アーティスト > アルバム）
+SEARCH_COLUMNS = ('name', 'artist', 'album')
+PREFIX_COLUMNS = ('name', 'artist')
+BM25_WEIGHTS = (10.0, 5.0, 1.0)
+
+# trigramインデックスが使える最小の文字数
+MIN_INDEXED_TERM_LENGTH = 3
+
+DEFAULT_SEARCH_LIMIT = 50
+INDEX_BATCH_SIZE = 1000
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_search_text(text):
+    """
+    検索用に文字列を正規化
+
+    全角/半角の揺れをNFKCで吸収し、小文字化したうえでカタカナをひらがなに揃える。
+    """
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKC', text).casefold()
+    # カタカナ（ァ〜ヶ）をひらがなへ変換
+    text = ''.join(chr(ord(char) - 0x60) if 'ァ' <= char <= 'ヶ' else char for char in text)
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+def is_search_index_available():
+    """現在のDBでFTS5検索インデックスが使えるか（SQLiteで、索引テーブルが作成済みか）"""
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [SEARCH_TABLE])
+        return cursor.fetchone() is not None
+
+
+def _quote_term(term):
+    """FTS5のフレーズとして安全に扱えるようにクオート"""
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def build_search_query(criteria, limit=DEFAULT_SEARCH_LIMIT):
+    """
+    検索インデックスに対するSQLを組み立てる
+
+    3文字以上の語はtrigramインデックスでの部分一致で検索し、曲名が入力で始まる楽曲を優先して
+    bm25のスコア順に並べる。3文字未満の語しかない入力はオートコンプリートとみなし、
+    曲名・アーティスト名の前方一致を索引テーブルから引く。
+
+    Args:
+        criteria (list): (検索文字列, 対象カラム) のタプルのリスト。カラムがNoneの場合は全カラム
+        limit (int): 最大件数
+
+    Returns:
+        tuple: (sql, params)。検索語がない場合はNone
+    """
+    normalized_criteria = []
+    for query, field in criteria:
+        if field is not None and field not in SEARCH_COLUMNS:
+            raise ValueError(f"検索できないカラムです: {field}")
+        normalized = normalize_search_text(query)
+        if normalized:
+            normalized_criteria.append((normalized, field))
+    if not normalized_criteria:
+        return None
+
+    has_indexed_term = any(
+        len(term) >= MIN_INDEXED_TERM_LENGTH
+        for normalized, _ in normalized_criteria
+        for term in normalized.split(' ')
+    )
+    if has_indexed_term:
+        return _build_match_query(normalized_criteria, limit)
+    return _build_prefix_query(normalized_criteria, limit)
+
+
+def _build_match_query(normalized_criteria, limit):
+    match_terms = []
+    conditions = []
+    params = []
+    prefix = None
+    for normalized, field in normalized_criteria:
+        if prefix is None and field in (None, 'name'):
+            prefix = normalized
+
+        field_terms = []
+        for term in normalized.split(' '):
+            if len(term) >= MIN_INDEXED_TERM_LENGTH:
+                field_terms.append(_quote_term(term))
+            else:
+                # 短い語はtrigramで引けないため、MATCHで絞り込んだ行に対して前方一致で判定する
+                columns = (field,) if field else SEARCH_COLUMNS
+                conditions.append('(' + ' OR '.join(f"{column} LIKE %s ESCAPE '\\'" for column in columns) + ')')
+                params.extend([_escape_like(term) + '%'] * len(columns))
+        if field_terms:
+            expression = ' AND '.join(field_terms)
+            match_terms.append(f"{field} : ({expression})" if field else expression)
+
+    conditions.insert(0, f"{SEARCH_TABLE} MATCH %s")
+    params.insert(0, ' AND '.join(match_terms))
+
+    order_by = []
+    if prefix is not None:
+        order_by.append("name LIKE %s ESCAPE '\\' DESC")
+        params.append(_escape_like(prefix) + '%')
+    weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+    order_by.append(f"bm25({SEARCH_TABLE}, {weights})")
+
+    sql = (
+        f"SELECT rowid FROM {SEARCH_TABLE} "
+        f"WHERE {' AND '.join(conditions)} "
+        f"ORDER BY {', '.join(order_by)} "
+        f"LIMIT %s"
+    )
+    return sql, params + [limit]
+
+
+def _prefix_condition(alias, normalized, field):
+    """索引テーブルのキーに対する範囲条件（インデックスで前方一致を引く）"""
+    fields = (field,) if field in PREFIX_COLUMNS else PREFIX_COLUMNS
+    sql = (
+        f"{alias}.key >= %s AND {alias}.key < %s "
+        f"AND {alias}.field IN ({', '.join(['%s'] * len(fields))})"
+    )
+    return sql, [normalized, normalized + '\U0010ffff', *fields]
+
+
+def _build_prefix_query(normalized_criteria, limit):
+    (first, first_field), *rest = normalized_criteria
+    condition, params = _prefix_condition('p', first, first_field)
+    conditions = [condition]
+    for normalized, field in rest:
+        condition, condition_params = _prefix_condition('q', normalized, field)
+        conditions.append(f"p.track_id IN (SELECT q.track_id FROM {PREFIX_TABLE} q WHERE {condition})")
+        params.extend(condition_params)
+
+    sql = (
+        f"SELECT p.track_id FROM {PREFIX_TABLE} p "
+        f"WHERE {' AND '.join(conditions)} "
+        f"GROUP BY p.track_id "
+        f"ORDER BY min(p.key) "
+        f"LIMIT %s"
+    )
+    return sql, params + [limit]
+
+
+def search_track_ids(criteria, limit=DEFAULT_SEARCH_LIMIT):
+    """
+    検索インデックスから関連度順に楽曲IDを取得
+
+    Args:
+        criteria (list): (検索文字列, 対象カラム) のタプルのリスト
+        limit (int): 最大件数
+
+    Returns:
+        list: Track.id のリスト（関連度の高い順）
+    """
+    built = build_search_query(criteria, limit=limit)
+    if built is None:
+        return []
+    sql, params = built
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _write_index(cursor, rows):
+    """(id, name, artist, album) の行を検索インデックスへ書き込む（既存の登録は置き換える）"""
+    ids = [row[0] for row in rows]
+    _delete_index(cursor, ids)
+    normalized_rows = [
+        (track_id, normalize_search_text(name), normalize_search_text(artist), normalize_search_text(album))
+        for track_id, name, artist, album in rows
+    ]
+    cursor.executemany(
+        f"INSERT INTO {SEARCH_TABLE} (rowid, name, artist, album) VALUES (%s, %s, %s, %s)",
+        normalized_rows
+    )
+    cursor.executemany(
+        f"INSERT INTO {PREFIX_TABLE} (key, field, track_id) VALUES (%s, %s, %s)",
+        [
+            (key, field, track_id)
+            for track_id, name, artist, _ in normalized_rows
+            for field, key in (('name', name), ('artist', artist))
+            if key
+        ]
+    )
+
+
+def _delete_index(cursor, track_ids):
+    placeholders = ', '.join(['%s'] * len(track_ids))
+    cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({placeholders})", track_ids)
+    cursor.execute(f"DELETE FROM {PREFIX_TABLE} WHERE track_id IN ({placeholders})", track_ids)
+
+
+def index_tracks(tracks, batch_size=INDEX_BATCH_SIZE):
+    """
+    楽曲を検索インデックスへ登録（既存の登録は置き換える）
+
+    1件ずつの保存・削除はシグナル（tracks.signals）で反映されるため、
+    bulk_create・update など、シグナルが送られない一括の書き込みの後に呼ぶ。
+
+    Args:
+        tracks (QuerySet): 対象のTrackクエリセット
+        batch_size (int): 1回に処理する件数
+
+    Returns:
+        int: 登録した件数
+    """
+    if not is_search_index_available():
+        return 0
+
+    indexed = 0
+    last_id = 0
+    tracks = tracks.order_by('id').values_list('id', 'name', 'artist', 'album')
+    with connection.cursor() as cursor:
+        while True:
+            rows = list(tracks.filter(id__gt=last_id)[:batch_size])
+            if not rows:
+                break
+            _write_index(cursor, rows)
+            indexed += len(rows)
+            last_id = rows[-1][0]
+    return indexed
+
+
+def index_track(track):
+    """保存した楽曲1件を、DBから読み直さずに検索インデックスへ反映する"""
+    if not is_search_index_available():
+        return
+    with connection.cursor() as cursor:
+        _write_index(cursor, [(track.pk, track.name, track.artist, track.album)])
+
+
+def unindex_tracks(track_ids):
+    """削除した楽曲を検索インデックスから取り除く"""
+    track_ids = list(track_ids)
+    if not track_ids or not is_search_index_available():
+        return
+    with connection.cursor() as cursor:
+        _delete_index(cursor, track_ids)
+
+
+def rebuild_search_index(tracks, batch_size=INDEX_BATCH_SIZE):
+    """検索インデックスを作り直す"""
+    if not is_search_index_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.execute(f"DELETE FROM {PREFIX_TABLE}")
+    return index_tracks(tracks, batch_size=batch_size)
@@ -0,0 +1,459 @@
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from spotipy.exceptions import SpotifyBaseException
+
+from recommendations.models import Recommendation, RecommendedTrack
+from users.models import UserProfile
+from users.services import apply_spotify_token, create_spotify_client, request_spotify_token_refresh
+from .models import Track, UserTrackHistory
+from .search import index_tracks
+
+logger = logging.getLogger(__name__)
+
+# Spotify の Get Several Tracks エンドポイントが一度に受け付けるIDの上限
+SPOTIFY_TRACKS_BATCH_SIZE = 50
+
+# Trackカタログへのupsert時に1文で書き込む行数
+TRACK_UPSERT_BATCH_SIZE = 500
+
+# current_user_recently_played が1回で返す最大件数
+RECENTLY_PLAYED_LIMIT = 50
+
+# upsert時に既存行を上書きするフィールド（created_at は最初に登録したときの値を残す）
+TRACK_UPSERT_FIELDS = ['name', 'artist', 'updated_at']
+# 値がある場合のみ上書きするフィールド（空の値で既存のカタログのデータを消さないため）
+TRACK_UPSERT_OPTIONAL_FIELDS = ['album', 'image_url', 'preview_url']
+
+
+class SpotifyTokenRefreshError(Exception):
+    """Spotifyのアクセストークンを更新できなかった場合のエラー"""
+
+
+# Spotify APIの呼び出しで想定されるエラー（バッチ・ユーザー単位で失敗として数え、処理を続ける）。
+# これ以外の例外はプログラムの誤りとしてそのまま送出する
+SPOTIFY_ERRORS = (SpotifyBaseException, requests.RequestException, SpotifyTokenRefreshError)
+
+
+def get_spotify_client():
+    """クライアントクレデンシャルでSpotifyクライアントを生成（未設定の場合はNone）"""
+    if not settings.SPOTIFY_CLIENT_ID or not settings.SPOTIFY_CLIENT_SECRET:
+        return None
+    return create_spotify_client(client_credentials=True)
+
+
+def extract_track_media(spotify_track):
+    """
+    SpotifyのトラックオブジェクトからプレビューURLとアルバム画像URLを取り出す
+
+    Args:
+        spotify_track (dict): Spotify APIのトラックオブジェクト
+
+    Returns:
+        dict: preview_url と image_url を含む辞書
+    """
+    images = (spotify_track.get('album') or {}).get('images') or []
+    return {
+        'preview_url': spotify_track.get('preview_url'),
+        'image_url': images[0]['url'] if images else None,
+    }
+
+
+def upsert_tracks(track_rows, batch_size=TRACK_UPSERT_BATCH_SIZE):
+    """
+    楽曲データをTrackカタログへ一括upsert
+
+    spotify_id の一意制約に対する ON CONFLICT DO UPDATE で、バッチごとに1文で書き込む。
+    spotify_id を持たない行は無視し、同じIDが複数ある場合は後勝ちとする。
+    album・image_url・preview_url が空の行は、既存の行のその値を上書きしない（COALESCEで既存の値を残す）。
+    書き込んだ楽曲は検索インデックスにも反映する。
+
+    Args:
+        track_rows (iterable): spotify_id, name, artist, album, image_url, preview_url を持つ辞書
+        batch_size (int): 1文あたりの行数（SQLのパラメーター数の上限を超える場合は減らす）
+
+    Returns:
+        list: upsertしたSpotify IDのリスト
+    """
+    tracks = {}
+    for row in track_rows:
+        spotify_id = row.get('spotify_id')
+        if not spotify_id:
+            continue
+        tracks[spotify_id] = (
+            spotify_id,
+            row.get('name') or '',
+            row.get('artist') or '',
+            row.get('album') or None,
+            row.get('image_url') or None,
+            row.get('preview_url') or None,
+        )
+    if not tracks:
+        return []
+
+    # bulk_create(update_conflicts=True) では「空なら既存の値を残す」を表せないため、SQLを組み立てる
+    quote_name = connection.ops.quote_name
+    table = quote_name(Track._meta.db_table)
+    columns = ['spotify_id', 'name', 'artist'] + TRACK_UPSERT_OPTIONAL_FIELDS + ['created_at', 'updated_at']
+    assignments = [f"{quote_name(field)} = excluded.{quote_name(field)}" for field in TRACK_UPSERT_FIELDS] + [
+        f"{quote_name(field)} = COALESCE(excluded.{quote_name(field)}, {table}.{quote_name(field)})"
+        for field in TRACK_UPSERT_OPTIONAL_FIELDS
+    ]
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    rows = [values + (now, now) for values in tracks.values()]
+    fields = [Track._meta.get_field(column) for column in columns]
+    batch_size = max(1, min(batch_size, connection.ops.bulk_batch_size(fields, rows)))
+    placeholders = f"({', '.join(['%s'] * len(columns))})"
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        for offset in range(0, len(rows), batch_size):
+            batch = rows[offset:offset + batch_size]
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(quote_name(column) for column in columns)}) "
+                f"VALUES {', '.join([placeholders] * len(batch))} "
+                f"ON CONFLICT ({quote_name('spotify_id')}) DO UPDATE SET {', '.join(assignments)}",
+                [value for row in batch for value in row],
+            )
+    index_tracks(Track.objects.filter(spotify_id__in=list(tracks)))
+    return list(tracks)
+
+
+class RateLimiter:
+    """スレッド間で共有する単純な呼び出し間隔リミッター"""
+
+    def __init__(self, max_per_second):
+        self.interval = 1.0 / max_per_second if max_per_second > 0 else 0
+        self._lock = threading.Lock()
+        self._next_at = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            scheduled = max(now, self._next_at)
+            self._next_at = scheduled + self.interval
+        if scheduled > now:
+            time.sleep(scheduled - now)
+
+
+class TrackRehydrationService:
+    """
+    保存済み楽曲のpreview_url/image_urlをSpotifyの複数ID取得エンドポイントで再取得するサービス
+
+    取得はスレッドプールで並行に行い、DBへの書き込みはメインスレッドでまとめて行う。
+    """
+
+    def __init__(self, spotify_client=None, batch_size=SPOTIFY_TRACKS_BATCH_SIZE,
+                 max_workers=4, max_requests_per_second=10):
+        self.spotify_client = spotify_client or get_spotify_client()
+        self.batch_size = min(batch_size, SPOTIFY_TRACKS_BATCH_SIZE)
+        self.max_workers = max_workers
+        self.rate_limiter = RateLimiter(max_requests_per_second)
+
+    def collect_spotify_ids(self, stale_after=timedelta(days=1), recommended_since=None, limit=None):
+        """
+        再取得対象のSpotify IDを収集
+
+        Args:
+            stale_after (timedelta): この期間より前に更新されたTrackを対象とする
+            recommended_since (datetime, optional): この日時以降の推薦に含まれる楽曲も対象とする
+            limit (int, optional): 対象IDの最大件数
+
+        Returns:
+            list: 重複のないSpotify IDのリスト（更新日時の古い順）
+        """
+        cutoff = timezone.now() - stale_after
+        stale_tracks = (Track.objects
+                        .filter(updated_at__lt=cutoff)
+                        .order_by('updated_at')
+                        .values_list('spotify_id', flat=True))
+        if limit:
+            stale_tracks = stale_tracks[:limit]
+
+        spotify_ids = list(dict.fromkeys(stale_tracks))
+
+        if recommended_since is not None:
+            recent_recommendations = Recommendation.objects.filter(created_at__gte=recommended_since)
+            recommended_ids = (RecommendedTrack.objects
+                               .filter(recommendation__in=recent_recommendations)
+                               .exclude(spotify_id='')
+                               .values_list('spotify_id', flat=True)
+                               .distinct())
+            seen = set(spotify_ids)
+            for spotify_id in recommended_ids.iterator():
+                if spotify_id not in seen:
+                    seen.add(spotify_id)
+                    spotify_ids.append(spotify_id)
+
+        if limit:
+            spotify_ids = spotify_ids[:limit]
+        return spotify_ids
+
+    def fetch_batch(self, spotify_ids):
+        """
+        Spotify IDのバッチを1回のAPI呼び出しで取得
+
+        Returns:
+            dict: spotify_id をキー、メディア情報を値とする辞書（見つからないIDは含まない）
+        """
+        self.rate_limiter.wait()
+        response = self.spotify_client.tracks(spotify_ids)
+        media = {}
+        for spotify_track in response.get('tracks') or []:
+            if spotify_track and spotify_track.get('id'):
+                media[spotify_track['id']] = extract_track_media(spotify_track)
+        return media
+
+    def apply_batch(self, spotify_ids, media):
+        """
+        取得したメディア情報を変更のあった行のみbulk_updateで反映
+
+        Returns:
+            tuple: (更新したTrack件数, 更新したRecommendedTrack件数)
+        """
+        now = timezone.now()
+        tracks = list(Track.objects
+                      .filter(spotify_id__in=spotify_ids)
+                      .only('id', 'spotify_id', 'preview_url', 'image_url', 'updated_at'))
+        changed_tracks = []
+        for track in tracks:
+            fetched = media.get(track.spotify_id)
+            if fetched and (track.preview_url, track.image_url) != (fetched['preview_url'], fetched['image_url']):
+                track.preview_url = fetched['preview_url']
+                track.image_url = fetched['image_url']
+                track.updated_at = now
+                changed_tracks.append(track)
+        if changed_tracks:
+            Track.objects.bulk_update(changed_tracks, ['preview_url', 'image_url', 'updated_at'])
+        # 変更のなかった行も更新日時だけ進め、次回の増分実行の対象から外す（CASE式を使わない1文のUPDATE）
+        unchanged_ids = [track.id for track in tracks if track.updated_at != now]
+        if unchanged_ids:
+            Track.objects.filter(id__in=unchanged_ids).update(updated_at=now)
+
+        recommended_tracks = (RecommendedTrack.objects
+                              .filter(spotify_id__in=list(media))
+                              .only('id', 'recommendation_id', 'spotify_id', 'preview_url', 'image_url'))
+        changed_recommended = []
+        for recommended_track in recommended_tracks:
+            fetched = media[recommended_track.spotify_id]
+            if (recommended_track.preview_url, recommended_track.image_url) != (fetched['preview_url'], fetched['image_url']):
+                recommended_track.preview_url = fetched['preview_url']
+                recommended_track.image_url = fetched['image_url']
+                changed_recommended.append(recommended_track)
+        if changed_recommended:
+            RecommendedTrack.objects.bulk_update(changed_recommended, ['preview_url', 'image_url'])
+            # 推薦一覧・詳細のETagが変わるよう、親の推薦の更新日時も進める
+            Recommendation.objects.filter(
+                id__in={recommended_track.recommendation_id for recommended_track in changed_recommended}
+            ).update(updated_at=now)
+
+        return len(changed_tracks), len(changed_recommended)
+
+    def rehydrate(self, spotify_ids, on_batch=None):
+        """
+        Spotify IDを50件ずつ並行に取得し、変更された行を一括更新
+
+        Args:
+            spotify_ids (list): 対象のSpotify ID
+            on_batch (callable, optional): バッチ反映ごとに集計値の辞書を受け取るコールバック
+
+        Returns:
+            dict: 処理結果の集計
+        """
+        if not self.spotify_client:
+            raise ValueError("Spotify API設定が不正です")
+
+        stats = {'requested': len(spotify_ids), 'fetched': 0, 'tracks_updated': 0,
+                 'recommended_tracks_updated': 0, 'failed_batches': 0}
+        batches = [spotify_ids[i:i + self.batch_size]
+                   for i in range(0, len(spotify_ids), self.batch_size)]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.fetch_batch, batch): batch for batch in batches}
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    media = future.result()
+                except SPOTIFY_ERRORS:
+                    logger.exception('楽曲情報の取得に失敗しました: %d件 (%s ... %s)', len(batch), batch[0], batch[-1])
+                    stats['failed_batches'] += 1
+                    continue
+                tracks_updated, recommended_updated = self.apply_batch(batch, media)
+                stats['fetched'] += len(media)
+                stats['tracks_updated'] += tracks_updated
+                stats['recommended_tracks_updated'] += recommended_updated
+                if on_batch:
+                    on_batch(stats)
+
+        return stats
+
+
+class RecentlyPlayedSyncService:
+    """
+    Spotifyの最近再生した曲をUserTrackHistoryへ増分同期するサービス
+
+    ユーザーごとに保存した after カーソル以降の再生のみを取得する。
+    API呼び出しは並行数を制限したスレッドプールで行い、DBへの書き込みはメインスレッドで行う。
+    """
+
+    def __init__(self, max_workers=8, max_requests_per_second=20):
+        self.max_workers = max_workers
+        self.rate_limiter = RateLimiter(max_requests_per_second)
+
+    def iter_profiles(self, user_ids=None, chunk_size=500):
+        """
+        同期対象（Spotify連携済み）のプロフィールをID順にチャンク単位で取得
+
+        同期中にプロフィールを更新するため、カーソルを開いたままにせずキーセットで読み進める。
+        """
+        profiles = (UserProfile.objects
+                    .exclude(spotify_refresh_token__isnull=True)
+                    .exclude(spotify_refresh_token='')
+                    .only('id', 'user_id', 'spotify_access_token', 'spotify_refresh_token',
+                          'spotify_token_expires_at', 'recently_played_cursor')
+                    .order_by('id'))
+        if user_ids:
+            profiles = profiles.filter(user_id__in=user_ids)
+
+        last_id = 0
+        while True:
+            chunk = list(profiles.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                return
+            yield from chunk
+            last_id = chunk[-1].id
+
+    def fetch_user(self, profile):
+        """
+        1ユーザー分の新しい再生履歴を取得（DBには書き込まない）
+
+        Returns:
+            dict: token_data（更新した場合のみ）と items を含む辞書
+        """
+        token_data = None
+        access_token = profile.spotify_access_token
+        expires_at = profile.spotify_token_expires_at
+        if not access_token or (expires_at and expires_at <= timezone.now() + timedelta(minutes=1)):
+            self.rate_limiter.wait()
+            token_data = request_spotify_token_refresh(profile.spotify_refresh_token)
+            if token_data is None:
+                raise SpotifyTokenRefreshError("Spotifyトークンの更新に失敗しました")
+            access_token = token_data['access_token']
+
+        self.rate_limiter.wait()
+        sp = create_spotify_client(auth=access_token)
+        response = sp.current_user_recently_played(
+            limit=RECENTLY_PLAYED_LIMIT,
+            after=profile.recently_played_cursor
+        )
+        return {'token_data': token_data, 'items': (response or {}).get('items') or []}
+
+    def save_user(self, profile, token_data, items):
+        """
+        取得した再生履歴を保存し、カーソルを進める
+
+        Returns:
+            int: 書き込んだ再生履歴の件数
+        """
+        plays = []
+        track_rows = []
+        cursor = profile.recently_played_cursor
+        for item in items:
+            track = item.get('track') or {}
+            played_at = parse_datetime(item.get('played_at') or '')
+            if not track.get('id') or played_at is None:
+                continue
+            track_rows.append({
+                'spotify_id': track['id'],
+                'name': track.get('name'),
+                'artist': ', '.join(artist.get('name', '') for artist in track.get('artists') or []),
+                'album': (track.get('album') or {}).get('name'),
+                **extract_track_media(track),
+            })
+            plays.append((track['id'], played_at))
+            played_at_ms = int(played_at.timestamp() * 1000)
+            cursor = played_at_ms if cursor is None else max(cursor, played_at_ms)
+
+        profile_updates = {}
+        if cursor != profile.recently_played_cursor:
+            profile_updates['recently_played_cursor'] = cursor
+        if token_data:
+            apply_spotify_token(profile, token_data)
+            profile_updates.update(
+                spotify_access_token=profile.spotify_access_token,
+                spotify_refresh_token=profile.spotify_refresh_token,
+                spotify_token_expires_at=profile.spotify_token_expires_at,
+            )
+
+        with transaction.atomic():
+            if plays:
+                spotify_ids = upsert_tracks(track_rows)
+                track_ids = dict(Track.objects
+                                 .filter(spotify_id__in=spotify_ids)
+                                 .values_list('spotify_id', 'id'))
+                # (user, track, played_at) の一意制約に衝突する行は無視
+                UserTrackHistory.objects.bulk_create(
+                    [
+                        UserTrackHistory(user_id=profile.user_id, track_id=track_ids[spotify_id], played_at=played_at)
+                        for spotify_id, played_at in plays
+                    ],
+                    ignore_conflicts=True,
+                )
+            if profile_updates:
+                UserProfile.objects.filter(pk=profile.pk).update(**profile_updates)
+
+        return len(plays)
+
+    def sync(self, profiles, on_user=None):
+        """
+        複数ユーザーの再生履歴を同期
+
+        Args:
+            profiles (iterable): 同期対象のUserProfile
+            on_user (callable, optional): ユーザーごとに集計値の辞書を受け取るコールバック
+
+        Returns:
+            dict: 処理結果の集計
+        """
+        stats = {'users': 0, 'failed_users': 0, 'plays': 0}
+        max_in_flight = self.max_workers * 2
+        profiles = iter(profiles)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            in_flight = {}
+            exhausted = False
+            while True:
+                # 未処理のfutureが一定数を超えないように投入する
+                while not exhausted and len(in_flight) < max_in_flight:
+                    profile = next(profiles, None)
+                    if profile is None:
+                        exhausted = True
+                        break
+                    in_flight[executor.submit(self.fetch_user, profile)] = profile
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    profile = in_flight.pop(future)
+                    stats['users'] += 1
+                    try:
+                        result = future.result()
+                    except SPOTIFY_ERRORS:
+                        logger.exception('再生履歴の取得に失敗しました: user_id=%s', profile.user_id)
+                        stats['failed_users'] += 1
+                    else:
+                        stats['plays'] += self.save_user(profile, result['token_data'], result['items'])
+                    if on_user:
+                        on_user(stats)
+
+        return stats
@@ -0,0 +1,23 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Track
+from .search import SEARCH_COLUMNS, index_track, unindex_tracks
+
+
+@receiver(post_save, sender=Track)
+def index_saved_track(sender, instance, update_fields=None, **kwargs):
+    """
+    保存した楽曲を検索インデックスへ反映する（管理画面・create()・フィクスチャの読み込みなど）
+
+    検索対象のカラムを含まない update_fields での保存（画像URLの更新など）は書き換えない。
+    """
+    if update_fields is not None and not set(update_fields) & set(SEARCH_COLUMNS):
+        return
+    index_track(instance)
+
+
+@receiver(post_delete, sender=Track)
+def unindex_deleted_track(sender, instance, **kwargs):
+    """削除した楽曲を検索インデックスから取り除く（検索結果に存在しないIDを返さないため）"""
+    unindex_tracks([instance.pk])
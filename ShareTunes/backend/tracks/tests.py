@@ -0,0 +1,432 @@
+import base64
+import io
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.test import APITestCase
+from spotipy.exceptions import SpotifyException
+
+from recommendations.models import Recommendation, RecommendedTrack
+from users.models import UserProfile
+
+from sharetunes.testing import assert_max_queries
+from tracks.models import Track, UserTrackHistory
+from tracks.search import (
+    PREFIX_TABLE, SEARCH_TABLE, build_search_query, is_search_index_available, normalize_search_text,
+    search_track_ids,
+)
+from tracks.services import RecentlyPlayedSyncService, TrackRehydrationService, upsert_tracks
+
+
+class SearchTextNormalizationTests(APITestCase):
+    """検索用の文字列の正規化"""
+
+    def test_width_case_and_kana_are_unified(self):
+        self.assertEqual(normalize_search_text('ＹＯＡＳＯＢＩ'), 'yoasobi')
+        self.assertEqual(normalize_search_text('ｶﾀｶﾅ'), 'かたかな')
+        self.assertEqual(normalize_search_text('カタカナ'), 'かたかな')
+        self.assertEqual(normalize_search_text('  夜に　 駆ける  '), '夜に 駆ける')
+        self.assertEqual(normalize_search_text(None), '')
+
+
+class TrackSearchIndexTests(APITestCase):
+    """楽曲の検索インデックス"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='track-searcher')
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def create_track(self, spotify_id, name, artist, album=None):
+        return Track.objects.create(spotify_id=spotify_id, name=name, artist=artist, album=album)
+
+    def search(self, query, field=None):
+        return search_track_ids([(query, field)])
+
+    def test_saved_and_deleted_tracks_are_reflected(self):
+        self.assertTrue(is_search_index_available())
+        track = self.create_track('index1', 'アイドル', 'YOASOBI')
+        self.assertEqual(self.search('あいどる'), [track.pk])
+
+        track.name = 'たぶん'
+        track.save()
+        self.assertEqual(self.search('アイドル'), [])
+        self.assertEqual(self.search('たぶん'), [track.pk])
+
+        # 画像URLだけの更新では索引を書き換えない
+        track.image_url = 'https://example.com/image.jpg'
+        track.save(update_fields=['image_url'])
+        self.assertEqual(self.search('たぶん'), [track.pk])
+
+        track_id = track.pk
+        track.delete()
+        self.assertEqual(self.search('たぶん'), [])
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {PREFIX_TABLE} WHERE track_id = %s', [track_id])
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_queryset_delete_removes_tracks_from_index(self):
+        self.create_track('index2', 'ハルジオン', 'YOASOBI')
+        Track.objects.filter(spotify_id='index2').delete()
+        self.assertEqual(self.search('ハルジオン'), [])
+
+    def test_short_query_uses_prefix_table(self):
+        sql, _ = build_search_query([('よ', None)])
+        self.assertIn(PREFIX_TABLE, sql)
+        self.assertNotIn('MATCH', sql)
+        sql, _ = build_search_query([('よるに', None)])
+        self.assertIn(f'{SEARCH_TABLE} MATCH', sql)
+
+        yoru = self.create_track('prefix1', '夜に駆ける', 'YOASOBI')
+        yume = self.create_track('prefix2', 'ゆめ', 'ヨルシカ')
+        other = self.create_track('prefix3', '群青', 'YOASOBI')
+        # 曲名・アーティスト名の前方一致のみ（キーの順）
+        self.assertEqual(self.search('よる'), [yume.pk])
+        self.assertEqual(self.search('夜'), [yoru.pk])
+        self.assertEqual(self.search('yo'), [yoru.pk, other.pk])
+        self.assertEqual(self.search('yo', 'name'), [])
+
+    def test_results_are_ranked_by_name_prefix_then_weight(self):
+        in_album = self.create_track('rank1', '別の曲', '別の人', album='ラブソング集')
+        in_artist = self.create_track('rank2', '別の曲2', 'ラブソングス')
+        in_name = self.create_track('rank3', '最高のラブソング', '歌手')
+        name_prefix = self.create_track('rank4', 'ラブソングは突然に', '歌手')
+
+        self.assertEqual(self.search('らぶそんぐ'), [name_prefix.pk, in_name.pk, in_artist.pk, in_album.pk])
+
+        response = self.client.get('/api/tracks/', {'q': 'ラブソング'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([track['id'] for track in response.data],
+                         [name_prefix.pk, in_name.pk, in_artist.pk, in_album.pk])
+
+    def test_unavailable_without_index_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE {SEARCH_TABLE}')
+        self.assertFalse(is_search_index_available())
+        # 索引がない場合は部分一致の検索にフォールバックし、保存もエラーにならない
+        track = self.create_track('fallback1', 'フォールバック', '歌手')
+        response = self.client.get('/api/tracks/', {'q': 'フォール'})
+        self.assertEqual([item['id'] for item in response.data], [track.pk])
+
+
+class UpsertTracksTests(APITestCase):
+    """楽曲カタログへの一括upsert"""
+
+    def row(self, spotify_id, **values):
+        return {'spotify_id': spotify_id, 'name': f'曲{spotify_id}', 'artist': 'アーティスト', **values}
+
+    def test_inserts_new_and_updates_existing_rows(self):
+        existing = Track.objects.create(spotify_id='upsert1', name='古い曲名', artist='古い名前', album='アルバム')
+
+        ids = upsert_tracks([
+            self.row('upsert1', name='新しい曲名', artist='新しい名前'),
+            self.row('upsert2', album='新しいアルバム', preview_url='https://example.com/2.mp3'),
+            {'name': 'IDなし'},
+        ])
+
+        self.assertEqual(ids, ['upsert1', 'upsert2'])
+        updated = Track.objects.get(spotify_id='upsert1')
+        self.assertEqual((updated.pk, updated.name, updated.artist), (existing.pk, '新しい曲名', '新しい名前'))
+        self.assertEqual(updated.created_at, existing.created_at)
+        self.assertGreater(updated.updated_at, existing.updated_at)
+        created = Track.objects.get(spotify_id='upsert2')
+        self.assertEqual((created.album, created.preview_url), ('新しいアルバム', 'https://example.com/2.mp3'))
+        self.assertEqual(search_track_ids([('新しい曲名', None)]), [existing.pk])
+
+    def test_blank_optional_fields_do_not_clobber_stored_values(self):
+        Track.objects.create(spotify_id='keep1', name='曲', artist='歌手', album='アルバム',
+                             image_url='https://example.com/1.jpg', preview_url='https://example.com/1.mp3')
+
+        upsert_tracks([self.row('keep1', album='', image_url='https://example.com/new.jpg', preview_url=None)])
+
+        track = Track.objects.get(spotify_id='keep1')
+        self.assertEqual((track.album, track.image_url, track.preview_url),
+                         ('アルバム', 'https://example.com/new.jpg', 'https://example.com/1.mp3'))
+
+    def test_last_duplicate_wins(self):
+        upsert_tracks([self.row('dup1', name='最初'), self.row('dup1', name='最後')])
+        self.assertEqual(Track.objects.get(spotify_id='dup1').name, '最後')
+
+    def inserts(self, rows, **kwargs):
+        """upsert で実行された Track への INSERT 文の数"""
+        with assert_max_queries(12) as recorder:
+            upsert_tracks(rows, **kwargs)
+        return len([sql for sql, _ in recorder.queries if sql.startswith('INSERT INTO "tracks_track"')])
+
+    def test_one_statement_per_batch(self):
+        Track.objects.create(spotify_id='batch0', name='既存', artist='歌手', album='アルバム')
+        # 値のあるフィールドの組み合わせが異なる行も、同じ文で書き込む
+        rows = [self.row(f'batch{index}', album=f'アルバム{index}' if index % 2 else None,
+                         preview_url='https://example.com/p.mp3' if index % 3 else None) for index in range(5)]
+
+        self.assertEqual(self.inserts(rows), 1)
+        self.assertEqual(self.inserts(rows, batch_size=2), 3)
+        self.assertEqual(Track.objects.filter(spotify_id__startswith='batch').count(), 5)
+        self.assertEqual(Track.objects.get(spotify_id='batch0').album, 'アルバム')
+
+
+def spotify_track(spotify_id, preview_url=None, image_url=None):
+    """Spotify APIのトラックオブジェクト（テスト用）"""
+    return {
+        'id': spotify_id,
+        'preview_url': preview_url,
+        'album': {'images': [{'url': image_url}] if image_url else []},
+    }
+
+
+class StubSpotifyClient:
+    """tracks() の呼び出しを記録し、登録した楽曲を返すSpotifyクライアント（テスト用）"""
+
+    def __init__(self, tracks=(), failing_ids=()):
+        self.tracks_by_id = {track['id']: track for track in tracks}
+        self.failing_ids = set(failing_ids)
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def tracks(self, spotify_ids):
+        with self._lock:
+            self.calls.append(list(spotify_ids))
+        if self.failing_ids & set(spotify_ids):
+            raise SpotifyException(503, -1, 'Service Unavailable')
+        # 見つからないIDは None が返る
+        return {'tracks': [self.tracks_by_id.get(spotify_id) for spotify_id in spotify_ids]}
+
+
+class TrackRehydrationServiceTests(APITestCase):
+    """保存済み楽曲のプレビューURL・画像URLの再取得"""
+
+    def create_tracks(self, count, prefix='rehydrate'):
+        tracks = Track.objects.bulk_create([
+            Track(spotify_id=f'{prefix}{index:03}', name=f'曲{index}', artist='歌手',
+                  preview_url=f'https://example.com/{index}.mp3')
+            for index in range(count)
+        ])
+        Track.objects.update(updated_at=timezone.now() - timedelta(days=2))
+        return [track.spotify_id for track in tracks]
+
+    def service(self, client):
+        return TrackRehydrationService(spotify_client=client, max_workers=2, max_requests_per_second=0)
+
+    def test_requests_are_batched_by_50_ids(self):
+        spotify_ids = self.create_tracks(120)
+        client = StubSpotifyClient([spotify_track(spotify_id) for spotify_id in spotify_ids])
+        service = self.service(client)
+
+        self.assertEqual(service.collect_spotify_ids(), spotify_ids)
+        stats = service.rehydrate(spotify_ids)
+
+        self.assertEqual(sorted(len(call) for call in client.calls), [20, 50, 50])
+        self.assertEqual(sorted(spotify_id for call in client.calls for spotify_id in call), spotify_ids)
+        self.assertEqual((stats['fetched'], stats['tracks_updated'], stats['failed_batches']), (120, 120, 0))
+        # 更新日時が進み、次回の対象から外れる
+        self.assertEqual(service.collect_spotify_ids(), [])
+
+    def test_only_changed_rows_are_bulk_updated(self):
+        changed, unchanged, missing = self.create_tracks(3)
+        recommendation = Recommendation.objects.create(user=User.objects.create(username='rehydrate-user'))
+        other = Recommendation.objects.create(user=recommendation.user)
+        recommended_changed = RecommendedTrack.objects.create(
+            recommendation=recommendation, spotify_id=changed, name='曲0', artist='歌手',
+            preview_url='https://example.com/0.mp3')
+        RecommendedTrack.objects.create(recommendation=other, spotify_id=unchanged, name='曲1', artist='歌手',
+                                        preview_url='https://example.com/1.mp3')
+        other_updated_at = Recommendation.objects.get(pk=other.pk).updated_at
+        client = StubSpotifyClient([
+            spotify_track(changed, 'https://example.com/new.mp3', 'https://example.com/new.jpg'),
+            spotify_track(unchanged, 'https://example.com/1.mp3'),
+        ])
+
+        with mock.patch.object(Track.objects, 'bulk_update', wraps=Track.objects.bulk_update) as track_update, \
+                mock.patch.object(RecommendedTrack.objects, 'bulk_update',
+                                  wraps=RecommendedTrack.objects.bulk_update) as recommended_update:
+            stats = self.service(client).rehydrate([changed, unchanged, missing])
+
+        self.assertEqual((stats['fetched'], stats['tracks_updated'], stats['recommended_tracks_updated']), (2, 1, 1))
+        self.assertEqual([track.spotify_id for track in track_update.call_args.args[0]], [changed])
+        self.assertEqual(track_update.call_count, 1)
+        self.assertEqual([track.pk for track in recommended_update.call_args.args[0]], [recommended_changed.pk])
+        self.assertEqual(recommended_update.call_count, 1)
+
+        track = Track.objects.get(spotify_id=changed)
+        self.assertEqual((track.preview_url, track.image_url),
+                         ('https://example.com/new.mp3', 'https://example.com/new.jpg'))
+        recommended_changed.refresh_from_db()
+        self.assertEqual(recommended_changed.image_url, 'https://example.com/new.jpg')
+        self.assertEqual(Recommendation.objects.get(pk=other.pk).updated_at, other_updated_at)
+        # 変更のない行・見つからなかった行も更新日時は進む
+        self.assertFalse(Track.objects.filter(updated_at__lt=timezone.now() - timedelta(days=1)).exists())
+
+    def test_failed_batch_does_not_abort_others(self):
+        spotify_ids = self.create_tracks(100)
+        client = StubSpotifyClient([spotify_track(spotify_id, image_url='https://example.com/new.jpg')
+                                    for spotify_id in spotify_ids], failing_ids=[spotify_ids[60]])
+
+        with self.assertLogs('tracks.services', 'ERROR'):
+            stats = self.service(client).rehydrate(spotify_ids)
+
+        self.assertEqual(len(client.calls), 2)
+        self.assertEqual((stats['failed_batches'], stats['fetched'], stats['tracks_updated']), (1, 50, 50))
+        updated = Track.objects.filter(image_url='https://example.com/new.jpg')
+        self.assertEqual(set(updated.values_list('spotify_id', flat=True)), set(spotify_ids[:50]))
+
+
+def recently_played_item(spotify_id, played_at):
+    """Spotify APIの最近再生した曲の項目（テスト用）"""
+    return {'played_at': played_at, 'track': {**spotify_track(spotify_id), 'name': f'曲{spotify_id}',
+                                              'artists': [{'name': '歌手'}], 'album': {'name': 'アルバム'}}}
+
+
+class StubRecentlyPlayedClient:
+    """current_user_recently_played() の after を記録するSpotifyクライアント（テスト用）"""
+
+    def __init__(self, items):
+        self.items = items
+        self.after = []
+
+    def current_user_recently_played(self, limit, after=None):
+        self.after.append(after)
+        return {'items': self.items}
+
+
+class RecentlyPlayedSyncServiceTests(APITestCase):
+    """最近再生した曲の増分同期"""
+
+    def create_profile(self, username, **values):
+        values = {'spotify_refresh_token': 'refresh', 'spotify_access_token': f'access-{username}',
+                  'spotify_token_expires_at': timezone.now() + timedelta(hours=1), **values}
+        return UserProfile.objects.create(user=User.objects.create(username=username), **values)
+
+    def patch_client(self, client):
+        patcher = mock.patch('tracks.services.create_spotify_client', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cursor_advances_and_duplicates_are_ignored(self):
+        profile = self.create_profile('sync-user')
+        client = StubRecentlyPlayedClient([
+            recently_played_item('sync1', '2026-10-19T10:00:00Z'),
+            recently_played_item('sync2', '2026-10-19T10:05:00Z'),
+        ])
+        self.patch_client(client)
+        service = RecentlyPlayedSyncService(max_workers=2, max_requests_per_second=0)
+
+        stats = service.sync(service.iter_profiles())
+
+        self.assertEqual(stats, {'users': 1, 'failed_users': 0, 'plays': 2})
+        profile.refresh_from_db()
+        cursor = int(parse_datetime('2026-10-19T10:05:00Z').timestamp() * 1000)
+        self.assertEqual(profile.recently_played_cursor, cursor)
+
+        # 前回の位置以降を取得する（境界の再生が重複して返っても保存しない）
+        client.items = [
+            recently_played_item('sync2', '2026-10-19T10:05:00Z'),
+            recently_played_item('sync1', '2026-10-19T10:10:00Z'),
+        ]
+        out = io.StringIO()
+        call_command('sync_recently_played', '--max-rps=0', stdout=out)
+
+        self.assertEqual(client.after, [None, cursor])
+        self.assertIn('1ユーザー（失敗 0）', out.getvalue())
+        self.assertEqual(UserTrackHistory.objects.filter(user=profile.user).count(), 3)
+        self.assertEqual(Track.objects.filter(spotify_id__in=['sync1', 'sync2']).count(), 2)
+        profile.refresh_from_db()
+        self.assertEqual(profile.recently_played_cursor, cursor + 5 * 60 * 1000)
+
+    def test_failed_user_does_not_abort_others(self):
+        self.create_profile('sync-ok')
+        self.create_profile('sync-expired', spotify_access_token=None)
+        self.patch_client(StubRecentlyPlayedClient([recently_played_item('sync3', '2026-10-19T10:00:00Z')]))
+        service = RecentlyPlayedSyncService(max_workers=2, max_requests_per_second=0)
+
+        with mock.patch('tracks.services.request_spotify_token_refresh', return_value=None), \
+                self.assertLogs('tracks.services', 'ERROR'):
+            stats = service.sync(service.iter_profiles())
+
+        self.assertEqual(stats, {'users': 2, 'failed_users': 1, 'plays': 1})
+        self.assertEqual(UserTrackHistory.objects.get().user.username, 'sync-ok')
+
+    def test_in_flight_users_are_bounded(self):
+        for index in range(10):
+            self.create_profile(f'sync-bounded{index}')
+        self.patch_client(StubRecentlyPlayedClient([]))
+        service = RecentlyPlayedSyncService(max_workers=2, max_requests_per_second=0)
+        pulled = 0
+        in_flight = []
+
+        def profiles():
+            nonlocal pulled
+            for profile in service.iter_profiles():
+                pulled += 1
+                yield profile
+
+        stats = service.sync(profiles(), on_user=lambda stats: in_flight.append(pulled - stats['users'] + 1))
+
+        self.assertEqual(stats['users'], 10)
+        # 未処理のユーザーは並行数の2倍まで（すべてを先に投入しない）
+        self.assertEqual(max(in_flight), 4)
+
+
+class TrackHistoryPaginationTests(APITestCase):
+    """再生履歴のキーセットページネーション"""
+
+    URL = '/api/tracks/history/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='history-owner')
+        other = User.objects.create(username='history-other')
+        tracks = Track.objects.bulk_create([
+            Track(spotify_id=f'history{index}', name=f'曲{index}', artist='歌手') for index in range(7)
+        ])
+        now = timezone.now()
+        # 再生日時が同じ行をページの境界にまたがらせる
+        played_at = [now, now - timedelta(minutes=1), now - timedelta(minutes=1), now - timedelta(minutes=1),
+                     now - timedelta(minutes=2), now - timedelta(minutes=2), now - timedelta(minutes=3)]
+        UserTrackHistory.objects.bulk_create([
+            UserTrackHistory(user=cls.user, track=track, played_at=played)
+            for track, played in zip(tracks, played_at)
+        ])
+        UserTrackHistory.objects.create(user=other, track=tracks[0], played_at=now)
+        cls.expected = list(UserTrackHistory.objects.filter(user=cls.user)
+                            .order_by('-played_at', '-id').values_list('id', flat=True))
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_pages_follow_composite_cursor_across_ties(self):
+        page = self.get(self.URL, page_size=2)
+        self.assertIsNone(page['previous'])
+        pages = [[item['id'] for item in page['results']]]
+        while page['next']:
+            page = self.get(page['next'])
+            pages.append([item['id'] for item in page['results']])
+
+        self.assertEqual([len(ids) for ids in pages], [2, 2, 2, 1])
+        self.assertEqual([item_id for ids in pages for item_id in ids], self.expected)
+
+        # 前のページへのリンクで逆にたどっても同じページになる
+        previous_pages = [[item['id'] for item in page['results']]]
+        while page['previous']:
+            page = self.get(page['previous'])
+            previous_pages.append([item['id'] for item in page['results']])
+        self.assertEqual(previous_pages[::-1], pages)
+        self.assertIsNotNone(page['next'])
+
+    def test_invalid_cursor_returns_404(self):
+        for cursor in ('invalid', base64.b64encode(b'p=not-json').decode(),
+                       base64.b64encode(b'p=%5B%22only-one%22%5D').decode()):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(self.URL, {'cursor': cursor}).status_code, 404)
@@ -7,5 +7,6 @@ router.register(r'', views.TrackViewSet, basename='tracks')
 
 urlpatterns = [
     path('history/', views.user_track_history, name='user_track_history'),
+    path('history/export/', views.export_track_history, name='export_track_history'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
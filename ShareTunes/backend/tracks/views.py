@@ -1,38 +1,87 @@
+from django.db.models import Case, Q, When
 from django.shortcuts import render
 from rest_framework import viewsets, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 
+from sharetunes.exports import export_response
+from sharetunes.pagination import NameKeysetPagination, PlayedAtKeysetPagination
 from .models import Track, UserTrackHistory
+from .search import DEFAULT_SEARCH_LIMIT, is_search_index_available, search_track_ids
 from .serializers import TrackSerializer, UserTrackHistorySerializer
 
+# 検索結果として返す最大件数
+MAX_SEARCH_LIMIT = 200
+
 class TrackViewSet(viewsets.ReadOnlyModelViewSet):
     """楽曲情報を提供するビューセット（読み取り専用）"""
     queryset = Track.objects.all()
     serializer_class = TrackSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = NameKeysetPagination
+    
+    def get_searches(self):
+        """q: 曲名・アーティスト・アルバムの横断検索、name/artist: カラムを限定した検索"""
+        searches = [
+            (self.request.query_params.get(param, None), field)
+            for param, field in (('q', None), ('name', 'name'), ('artist', 'artist'))
+        ]
+        return [(query, field) for query, field in searches if query]
+    
+    def paginate_queryset(self, queryset):
+        """検索時は関連度順の上位件数を返すため、名前順のページネーションを行わない"""
+        if self.get_searches():
+            return None
+        return super().paginate_queryset(queryset)
     
     def get_queryset(self):
         """クエリパラメータによるフィルタリング"""
         queryset = Track.objects.all()
         
-        # 名前による検索
-        name = self.request.query_params.get('name', None)
-        if name:
-            queryset = queryset.filter(name__icontains=name)
-            
-        # アーティストによる検索
-        artist = self.request.query_params.get('artist', None)
-        if artist:
-            queryset = queryset.filter(artist__icontains=artist)
-            
-        return queryset
+        searches = self.get_searches()
+        if not searches:
+            return queryset
+        
+        if not is_search_index_available():
+            # 検索インデックスが使えないDBでは部分一致で検索
+            for query, field in searches:
+                if field:
+                    queryset = queryset.filter(**{f'{field}__icontains': query})
+                else:
+                    queryset = queryset.filter(
+                        Q(name__icontains=query) | Q(artist__icontains=query) | Q(album__icontains=query)
+                    )
+            return queryset
+        
+        # 検索インデックスで関連度順に絞り込み（複数条件はAND）
+        ranked_ids = search_track_ids(searches, limit=self.get_search_limit())
+        if not ranked_ids:
+            return queryset.none()
+        
+        ordering = Case(*[When(id=track_id, then=rank) for rank, track_id in enumerate(ranked_ids)])
+        return queryset.filter(id__in=ranked_ids).order_by(ordering)
+    
+    def get_search_limit(self):
+        """検索結果の最大件数（limitパラメータで指定可能）"""
+        try:
+            limit = int(self.request.query_params.get('limit', DEFAULT_SEARCH_LIMIT))
+        except ValueError:
+            limit = DEFAULT_SEARCH_LIMIT
+        return max(1, min(limit, MAX_SEARCH_LIMIT))
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def user_track_history(request):
     """ユーザーの楽曲再生履歴を取得するAPI"""
     history = UserTrackHistory.objects.filter(user=request.user).select_related('track')
-    serializer = UserTrackHistorySerializer(history, many=True)
-    return Response(serializer.data)
\ No newline at end of file
+    paginator = PlayedAtKeysetPagination()
+    page = paginator.paginate_queryset(history, request)
+    serializer = UserTrackHistorySerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_track_history(request):
+    """ユーザーの楽曲再生履歴をNDJSON/CSVでストリーミング出力するAPI"""
+    return export_response(request, 'history')
\ No newline at end of file
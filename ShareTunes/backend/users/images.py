@@ -0,0 +1,239 @@
+import contextvars
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# multipart の境界やヘッダーの分（Content-Length での事前チェックで画像の上限に加える）
+MULTIPART_OVERHEAD = 64 * 1024
+
+# アップロードを受け付ける画像の形式と、保存するファイルの拡張子
+UPLOAD_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+
+# 縮小画像の形式（レスポンスでのキー -> (Pillowの形式, 拡張子, 保存時のオプション)）
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+THUMBNAIL_DIR = 'profile_pictures/thumbnails'
+
+
+class InvalidImage(ValueError):
+    """アップロードされたファイルが受け付けられない画像の場合のエラー"""
+
+
+class SizeLimitedUploadHandler(TemporaryFileUploadHandler):
+    """
+    アップロードをメモリに載せずに一時ファイルへ書き出し、max_bytes を超えた時点で受信を打ち切る
+
+    打ち切った場合は exceeded が True になり、そのファイルは request.FILES に含まれない。
+    """
+
+    def __init__(self, request=None, max_bytes=None):
+        super().__init__(request)
+        self.max_bytes = max_bytes if max_bytes is not None else settings.PROFILE_IMAGE_MAX_BYTES
+        self.received = 0
+        self.exceeded = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_bytes:
+            self.exceeded = True
+            # 残りの本文は読まずに打ち切る
+            raise StopUpload(connection_reset=True)
+        return super().receive_data_chunk(raw_data, start)
+
+
+def validate_image(upload):
+    """
+    アップロードされたファイルが受け付けられる画像か確認する
+
+    Returns:
+        str: 保存するファイルの拡張子
+
+    Raises:
+        InvalidImage: 画像として読み込めない、形式が対象外、または画素数が上限を超える場合
+    """
+    try:
+        with Image.open(upload) as image:
+            image_format = image.format
+            width, height = image.size
+            if image_format not in UPLOAD_FORMATS:
+                raise InvalidImage('対応していない画像形式です（JPEG・PNG・WebP・GIFのみ）')
+            if width * height > settings.PROFILE_IMAGE_MAX_PIXELS:
+                raise InvalidImage(f'画像の解像度が大きすぎます（{width}x{height}）')
+            image.verify()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as e:
+        raise InvalidImage('画像ファイルを読み込めません') from e
+    finally:
+        upload.seek(0)
+    return UPLOAD_FORMATS[image_format]
+
+
+def thumbnail_name(image_name, size_name, extension):
+    """元画像のパスから縮小画像のパスを作る"""
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    return f'{THUMBNAIL_DIR}/{stem}-{size_name}.{extension}'
+
+
+def _to_rgb(image):
+    """透過部分を白で塗りつぶしたRGB画像（JPEG用）"""
+    if image.mode == 'RGB':
+        return image
+    background = Image.new('RGB', image.size, 'white')
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def render_thumbnails(image_name, storage=None):
+    """
+    元画像から PROFILE_THUMBNAIL_SIZES の各サイズの正方形の縮小画像を、WebPとJPEGで書き出す
+
+    大きいサイズから順に、1つ前に作った縮小画像をさらに縮小して作る。
+
+    Returns:
+        dict: サイズ名 -> 形式 -> 保存したパス
+    """
+    storage = storage or default_storage
+    sizes = sorted(settings.PROFILE_THUMBNAIL_SIZES.items(), key=lambda item: item[1], reverse=True)
+    largest = sizes[0][1]
+
+    with storage.open(image_name, 'rb') as image_file, Image.open(image_file) as image:
+        # JPEGは最大のサイズ以上を保つ範囲で縮小しながらデコードする
+        image.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    thumbnails = {}
+    for size_name, pixels in sizes:
+        image = ImageOps.fit(image, (pixels, pixels), Image.Resampling.LANCZOS)
+        thumbnails[size_name] = {}
+        for key, (image_format, extension, options) in THUMBNAIL_FORMATS.items():
+            buffer = io.BytesIO()
+            (_to_rgb(image) if image_format == 'JPEG' else image).save(buffer, image_format, **options)
+            name = thumbnail_name(image_name, size_name, extension)
+            # 再生成の場合は同じパスに上書きする
+            if storage.exists(name):
+                storage.delete(name)
+            thumbnails[size_name][key] = storage.save(name, ContentFile(buffer.getvalue()))
+    return thumbnails
+
+
+def thumbnail_paths(thumbnails):
+    """profile_image_thumbnails に含まれるすべてのパス"""
+    return [name for formats in (thumbnails or {}).values() for name in formats.values()]
+
+
+def profile_image_paths(profile):
+    """プロフィールの元画像と縮小画像のパス"""
+    if not profile.profile_image:
+        return []
+    return [profile.profile_image.name] + thumbnail_paths(profile.profile_image_thumbnails)
+
+
+def delete_images(names, storage=None):
+    """画像を削除する（存在しないものは無視する）"""
+    storage = storage or default_storage
+    for name in names:
+        try:
+            storage.delete(name)
+        except FileNotFoundError:
+            pass
+
+
+def generate_profile_thumbnails(profile_id, image_name):
+    """
+    プロフィール画像の縮小画像を作成し、プロフィールに保存する
+
+    作成中にプロフィール画像が変更・削除された場合は、作成した縮小画像を削除する。
+
+    Returns:
+        bool: プロフィールに保存した場合はTrue
+    """
+    from .models import UserProfile
+
+    try:
+        thumbnails = render_thumbnails(image_name)
+    except FileNotFoundError:
+        logger.info('縮小画像の元画像が削除されています: profile_id=%s image=%s', profile_id, image_name)
+        return False
+
+    updated = (UserProfile.objects
+               .filter(pk=profile_id, profile_image=image_name)
+               .update(profile_image_thumbnails=thumbnails, updated_at=timezone.now()))
+    if not updated:
+        delete_images(thumbnail_paths(thumbnails))
+        return False
+    return True
+
+
+def profile_image_urls(profile, build_url=None):
+    """
+    サイズごとのプロフィール画像のURL
+
+    縮小画像の生成前（または生成に失敗した場合）は元画像のURLを返す。
+    外部の画像（SpotifyのURL）を使っている場合や画像がない場合はNone。
+
+    Returns:
+        dict: {'original': URL, サイズ名: {'webp': URL, 'jpeg': URL}, ...}
+    """
+    if not profile.profile_image or profile.external_profile_image_url:
+        return None
+    build_url = build_url or (lambda url: url)
+    original = build_url(profile.profile_image.url)
+    thumbnails = profile.profile_image_thumbnails or {}
+    urls = {'original': original}
+    for size_name in settings.PROFILE_THUMBNAIL_SIZES:
+        formats = thumbnails.get(size_name, {})
+        urls[size_name] = {
+            key: build_url(default_storage.url(formats[key])) if key in formats else original
+            for key in THUMBNAIL_FORMATS
+        }
+    return urls
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, settings.PROFILE_THUMBNAIL_WORKERS),
+                                           thread_name_prefix='profile-images')
+        return _executor
+
+
+def _run_job(func, args):
+    close_old_connections()
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('プロフィール画像のバックグラウンド処理に失敗しました: %s', func.__name__)
+    finally:
+        close_old_connections()
+
+
+def run_in_background(func, *args):
+    """
+    トランザクションのコミット後に、リクエストのスレッドとは別のスレッドで func を実行する
+
+    ワーカーが1つの場合は登録した順に実行される。呼び出し元のリクエストIDはログに引き継ぐ。
+    """
+    def submit():
+        _get_executor().submit(contextvars.copy_context().run, _run_job, func, args)
+    transaction.on_commit(submit)
@@ -0,0 +1,53 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from users.images import THUMBNAIL_FORMATS, generate_profile_thumbnails
+from users.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = ('アップロードされたプロフィール画像の縮小画像（WebP・JPEG）を作成する。'
+            '既定では、現在の PROFILE_THUMBNAIL_SIZES のサイズがそろっていないプロフィールのみを対象とする')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='作成済みのプロフィールも作り直す')
+        parser.add_argument('--limit', type=int, default=None, help='1回の実行で処理する最大件数')
+
+    def handle(self, *args, **options):
+        profiles = (UserProfile.objects
+                    .exclude(profile_image='').exclude(profile_image__isnull=True)
+                    .order_by('pk')
+                    .only('pk', 'profile_image', 'profile_image_thumbnails'))
+        targets = [profile for profile in profiles.iterator()
+                   if options['force'] or not self.is_complete(profile.profile_image_thumbnails)]
+        if options['limit'] is not None:
+            targets = targets[:options['limit']]
+        if not targets:
+            self.stdout.write('縮小画像の作成対象のプロフィールはありません')
+            return
+
+        self.stdout.write(f'{len(targets)}件のプロフィール画像の縮小画像を作成します')
+        start_time = time.time()
+        created = failed = 0
+        for profile in targets:
+            try:
+                if generate_profile_thumbnails(profile.pk, profile.profile_image.name):
+                    created += 1
+                else:
+                    failed += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f'profile_id={profile.pk} の縮小画像を作成できませんでした: {e}')
+        elapsed = time.time() - start_time
+
+        self.stdout.write(self.style.SUCCESS(
+            f'完了: 作成 {created}件, 失敗・スキップ {failed}件（所要時間: {elapsed:.2f}秒）'
+        ))
+
+    @staticmethod
+    def is_complete(thumbnails):
+        thumbnails = thumbnails or {}
+        return all(set(THUMBNAIL_FORMATS) <= set(thumbnails.get(size_name, {}))
+                   for size_name in settings.PROFILE_THUMBNAIL_SIZES)
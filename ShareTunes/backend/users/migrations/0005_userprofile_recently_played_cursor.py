@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 10:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_userprofile_display_name_userprofile_preferences'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='recently_played_cursor',
+            field=models.BigIntegerField(blank=True, help_text='最近再生した曲の同期済み位置（Unixミリ秒）', null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_userprofile_recently_played_cursor'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['spotify_id'], name='profile_spotify_id'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 12:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_userprofile_profile_spotify_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='profile_image_thumbnails',
+            field=models.JSONField(blank=True, default=dict, help_text='縮小画像のパス（サイズ名 -> 形式 -> パス）'),
+        ),
+    ]
@@ -8,11 +8,13 @@ class UserProfile(models.Model):
     spotify_refresh_token = models.TextField(blank=True, null=True)
     spotify_token_expires_at = models.DateTimeField(blank=True, null=True)
     profile_image = models.ImageField(upload_to='profile_pictures/', blank=True, null=True)
+    profile_image_thumbnails = models.JSONField(blank=True, default=dict, help_text="縮小画像のパス（サイズ名 -> 形式 -> パス）")
     external_profile_image_url = models.URLField(max_length=500, blank=True, null=True)
     bio = models.TextField(blank=True, null=True)
     display_name = models.CharField(max_length=255, blank=True, null=True)  # 表示名フィールドを追加
     favorite_genres = models.JSONField(blank=True, null=True, default=list)
     preferences = models.JSONField(blank=True, null=True, default=dict)  # ユーザー設定用JSONフィールド
+    recently_played_cursor = models.BigIntegerField(blank=True, null=True, help_text="最近再生した曲の同期済み位置（Unixミリ秒）")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -21,4 +23,8 @@ class UserProfile(models.Model):
         
     class Meta:
         verbose_name = 'ユーザープロフィール'
-        verbose_name_plural = 'ユーザープロフィール'
\ No newline at end of file
+        verbose_name_plural = 'ユーザープロフィール'
+        indexes = [
+            # Spotifyログインのコールバックで、Spotify IDから既存ユーザーを探すため
+            models.Index(fields=['spotify_id'], name='profile_spotify_id'),
+        ]
\ No newline at end of file
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from .images import profile_image_urls
 from .models import UserProfile
 
 
@@ -11,9 +12,15 @@ class UserSerializer(serializers.ModelSerializer):
 
 class UserProfileSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
+    # 表示サイズに合わせて選べる縮小画像のURL（コンテキストに request があれば絶対URL）
+    profile_image_urls = serializers.SerializerMethodField()
     
     class Meta:
         model = UserProfile
-        fields = ('id', 'user', 'spotify_id', 'profile_image', 'external_profile_image_url', 
+        fields = ('id', 'user', 'spotify_id', 'profile_image', 'profile_image_urls', 'external_profile_image_url', 
                  'bio', 'display_name', 'favorite_genres', 'preferences', 'created_at', 'updated_at')
-        read_only_fields = ('spotify_access_token', 'spotify_refresh_token', 'spotify_token_expires_at')
\ No newline at end of file
+        read_only_fields = ('spotify_access_token', 'spotify_refresh_token', 'spotify_token_expires_at')
+
+    def get_profile_image_urls(self, obj):
+        request = self.context.get('request')
+        return profile_image_urls(obj, request.build_absolute_uri if request else None)
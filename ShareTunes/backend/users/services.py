@@ -0,0 +1,78 @@
+import base64
+from datetime import timedelta
+
+import requests
+import spotipy
+from django.conf import settings
+from django.utils import timezone
+from spotipy.cache_handler import MemoryCacheHandler
+from spotipy.oauth2 import SpotifyClientCredentials
+
+# クライアントクレデンシャルのトークンをプロセス内で共有する
+# （spotipyの既定ではカレントディレクトリの .cache ファイルに書き込む）
+_client_credentials_cache = MemoryCacheHandler()
+
+
+def spotify_token_url():
+    """SpotifyのトークンエンドポイントのURL（SPOTIFY_ACCOUNTS_URL で差し替えられる）"""
+    return f"{settings.SPOTIFY_ACCOUNTS_URL.rstrip('/')}/api/token"
+
+
+def create_spotify_client(auth=None, client_credentials=False):
+    """
+    SPOTIFY_API_URL / SPOTIFY_ACCOUNTS_URL に接続するSpotifyクライアントを生成
+
+    Args:
+        auth (str, optional): ユーザーのアクセストークン
+        client_credentials (bool): Trueの場合はクライアントクレデンシャルで認証する
+    """
+    manager = None
+    if client_credentials:
+        manager = SpotifyClientCredentials(
+            client_id=settings.SPOTIFY_CLIENT_ID,
+            client_secret=settings.SPOTIFY_CLIENT_SECRET,
+            cache_handler=_client_credentials_cache
+        )
+        manager.OAUTH_TOKEN_URL = spotify_token_url()
+    client = spotipy.Spotify(auth=auth, client_credentials_manager=manager)
+    client.prefix = settings.SPOTIFY_API_URL
+    return client
+
+
+def request_spotify_token_refresh(refresh_token, timeout=10):
+    """
+    リフレッシュトークンでSpotifyのアクセストークンを再取得
+
+    Args:
+        refresh_token (str): Spotifyのリフレッシュトークン
+        timeout (int): リクエストのタイムアウト秒数
+
+    Returns:
+        dict: トークン情報。取得に失敗した場合はNone
+    """
+    auth_token = base64.b64encode(f"{settings.SPOTIFY_CLIENT_ID}:{settings.SPOTIFY_CLIENT_SECRET}".encode()).decode()
+
+    headers = {
+        "Authorization": f"Basic {auth_token}",
+        "Content-Type": "application/x-www-form-urlencoded"
+    }
+
+    data = {
+        "grant_type": "refresh_token",
+        "refresh_token": refresh_token
+    }
+
+    res = requests.post(spotify_token_url(), headers=headers, data=data, timeout=timeout)
+
+    if res.status_code != 200:
+        return None
+    return res.json()
+
+
+def apply_spotify_token(profile, token_data):
+    """取得したトークン情報をプロフィールに反映（保存は呼び出し側で行う）"""
+    profile.spotify_access_token = token_data['access_token']
+    if 'refresh_token' in token_data:
+        profile.spotify_refresh_token = token_data['refresh_token']
+
+    profile.spotify_token_expires_at = timezone.now() + timedelta(seconds=token_data['expires_in'])
@@ -0,0 +1,166 @@
+import io
+import tempfile
+from unittest import mock
+
+from PIL import Image
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from users.images import thumbnail_paths
+from users.models import UserProfile
+
+
+class ImmediateExecutor:
+    """バックグラウンドの処理を呼び出したスレッドでそのまま実行する（テスト用）"""
+
+    def submit(self, func, *args):
+        func(*args)
+
+
+def image_file(name='avatar.png', size=(600, 400), image_format='PNG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, image_format)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{image_format.lower()}')
+
+
+class UploadProfilePictureTests(APITestCase):
+    """プロフィール画像のアップロード"""
+
+    URL = '/api/auth/profile/picture/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='picture-owner')
+        cls.profile = UserProfile.objects.create(user=cls.user)
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        executor = mock.patch('users.images._get_executor', return_value=ImmediateExecutor())
+        executor.start()
+        self.addCleanup(executor.stop)
+        self.client.force_authenticate(self.user)
+
+    def upload(self, upload):
+        # 縮小画像の生成と古い画像の削除はコミット後に実行される
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.URL, {'image': upload}, format='multipart')
+
+    def test_thumbnails_are_generated(self):
+        response = self.upload(image_file())
+        self.assertEqual(response.status_code, 200, response.data)
+
+        self.profile.refresh_from_db()
+        self.assertTrue(default_storage.exists(self.profile.profile_image.name))
+        self.assertEqual(set(self.profile.profile_image_thumbnails), {'small', 'medium', 'large'})
+        for size_name, formats in self.profile.profile_image_thumbnails.items():
+            self.assertEqual(set(formats), {'webp', 'jpeg'})
+            with default_storage.open(formats['webp']) as thumbnail, Image.open(thumbnail) as image:
+                self.assertEqual(image.format, 'WEBP')
+                self.assertEqual(image.size[0], image.size[1])
+        with default_storage.open(self.profile.profile_image_thumbnails['small']['jpeg']) as thumbnail:
+            self.assertEqual(Image.open(thumbnail).size, (64, 64))
+
+    def test_old_images_are_deleted(self):
+        self.upload(image_file())
+        self.profile.refresh_from_db()
+        old_paths = [self.profile.profile_image.name] + thumbnail_paths(self.profile.profile_image_thumbnails)
+
+        response = self.upload(image_file('next.jpg', image_format='JPEG'))
+        self.assertEqual(response.status_code, 200, response.data)
+
+        self.profile.refresh_from_db()
+        self.assertNotIn(self.profile.profile_image.name, old_paths)
+        self.assertTrue(self.profile.profile_image.name.endswith('.jpg'))
+        for path in old_paths:
+            self.assertFalse(default_storage.exists(path), path)
+        self.assertTrue(default_storage.exists(self.profile.profile_image.name))
+
+    @override_settings(PROFILE_IMAGE_MAX_BYTES=1024)
+    def test_oversize_upload_is_rejected(self):
+        upload = image_file(size=(300, 300))
+        upload.file = io.BytesIO(upload.read() + b'\0' * 4096)
+        response = self.upload(upload)
+        self.assertEqual(response.status_code, 413)
+
+        self.profile.refresh_from_db()
+        self.assertFalse(self.profile.profile_image)
+
+    @override_settings(PROFILE_IMAGE_MAX_BYTES=1024)
+    def test_oversize_content_length_is_rejected_before_reading(self):
+        response = self.client.post(self.URL, {'image': SimpleUploadedFile('large.png', b'\0' * 200 * 1024)},
+                                    format='multipart')
+        self.assertEqual(response.status_code, 413)
+
+    def test_non_image_is_rejected(self):
+        response = self.upload(SimpleUploadedFile('avatar.png', b'not an image', content_type='image/png'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.data)
+
+        self.profile.refresh_from_db()
+        self.assertFalse(self.profile.profile_image)
+
+
+class UserProfileETagTests(APITestCase):
+    """プロフィール取得の条件付きGET"""
+
+    URL = '/api/auth/profile/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='etag-owner', email='etag@example.com')
+        UserProfile.objects.create(user=cls.user, display_name='表示名')
+        cls.other = User.objects.create(username='etag-other')
+        UserProfile.objects.create(user=cls.other)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_matching_etag_returns_304_without_body(self):
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['display_name'], '表示名')
+        etag = response['ETag']
+
+        response = self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+        self.assertEqual(self.client.get(self.URL, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_cache_headers(self):
+        for headers in ({}, {'HTTP_IF_NONE_MATCH': self.client.get(self.URL)['ETag']}):
+            response = self.client.get(self.URL, **headers)
+            cache_control = {value.strip() for value in response['Cache-Control'].split(',')}
+            self.assertTrue({'private', 'no-cache'} <= cache_control, response['Cache-Control'])
+            self.assertIn('Authorization', response['Vary'])
+
+    def test_etag_changes_after_update(self):
+        etag = self.client.get(self.URL)['ETag']
+
+        response = self.client.put(self.URL, {'display_name': '新しい表示名'}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+
+        response = self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['display_name'], '新しい表示名')
+
+        # ユーザー情報（ユーザー名）の変更でも変わる
+        etag = response['ETag']
+        self.client.put(self.URL, {'username': 'etag-renamed'}, format='json')
+        self.assertEqual(self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_etag_differs_per_user(self):
+        etag = self.client.get(self.URL)['ETag']
+        self.client.force_authenticate(self.other)
+        response = self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['user']['username'], 'etag-other')
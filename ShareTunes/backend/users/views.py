@@ -1,7 +1,9 @@
 import os
+import logging
 import requests
 import json
 import base64
+import uuid
 from datetime import datetime, timedelta
 
 from django.conf import settings
@@ -17,8 +19,16 @@ from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework.parsers import MultiPartParser, FormParser
 
+from sharetunes.conditional import conditional_response, make_etag
+from .images import (
+    MULTIPART_OVERHEAD, InvalidImage, SizeLimitedUploadHandler, delete_images, generate_profile_thumbnails,
+    profile_image_paths, run_in_background, validate_image,
+)
 from .models import UserProfile
 from .serializers import UserProfileSerializer
+from .services import request_spotify_token_refresh, apply_spotify_token, spotify_token_url
+
+logger = logging.getLogger(__name__)
 
 @api_view(['GET'])
 @permission_classes([AllowAny])  # 認証なしで必ずアクセス可能であることを明示
@@ -40,8 +50,7 @@ def spotify_login(request):
     query_params = "&".join([f"{key}={val}" for key, val in params.items()])
     auth_url = f"{auth_url}?{query_params}"
     
-    # デバッグ情報を出力
-    print(f"認証URL生成: {auth_url}")
+    logger.debug("認証URL生成: %s", auth_url)
     
     return Response({"auth_url": auth_url})
 
@@ -52,12 +61,12 @@ def spotify_callback(request):
     code = request.GET.get('code')
     error = request.GET.get('error')
     
-    # デバッグ情報出力
-    print(f"Spotifyコールバック受信: code={code}, error={error}")
+    # 認証コードは伏せ字にして出力される
+    logger.debug("Spotifyコールバック受信: code=%s, error=%s", code, error)
     
     # エラーがある場合は処理中断
     if error:
-        print(f"Spotifyエラー: {error}")
+        logger.warning("Spotifyエラー: %s", error)
         # フロントエンドにエラーメッセージ付きでリダイレクト
         frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:3000')
         error_url = f"{frontend_url}/?error={error}"
@@ -65,7 +74,7 @@ def spotify_callback(request):
     
     # コードが存在しない場合もエラー
     if not code:
-        print("認証コードがありません")
+        logger.warning("認証コードがありません")
         # フロントエンドにエラーメッセージ付きでリダイレクト
         frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:3000')
         error_url = f"{frontend_url}/?error=認証コードが受信できませんでした"
@@ -75,7 +84,7 @@ def spotify_callback(request):
         # アクセストークンのリクエスト
         auth_token = base64.b64encode(f"{settings.SPOTIFY_CLIENT_ID}:{settings.SPOTIFY_CLIENT_SECRET}".encode()).decode()
         
-        token_url = "https://accounts.spotify.com/api/token"
+        token_url = spotify_token_url()
         headers = {
             "Authorization": f"Basic {auth_token}",
             "Content-Type": "application/x-www-form-urlencoded"
@@ -86,24 +95,22 @@ def spotify_callback(request):
             "redirect_uri": settings.SPOTIFY_REDIRECT_URI
         }
         
-        # デバッグ情報
-        print(f"Spotifyトークンリクエスト: redirect_uri={settings.SPOTIFY_REDIRECT_URI}")
+        logger.debug("Spotifyトークンリクエスト: redirect_uri=%s", settings.SPOTIFY_REDIRECT_URI)
         
         # トークンリクエスト
         res = requests.post(token_url, headers=headers, data=data)
         
         if res.status_code != 200:
-            print(f"トークン取得エラー: {res.status_code}, {res.text}")
+            logger.warning("トークン取得エラー: %s, %s", res.status_code, res.text)
             # フロントエンドにエラーメッセージ付きでリダイレクト
             frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:3000')
             error_url = f"{frontend_url}/?error=トークン取得に失敗しました: {res.status_code}"
             return redirect(error_url)
         
         token_data = res.json()
-        print("トークン取得成功")
         
         # ユーザー情報の取得
-        user_url = "https://api.spotify.com/v1/me"
+        user_url = f"{settings.SPOTIFY_API_URL}me"
         headers = {
             "Authorization": f"Bearer {token_data['access_token']}"
         }
@@ -111,21 +118,19 @@ def spotify_callback(request):
         user_res = requests.get(user_url, headers=headers)
         
         if user_res.status_code != 200:
-            print(f"ユーザー情報取得エラー: {user_res.status_code}, {user_res.text}")
+            logger.warning("ユーザー情報取得エラー: %s, %s", user_res.status_code, user_res.text)
             # フロントエンドにエラーメッセージ付きでリダイレクト
             frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:3000')
             error_url = f"{frontend_url}/?error=ユーザー情報の取得に失敗しました"
             return redirect(error_url)
         
         spotify_user = user_res.json()
-        print(f"Spotifyユーザー情報取得成功: {spotify_user.get('display_name')}")
         
         # プロフィール画像URLの取得
         profile_image_url = None
         if 'images' in spotify_user and spotify_user['images']:
             # 最も高解像度の画像を選択（通常は配列の最初のもの）
             profile_image_url = spotify_user['images'][0]['url']
-            print(f"プロフィール画像URL: {profile_image_url}")
         
         # ユーザー名として表示名を使用
         display_name = spotify_user.get('display_name', '')
@@ -143,7 +148,6 @@ def spotify_callback(request):
                 username = f"{base_username}{counter}"
                 counter += 1
         
-        print(f"ユーザー名として使用: {username}")
         
         # ユーザー作成または取得（Spotify IDで検索、存在しなければ新規作成）
         user = None
@@ -156,7 +160,7 @@ def spotify_callback(request):
             user.last_name = ' '.join(spotify_user.get('display_name', '').split(' ')[1:]) if spotify_user.get('display_name') and len(spotify_user.get('display_name', '').split(' ')) > 1 else ''
             user.email = spotify_user.get('email', user.email)
             user.save()
-            print(f"既存ユーザーを更新: {user.username}")
+            logger.info("既存ユーザーを更新: %s", user.username)
         except UserProfile.DoesNotExist:
             # 新規ユーザーの作成
             user = User.objects.create(
@@ -165,7 +169,7 @@ def spotify_callback(request):
                 first_name=spotify_user.get('display_name', '').split(' ')[0] if spotify_user.get('display_name') else '',
                 last_name=' '.join(spotify_user.get('display_name', '').split(' ')[1:]) if spotify_user.get('display_name') and len(spotify_user.get('display_name', '').split(' ')) > 1 else '',
             )
-            print(f"新規ユーザーを作成: {user.username}")
+            logger.info("新規ユーザーを作成: %s", user.username)
         
         # プロフィール更新または作成
         profile, created = UserProfile.objects.get_or_create(user=user)
@@ -185,7 +189,7 @@ def spotify_callback(request):
         access_token = str(refresh.access_token)
         refresh_token = str(refresh)
         
-        print(f"認証成功: ユーザー {spotify_user['id']}")
+        logger.info("認証成功: ユーザー %s", spotify_user['id'])
         
         # フロントエンドにリダイレクト（トークン付き）
         frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:3000')
@@ -194,47 +198,56 @@ def spotify_callback(request):
         return redirect(redirect_url)
         
     except Exception as e:
-        print(f"認証処理中の予期せぬエラー: {str(e)}")
+        logger.exception("認証処理中の予期せぬエラー: %s", e)
         # フロントエンドにエラーメッセージ付きでリダイレクト
         frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:3000')
         error_url = f"{frontend_url}/?error=認証処理中にエラーが発生しました"
         return redirect(error_url)
 
+def _user_profile_response(request):
+    """プロフィール情報のレスポンスを作成"""
+    try:
+        profile = UserProfile.objects.get(user=request.user)
+        serializer = UserProfileSerializer(profile, context={'request': request})
+        data = serializer.data
+        
+        # プロフィール画像の処理
+        if profile.profile_image:
+            request_base = f"{request.scheme}://{request.get_host()}"
+            data['profile_image'] = request_base + profile.profile_image.url
+            
+        if profile.external_profile_image_url:
+            data['profile_image'] = profile.external_profile_image_url
+        
+        return Response(data)
+    except UserProfile.DoesNotExist:
+        logger.warning('プロファイルが見つかりません: user_id=%s', request.user.pk)
+        return Response({"error": "Profile not found"}, status=status.HTTP_404_NOT_FOUND)
+    except Exception as e:
+        logger.exception('予期せぬエラー: %s', e)
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
 @api_view(['GET', 'PUT'])
 @permission_classes([IsAuthenticated])
 def user_profile(request):
     """ユーザープロフィール取得・更新（GET/PUT両対応）"""
-    print(f'===== ユーザープロファイル {request.method} リクエスト =====')
-    print(f'認証ヘッダー: {request.headers.get("Authorization", "なし")}')
-    print(f'ユーザー情報: {request.user}')
-    
     if request.method == 'GET':
         # GETリクエスト：プロフィール情報取得
-        try:
-            profile = UserProfile.objects.get(user=request.user)
-            serializer = UserProfileSerializer(profile)
-            data = serializer.data
-            
-            # プロフィール画像の処理
-            if profile.profile_image:
-                request_base = f"{request.scheme}://{request.get_host()}"
-                data['profile_image'] = request_base + profile.profile_image.url
-                
-            if profile.external_profile_image_url:
-                data['profile_image'] = profile.external_profile_image_url
-            
-            print('プロファイル取得成功')
-            return Response(data)
-        except UserProfile.DoesNotExist:
-            print('プロファイルが見つかりません')
-            return Response({"error": "Profile not found"}, status=status.HTTP_404_NOT_FOUND)
-        except Exception as e:
-            print(f'予期せぬエラー: {str(e)}')
-            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        # プロフィールの更新日時とユーザー情報が変わっていなければ、シリアライズせずに304を返す
+        user = request.user
+        profile_updated_at = (UserProfile.objects
+                              .filter(user=user)
+                              .values_list('updated_at', flat=True)
+                              .first())
+        etag = None
+        if profile_updated_at:
+            etag = make_etag(request, profile_updated_at, user.username, user.email,
+                             user.first_name, user.last_name)
+        return conditional_response(request, etag, lambda: _user_profile_response(request))
     
     elif request.method == 'PUT':
         # PUTリクエスト：プロフィール情報更新
-        print(f'リクエストデータ: {request.data}')
+        logger.debug('プロフィール更新リクエスト: %s', request.data)
         
         try:
             # ユーザープロフィールの取得
@@ -276,7 +289,7 @@ def user_profile(request):
             profile.save()
             
             # 更新後のプロフィール情報を取得
-            serializer = UserProfileSerializer(profile)
+            serializer = UserProfileSerializer(profile, context={'request': request})
             data = serializer.data
             
             # プロフィール画像のURL処理
@@ -287,14 +300,13 @@ def user_profile(request):
             if profile.external_profile_image_url:
                 data['profile_image'] = profile.external_profile_image_url
                 
-            print('プロフィール更新成功')
             return Response(data)
         
         except UserProfile.DoesNotExist:
-            print('プロフィールが見つかりません')
+            logger.warning('プロフィールが見つかりません: user_id=%s', request.user.pk)
             return Response({"error": "プロフィールが見つかりません"}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
-            print(f'予期せぬエラー: {str(e)}')
+            logger.exception('予期せぬエラー: %s', e)
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['GET'])
@@ -312,31 +324,13 @@ def refresh_spotify_token(request):
             return Response({"error": "No refresh token available"}, status=status.HTTP_400_BAD_REQUEST)
         
         # リフレッシュトークンでアクセストークン更新
-        auth_token = base64.b64encode(f"{settings.SPOTIFY_CLIENT_ID}:{settings.SPOTIFY_CLIENT_SECRET}".encode()).decode()
-        
-        headers = {
-            "Authorization": f"Basic {auth_token}",
-            "Content-Type": "application/x-www-form-urlencoded"
-        }
+        token_data = request_spotify_token_refresh(profile.spotify_refresh_token)
         
-        data = {
-            "grant_type": "refresh_token",
-            "refresh_token": profile.spotify_refresh_token
-        }
-        
-        res = requests.post("https://accounts.spotify.com/api/token", headers=headers, data=data)
-        
-        if res.status_code != 200:
+        if token_data is None:
             return Response({"error": "Failed to refresh token"}, status=status.HTTP_400_BAD_REQUEST)
         
-        token_data = res.json()
-        
         # トークン情報更新
-        profile.spotify_access_token = token_data['access_token']
-        if 'refresh_token' in token_data:
-            profile.spotify_refresh_token = token_data['refresh_token']
-        
-        profile.spotify_token_expires_at = timezone.now() + timedelta(seconds=token_data['expires_in'])
+        apply_spotify_token(profile, token_data)
         profile.save()
         
         return Response({
@@ -352,8 +346,6 @@ def refresh_spotify_token(request):
 @permission_classes([IsAuthenticated])
 def profile_settings(request):
     """プロフィール設定の取得・更新（GET/PUT両対応）"""
-    print(f'===== プロフィール設定 {request.method} リクエスト =====')
-    
     try:
         profile = UserProfile.objects.get(user=request.user)
         
@@ -362,12 +354,11 @@ def profile_settings(request):
             settings_data = {
                 'preferences': profile.preferences or {}
             }
-            print('設定取得成功')
             return Response(settings_data)
             
         elif request.method == 'PUT':
             # 設定情報の更新
-            print(f'リクエストデータ: {request.data}')
+            logger.debug('設定更新リクエスト: %s', request.data)
             
             if 'preferences' in request.data:
                 # 既存設定がない場合は初期化
@@ -383,66 +374,87 @@ def profile_settings(request):
                     return Response({"error": "プリファレンスが正しい形式ではありません"}, 
                                    status=status.HTTP_400_BAD_REQUEST)
             
-            print('設定更新成功')
             return Response({
                 'preferences': profile.preferences
             })
             
     except UserProfile.DoesNotExist:
-        print('プロフィールが見つかりません')
+        logger.warning('プロフィールが見つかりません: user_id=%s', request.user.pk)
         return Response({"error": "プロフィールが見つかりません"}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
-        print(f'予期せぬエラー: {str(e)}')
+        logger.exception('予期せぬエラー: %s', e)
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 @parser_classes([MultiPartParser, FormParser])
 def upload_profile_picture(request):
-    """プロフィール画像のアップロード処理"""
-    print(f'===== プロフィール画像アップロード リクエスト =====')
-    print(f'認証ヘッダー: {request.headers.get("Authorization", "なし")}')
-    
+    """
+    プロフィール画像のアップロード処理
+
+    アップロードは一時ファイルに書き出しながらサイズの上限を確認する。
+    縮小画像の生成と古い画像の削除は、レスポンスを返した後にバックグラウンドで行う。
+    """
+    max_bytes = settings.PROFILE_IMAGE_MAX_BYTES
+    too_large = Response({"error": f"画像ファイルが大きすぎます（上限 {max_bytes // (1024 * 1024)}MB）"},
+                         status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    # 本文を読む前に、Content-Length で明らかに上限を超えるものを断る
+    if content_length > max_bytes + MULTIPART_OVERHEAD:
+        return too_large
+    upload_handler = SizeLimitedUploadHandler(request._request, max_bytes)
+    request._request.upload_handlers = [upload_handler]
+
     try:
         # ユーザープロフィールを取得
         profile = UserProfile.objects.get(user=request.user)
         
         # リクエストからプロフィール画像を取得
-        if 'image' in request.FILES:
-            # 古い画像が存在する場合は削除
-            if profile.profile_image:
-                # ファイルパスを取得
-                old_image_path = profile.profile_image.path
-                # ファイルが存在する場合は削除
-                if os.path.isfile(old_image_path):
-                    os.remove(old_image_path)
-            
-            # 新しい画像を設定
-            profile.profile_image = request.FILES['image']
-            # 外部URL画像を無効化
-            profile.external_profile_image_url = None
-            profile.save()
-            
-            # 更新されたプロフィール情報を取得
-            serializer = UserProfileSerializer(profile)
-            data = serializer.data
-            
-            # 画像URLを適切に設定
-            # フロントエンドとの互換性のため、相対パスを返す
-            if profile.profile_image:
-                # 相対パスを使用
-                data['profile_image'] = profile.profile_image.url
-                print(f"画像相対パス: {profile.profile_image.url}")
-            
-            print('プロフィール画像アップロード成功')
-            return Response(data)
-            
-        else:
+        upload = request.FILES.get('image')
+        if upload_handler.exceeded:
+            return too_large
+        if upload is None:
             return Response({"error": "画像ファイルが提供されていません"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            extension = validate_image(upload)
+        except InvalidImage as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # 古い画像（元画像と縮小画像）は保存後にバックグラウンドで削除する
+        old_images = profile_image_paths(profile)
+
+        # 新しい画像を設定（ファイル名は推測されないようランダムにする）
+        upload.name = f'{uuid.uuid4().hex}.{extension}'
+        profile.profile_image = upload
+        profile.profile_image_thumbnails = {}
+        # 外部URL画像を無効化
+        profile.external_profile_image_url = None
+        profile.save()
+
+        run_in_background(generate_profile_thumbnails, profile.pk, profile.profile_image.name)
+        if old_images:
+            run_in_background(delete_images, old_images)
+
+        # 更新されたプロフィール情報を取得（縮小画像の生成前は、各サイズのURLも元画像を指す）
+        serializer = UserProfileSerializer(profile)
+        data = serializer.data
+        
+        # 画像URLを適切に設定
+        # フロントエンドとの互換性のため、相対パスを返す
+        if profile.profile_image:
+            # 相対パスを使用
+            data['profile_image'] = profile.profile_image.url
+        
+        logger.info('プロフィール画像アップロード成功: user_id=%s size=%s', request.user.pk, upload.size)
+        return Response(data)
             
     except UserProfile.DoesNotExist:
-        print('プロフィールが見つかりません')
+        logger.warning('プロフィールが見つかりません: user_id=%s', request.user.pk)
         return Response({"error": "プロフィールが見つかりません"}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
-        print(f'予期せぬエラー: {str(e)}')
+        logger.exception('予期せぬエラー: %s', e)
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
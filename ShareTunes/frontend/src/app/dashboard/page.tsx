@@ -11,6 +11,9 @@ export default function Dashboard() {
   const [isLoading, setIsLoading] = useState(true);
   const [userProfile, setUserProfile] = useState<any>(null);
   const [recommendations, setRecommendations] = useState<any[]>([]);
+  // 推薦一覧の次のページのURL（最後のページまで読み込んだらnull）
+  const [nextPageUrl, setNextPageUrl] = useState<string | null>(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [context, setContext] = useState('');
   const [isGenerating, setIsGenerating] = useState(false);
   const [authError, setAuthError] = useState<string | null>(null);
@@ -37,8 +40,9 @@ export default function Dashboard() {
           // 過去の推薦を取得
           try {
             console.log('推薦リストを取得しています...');
-            const recommendations = await recommendationService.getRecommendations();
-            setRecommendations(Array.isArray(recommendations) ? recommendations : []);
+            const page = await recommendationService.getRecommendations();
+            setRecommendations(page.results);
+            setNextPageUrl(page.next);
           } catch (error) {
             console.error('推薦リスト取得エラー:', error);
             // 推薦リストの取得に失敗してもログアウトはしない
@@ -81,6 +85,21 @@ export default function Dashboard() {
     checkAuth();
   }, [router]);
   
+  // 推薦一覧の次のページを読み込んで末尾に追加
+  const loadMoreRecommendations = async () => {
+    if (!nextPageUrl) return;
+    setIsLoadingMore(true);
+    try {
+      const page = await recommendationService.getRecommendations(nextPageUrl);
+      setRecommendations((prev) => [...prev, ...page.results]);
+      setNextPageUrl(page.next);
+    } catch (error) {
+      console.error('推薦リスト追加読み込みエラー:', error);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
   // 新しい推薦を生成
   const generateRecommendation = async () => {
     setIsGenerating(true);
@@ -170,7 +189,22 @@ export default function Dashboard() {
         <div>
           <h2 className="text-2xl font-bold mb-4">推薦リスト</h2>
           {recommendations.length > 0 ? (
-            <RecommendationList recommendations={recommendations} />
+            <>
+              <RecommendationList recommendations={recommendations} />
+              {nextPageUrl && (
+                <div className="mt-6 text-center">
+                  <button
+                    onClick={loadMoreRecommendations}
+                    disabled={isLoadingMore}
+                    className={`border border-spotify-green text-spotify-green font-bold py-2 px-6 rounded-full ${
+                      isLoadingMore ? 'opacity-70 cursor-not-allowed' : 'hover:bg-green-50'
+                    }`}
+                  >
+                    {isLoadingMore ? '読み込み中...' : 'もっと見る'}
+                  </button>
+                </div>
+              )}
+            </>
           ) : (
             <div className="bg-white rounded-lg shadow p-6 text-center text-gray-500">
               まだ推薦がありません。上のフォームから生成してみましょう！
@@ -62,7 +62,10 @@ export default function ProfilePage() {
           
           // プロフィール画像のURLを適切に処理
           let profileImageUrl = '/default-avatar.png';
-          if (userProfileData.profile_image) {
+          if (userProfileData.profile_image_urls?.medium?.webp) {
+            // アップロードした画像は表示サイズ（w-32）に合わせた縮小画像を使う
+            profileImageUrl = userProfileData.profile_image_urls.medium.webp;
+          } else if (userProfileData.profile_image) {
             // 完全なURLかどうかをチェック
             if (userProfileData.profile_image.startsWith('http')) {
               profileImageUrl = userProfileData.profile_image;
@@ -33,7 +33,7 @@ export default function Header({ userProfile }: HeaderProps) {
             {userProfile?.profile_image ? (
               <div className="w-8 h-8 rounded-full overflow-hidden">
                 <img 
-                  src={userProfile.profile_image} 
+                  src={userProfile.profile_image_urls?.small?.webp || userProfile.profile_image} 
                   alt={`${userProfile.user?.first_name || userProfile.user?.username}'s profile`}
                   className="object-cover w-full h-full"
                 />
@@ -146,12 +146,17 @@ export const authService = {
 
 // 推薦関連
 export const recommendationService = {
-  getRecommendations: async () => {
+  // 一覧はカーソル方式でページ分割されている（{ next, previous, results }）。
+  // 続きのページは、前のレスポンスの next のURLを nextUrl に渡して取得する
+  getRecommendations: async (nextUrl?: string | null): Promise<{ results: any[]; next: string | null }> => {
     try {
       console.log('推薦一覧を取得中...');
-      const response = await apiClient.get('/recommendations/');
+      const response = await apiClient.get(nextUrl || '/recommendations/');
       console.log('推薦一覧取得成功:', response.data);
-      return response.data;
+      if (Array.isArray(response.data)) {
+        return { results: response.data, next: null };
+      }
+      return { results: response.data.results || [], next: response.data.next || null };
     } catch (error) {
       console.error('推薦一覧取得エラー:', error);
       if (axios.isAxiosError(error)) {